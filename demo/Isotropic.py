@@ -15,9 +15,10 @@ from __future__ import print_function
 import warnings
 import numpy as np
 from numpy import pi, zeros, sum
-from shenfun import Function
 from shenfun.fourier import energy_fourier
 from spectralDNS import config, get_solver, solve
+from spectralDNS.maths import project, wavenumber_squared
+from spectralDNS.diagnostics import Diagnostics, spectral_bins, parseval_weights
 
 try:
     import matplotlib.pyplot as plt
@@ -30,17 +31,17 @@ def initialize(solver, context):
     c = context
     # Create mask with ones where |k| < Kf2 and zeros elsewhere
     kf = config.params.Kf2
-    c.k2_mask = np.where(c.K2 <= kf**2, 1, 0)
+    K2 = wavenumber_squared(c.K)
+    c.k2_mask = np.where(K2 <= kf**2, 1, 0)
     np.random.seed(solver.rank)
-    k = np.sqrt(c.K2)
+    k = np.sqrt(K2)
     k = np.where(k == 0, 1, k)
-    kk = c.K2.copy()
-    kk = np.where(kk == 0, 1, kk)
+    kk = np.where(K2 == 0, 1, K2)
     k1, k2, k3 = c.K[0], c.K[1], c.K[2]
     ksq = np.sqrt(k1**2+k2**2)
     ksq = np.where(ksq == 0, 1, ksq)
 
-    E0 = np.sqrt(9./11./kf*c.K2/kf**2)*c.k2_mask
+    E0 = np.sqrt(9./11./kf*K2/kf**2)*c.k2_mask
     E1 = np.sqrt(9./11./kf*(k/kf)**(-5./3.))*(1-c.k2_mask)
     Ek = E0 + E1
     # theta1, theta2, phi, alpha and beta from [1]
@@ -56,9 +57,8 @@ def initialize(solver, context):
     solver.get_velocity(**c)
     U_hat = solver.set_velocity(**c)
 
-    K = c.K
     # project to zero divergence
-    U_hat[:] -= (K[0]*U_hat[0]+K[1]*U_hat[1]+K[2]*U_hat[2])*c.K_over_K2
+    U_hat = project(U_hat, c.K)
 
     if solver.rank == 0:
         c.U_hat[:, 0, 0, 0] = 0.0
@@ -87,32 +87,11 @@ def L2_norm(comm, u):
 
 def spectrum(solver, context):
     c = context
-    uiui = np.zeros(c.U_hat[0].shape)
-    uiui[..., 1:-1] = 2*np.sum((c.U_hat[..., 1:-1]*np.conj(c.U_hat[..., 1:-1])).real, axis=0)
-    uiui[..., 0] = np.sum((c.U_hat[..., 0]*np.conj(c.U_hat[..., 0])).real, axis=0)
-    uiui[..., -1] = np.sum((c.U_hat[..., -1]*np.conj(c.U_hat[..., -1])).real, axis=0)
-    uiui *= (4./3.*np.pi)
-
-    # Create bins for Ek
-    Nb = int(np.sqrt(sum((config.params.N/2)**2)/3))
-    bins = np.array(range(0, Nb))+0.5
-    z = np.digitize(np.sqrt(context.K2), bins, right=True)
-
-    # Sample
-    Ek = np.zeros(Nb)
-    ll = np.zeros(Nb)
-    for i, k in enumerate(bins[1:]):
-        k0 = bins[i] # lower limit, k is upper
-        ii = np.where((z > k0) & (z <= k))
-        ll[i] = len(ii[0])
-        Ek[i] = (k**3 - k0**3)*np.sum(uiui[ii])
-
-    Ek = solver.comm.allreduce(Ek)
-    ll = solver.comm.allreduce(ll)
-    for i in range(Nb):
-        if not ll[i] == 0:
-            Ek[i] = Ek[i] / ll[i]
+    # Shell index of all wavenumbers is computed only on first call
+    sb = spectral_bins(c)
+    Ek = sb.spectrum(c.U_hat)
 
+    uiui = np.sum(c.U_hat.real**2 + c.U_hat.imag**2, axis=0)*parseval_weights(c.T)
     E0 = uiui.mean(axis=(1, 2))
     E1 = uiui.mean(axis=(0, 2))
     E2 = uiui.mean(axis=(0, 1))
@@ -144,7 +123,7 @@ def spectrum(solver, context):
     #    Rxx[1, i] = (c.U[0] * np.roll(c.U[0], -i, axis=1)).mean()
     #    Rxx[2, i] = (c.U[0] * np.roll(c.U[0], -i, axis=2)).mean()
 
-    return Ek, bins, E0, E1, E2
+    return Ek, sb.k, E0, E1, E2
 
 k = []
 w = []
@@ -156,13 +135,11 @@ def update(context):
     c = context
     params = config.params
     solver = config.solver
-    curl_hat = Function(c.VT, buffer=c.work[(c.U_hat, 2, True)])
-
     if solver.rank == 0:
         c.U_hat[:, 0, 0, 0] = 0
 
     if params.solver == 'VV':
-        c.U_hat = solver.cross2(c.U_hat, c.K_over_K2, c.W_hat)
+        c.U_hat = solver.inverse_curl(c.U_hat, c.K, c.W_hat)
 
     energy_new = energy_fourier(c.U_hat, c.T)
     energy_lower = energy_fourier(c.U_hat*c.k2_mask, c.T)
@@ -174,14 +151,11 @@ def update(context):
     #du = c.U_hat*c.k2_mask*(alpha)
     #dus = energy_fourier(du*c.U_hat, c.T)
 
-    energy_old = energy_new
-
     #c.dU[:] = alpha*c.k2_mask*c.U_hat
     c.U_hat *= (alpha*c.k2_mask + (1-c.k2_mask))
 
-    energy_new = energy_fourier(c.U_hat, c.T)
-
-    assert np.sqrt((energy_new-c.target_energy)**2) < 1e-7, np.sqrt((energy_new-c.target_energy)**2)
+    # Energy after rescaling the lowest wavenumbers is target by construction
+    energy_new = alpha2*energy_lower + energy_upper
 
     if params.solver == 'VV':
         c.W_hat = solver.cross2(c.W_hat, c.K, c.U_hat)
@@ -218,45 +192,16 @@ def update(context):
         f.close()
 
     if params.tstep % params.compute_energy == 0:
-        dx, L = params.dx, params.L
-        #ww = solver.comm.reduce(sum(curl*curl)/np.prod(params.N)/2)
-
-        duidxj = np.zeros(((3, 3)+c.U[0].shape), dtype=c.float)
-        for i in range(3):
-            for j in range(3):
-                duidxj[i, j] = c.T.backward(1j*K[j]*c.U_hat[i], duidxj[i, j])
-
-        ww2 = L2_norm(solver.comm, duidxj)*params.nu
-        #ww2 = solver.comm.reduce(sum(duidxj*duidxj))
-
-        ddU = np.zeros(((3,)+c.U[0].shape), dtype=c.float)
-        dU = solver.ComputeRHS(c.dU, c.U_hat, solver, **c)
-        for i in range(3):
-            ddU[i] = c.T.backward(dU[i], ddU[i])
-
-        ww3 = solver.comm.allreduce(sum(ddU*c.U))/np.prod(params.N)
-
-        ##if solver.rank == 0:
-            ##print('W ', params.nu*ww, params.nu*ww2, ww3, ww-ww2)
-        curl_hat = solver.cross2(curl_hat, K, c.U_hat)
-        dissipation = energy_fourier(curl_hat, c.T)
-        div_u = solver.get_divergence(**c)
-        #du = 1j*(c.K[0]*c.U_hat[0]+c.K[1]*c.U_hat[1]+c.K[2]*c.U_hat[2])
-        div_u = L2_norm(solver.comm, div_u)
-        #div_u2 = energy_fourier(solver.comm, 1j*(K[0]*c.U_hat[0]+K[1]*c.U_hat[1]+K[2]*c.U_hat[2]))
-
-        kk = 0.5*energy_new
-        eps = dissipation*params.nu
-        Re_lam = np.sqrt(20*kk**2/(3*params.nu*eps))
-        Re_lam2 = kk*np.sqrt(20./3.)/(params.nu*params.kd)**2
-
+        # All diagnostics from spectral space and a single reduction
+        d = c.diagnostics(c)
+        Re_lam2 = 0.5*energy_new*np.sqrt(20./3.)/(params.nu*params.kd)**2
         kold[0] = energy_new
-        e0, e1 = energy_new, L2_norm(solver.comm, c.U)
-        ww4 = (energy_new-energy_old)/2/params.dt
         if solver.rank == 0:
             k.append(energy_new)
-            w.append(dissipation)
-            print('%2.4f %2.6e %2.6e %2.6e %2.6e %2.6e %2.6e %2.6e %2.6e'%(params.t, e0, e1, eps, ww2, ww3, ww4, Re_lam, Re_lam2))
+            w.append(d['dissipation'])
+            print('%2.4f %2.6e %2.6e %2.6e %2.6e %2.6e %2.6e'%(
+                params.t, 2*d['energy'], d['dissipation'], d['divergence'],
+                d['skewness'], d['Re_lambda'], Re_lam2))
 
     #if params.tstep % params.compute_energy == 1:
         #if 'NS' in params.solver:
@@ -307,6 +252,9 @@ if __name__ == "__main__":
 
     context = sol.get_context()
     initialize(sol, context)
+    context.diagnostics = Diagnostics(context, dict.fromkeys(
+        ('energy', 'dissipation', 'divergence', 'skewness', 'Re_lambda'),
+        config.params.compute_energy))
     #init_from_file("NS_isotropic_60_60_60_c.h5", sol, context)
     context.hdf5file.filename = "NS_isotropic_{}_{}_{}".format(*config.params.N)
 
@@ -1,8 +1,9 @@
 import matplotlib.pyplot as plt
 from numpy import zeros, pi, sum, exp, sin, float64, prod
 from spectralDNS import config, get_solver, solve
+from spectralDNS.maths import project
 
-def initialize(X, U, U_hat, mask, T, K, K_over_K2, **context):
+def initialize(X, U, U_hat, mask, T, K, **context):
     params = config.params
     Um = 0.5*(params.U1 - params.U2)
     N = params.N
@@ -15,7 +16,7 @@ def initialize(X, U, U_hat, mask, T, K, K_over_K2, **context):
     for i in range(2):
         U_hat[i] = U[i].forward(U_hat[i])
 
-    U_hat[:] -= (K[0]*U_hat[0]+K[1]*U_hat[1])*K_over_K2
+    U_hat = project(U_hat, K)
     if solver.rank == 0:
         U_hat[:, 0, 0] = 0.0
 
@@ -7,6 +7,7 @@ import matplotlib.cbook
 #from spectralDNS.utilities import reset_profile
 from spectralDNS import config, get_solver, solve
 from spectralDNS.utilities import dx
+from spectralDNS.channelstats import ChannelStats
 
 warnings.filterwarnings("ignore", category=matplotlib.cbook.mplDeprecation)
 
@@ -108,8 +109,7 @@ def update(context):
             c.U_hat[1, 0, 0, 0] += q/(np.array(params.L).prod()*4./3.)
 
     if (params.tstep % params.compute_energy == 0 or
-            params.tstep % params.plot_result == 0 and params.plot_result > 0 or
-            params.tstep % params.sample_stats == 0):
+            params.tstep % params.plot_result == 0 and params.plot_result > 0):
         U = solver.get_velocity(**c)
 
     if params.tstep % params.print_energy0 == 0 and solver.rank == 0:
@@ -164,7 +164,7 @@ def update(context):
             print("Time %2.5f Energy %2.8e %2.8e %2.8e Flux %2.6e Q %2.6e %2.6e %2.6e" %(config.params.t, e0, e1, e2, q, e0+e1+e2, e3, flux[0]/beta[0]-1))
 
     if params.tstep % params.sample_stats == 0:
-        solver.stats(U)
+        solver.stats(c)
 
     #if params.tstep == 2:
         #solver.fastest_timestep = 1e8
@@ -174,87 +174,6 @@ def update(context):
         #print "Reset profile"
         #reset_profile(profile)
 
-class Stats(object):
-
-    def __init__(self, U, comm, fromstats="", filename=""):
-        self.shape = U.shape[1:]
-        self.Umean = np.zeros(U.shape[:2])
-        self.Pmean = np.zeros(U.shape[1])
-        self.UU = np.zeros((6, U.shape[1]))
-        self.num_samples = 0
-        self.rank = comm.Get_rank()
-        self.fname = filename
-        self.comm = comm
-        self.f0 = None
-        if fromstats:
-            self.fromfile(filename=fromstats)
-
-    def create_statsfile(self):
-        self.f0 = h5py.File(self.fname+".h5", "w", driver="mpio", comm=self.comm)
-        self.f0.create_group("Average")
-        self.f0.create_group("Reynolds Stress")
-        for i in ("U", "V", "W", "P"):
-            self.f0["Average"].create_dataset(i, shape=(2**config.params.M[0],), dtype=float)
-
-        for i in ("UU", "VV", "WW", "UV", "UW", "VW"):
-            self.f0["Reynolds Stress"].create_dataset(i, shape=(2**config.params.M[0], ), dtype=float)
-
-    def __call__(self, U, P=None):
-        self.num_samples += 1
-        self.Umean += np.sum(U, axis=(2, 3))
-        if not P is None:
-            self.Pmean += np.sum(P, axis=(1, 2))
-        self.UU[0] += np.sum(U[0]*U[0], axis=(1, 2))
-        self.UU[1] += np.sum(U[1]*U[1], axis=(1, 2))
-        self.UU[2] += np.sum(U[2]*U[2], axis=(1, 2))
-        self.UU[3] += np.sum(U[0]*U[1], axis=(1, 2))
-        self.UU[4] += np.sum(U[0]*U[2], axis=(1, 2))
-        self.UU[5] += np.sum(U[1]*U[2], axis=(1, 2))
-        self.get_stats()
-
-    def get_stats(self, tofile=True):
-        N = self.shape[0]
-        s = slice(self.rank*N, (self.rank+1)*N, 1)
-        Nd = self.num_samples*self.shape[1]*self.shape[2]
-        self.comm.barrier()
-        if tofile:
-            if self.f0 is None:
-                self.create_statsfile()
-            else:
-                self.f0 = h5py.File(self.fname+".h5", "a", driver="mpio", comm=self.comm)
-
-            for i, name in enumerate(("U", "V", "W")):
-                self.f0["Average/"+name][s] = self.Umean[i]/Nd
-            self.f0["Average/P"][s] = self.Pmean/Nd
-            for i, name in enumerate(("UU", "VV", "WW", "UV", "UW", "VW")):
-                self.f0["Reynolds Stress/"+name][s] = self.UU[i]/Nd
-            self.f0.attrs.create("num_samples", self.num_samples)
-            self.f0.close()
-
-        if self.comm.Get_size() == 1:
-            return self.Umean/Nd, self.Pmean/Nd, self.UU/Nd
-        return 0
-
-    def reset_stats(self):
-        self.num_samples = 0
-        self.Umean[:] = 0
-        self.Pmean[:] = 0
-        self.UU[:] = 0
-
-    def fromfile(self, filename="stats"):
-        self.fname = filename
-        self.f0 = h5py.File(filename+".h5", "a", driver="mpio", comm=self.comm)
-        N = self.shape[0]
-        self.num_samples = self.f0.attrs["num_samples"]
-        Nd = self.num_samples*self.shape[1]*self.shape[2]
-        s = slice(self.rank*N, (self.rank+1)*N, 1)
-        for i, name in enumerate(("U", "V", "W")):
-            self.Umean[i, :] = self.f0["Average/"+name][s]*Nd
-        self.Pmean[:] = self.f0["Average/P"][s]*Nd
-        for i, name in enumerate(("UU", "VV", "WW", "UV", "UW", "VW")):
-            self.UU[i, :] = self.f0["Reynolds Stress/"+name][s]*Nd
-        self.f0.close()
-
 def init_from_file(filename, solver, context):
     f = h5py.File(filename, 'r+', driver="mpio", comm=solver.comm)
     assert "0" in f["U/3D"]
@@ -300,6 +219,7 @@ if __name__ == "__main__":
     initialize(solver, context)
     #init_from_file("KMM776d_c.h5", solver, context)
     set_Source(**context)
-    solver.stats = Stats(context.U, solver.comm, filename='KMMstats')
+    solver.stats = ChannelStats(context, filename='KMMstats', flush=10)
     context.hdf5file.filename = "KMM665x"
     solve(solver, context)
+    solver.stats.flush()
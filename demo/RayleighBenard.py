@@ -7,6 +7,7 @@ import matplotlib.pyplot as plt
 import matplotlib.cbook
 from spectralDNS import config, get_solver, solve
 from spectralDNS.utilities import dx
+from spectralDNS.channelstats import ChannelStats
 
 warnings.filterwarnings("ignore", category=matplotlib.cbook.mplDeprecation)
 
@@ -37,7 +38,7 @@ def update(context):
     solver = config.solver
     X, U, phi = c.X, c.U, c.phi
 
-    if (params.tstep % params.compute_energy == 0 or params.tstep % params.sample_stats or
+    if (params.tstep % params.compute_energy == 0 or
             params.tstep % params.plot_result == 0 and params.plot_result > 0):
         U = solver.get_velocity(**c)
         phi = c.phi_hat.backward(c.phi)
@@ -84,97 +85,7 @@ def update(context):
             print("Time %2.5f Energy %2.6e %2.6e %2.6e %2.6e div %2.6e" %(config.params.t, e0, e1, e2, e3, e4))
 
     if params.tstep % params.sample_stats == 0:
-        solver.stats(U, phi)
-
-class Stats(object):
-
-    def __init__(self, U, comm, fromstats="", filename=""):
-        self.shape = U.shape[1:]
-        self.Umean = np.zeros(U.shape[:2])
-        self.Pmean = np.zeros(U.shape[1])
-        self.phim = np.zeros(U.shape[1])
-        self.pp = np.zeros(U.shape[1])
-        self.UU = np.zeros((6, U.shape[1]))
-        self.num_samples = 0
-        self.rank = comm.Get_rank()
-        self.fname = filename
-        self.comm = comm
-        self.f0 = None
-        if fromstats:
-            self.fromfile(filename=fromstats)
-
-    def create_statsfile(self):
-        import h5py
-        self.f0 = h5py.File(self.fname+".h5", "w", driver="mpio", comm=comm)
-        self.f0.create_group("Average")
-        self.f0.create_group("Reynolds Stress")
-        for i in ("U", "V", "W", "phi"):
-            self.f0["Average"].create_dataset(i, shape=(2**config.params.M[0],), dtype=float)
-
-        for i in ("UU", "VV", "WW", "UV", "UW", "VW", "pp"):
-            self.f0["Reynolds Stress"].create_dataset(i, shape=(2**config.params.M[0], ), dtype=float)
-
-    def __call__(self, U, phi):
-        self.num_samples += 1
-        self.Umean += np.sum(U, axis=(2, 3))
-        self.phim += np.sum(phi, axis=(1, 2))
-        self.UU[0] += np.sum(U[0]*U[0], axis=(1, 2))
-        self.UU[1] += np.sum(U[1]*U[1], axis=(1, 2))
-        self.UU[2] += np.sum(U[2]*U[2], axis=(1, 2))
-        self.UU[3] += np.sum(U[0]*U[1], axis=(1, 2))
-        self.UU[4] += np.sum(U[0]*U[2], axis=(1, 2))
-        self.UU[5] += np.sum(U[1]*U[2], axis=(1, 2))
-        self.pp += np.sum(phi*phi, axis=(1, 2))
-        self.get_stats()
-
-    def get_stats(self, tofile=True):
-        import h5py
-        N = self.shape[0]
-        s = slice(self.rank*N, (self.rank+1)*N, 1)
-        Nd = self.num_samples*self.shape[1]*self.shape[2]
-        self.comm.barrier()
-        if tofile:
-            if self.f0 is None:
-                self.create_statsfile()
-            else:
-                self.f0 = h5py.File(self.fname+".h5", "a", driver="mpio", comm=comm)
-
-            for i, name in enumerate(("U", "V", "W")):
-                self.f0["Average/"+name][s] = self.Umean[i]/Nd
-            self.f0["Average/phi"][s] = self.phim/Nd
-            for i, name in enumerate(("UU", "VV", "WW", "UV", "UW", "VW")):
-                self.f0["Reynolds Stress/"+name][s] = self.UU[i]/Nd
-            self.f0["Reynolds Stress/pp"][s] = self.pp/Nd
-            self.f0.attrs.create("num_samples", self.num_samples)
-            self.f0.close()
-
-        if self.comm.Get_size() == 1:
-            return self.Umean/Nd, self.phim/Nd, self.UU/Nd, self.pp/Nd
-        return 0
-
-    def reset_stats(self):
-        self.num_samples = 0
-        self.Umean[:] = 0
-        self.phim[:] = 0
-        self.UU[:] = 0
-        self.pp[:] = 0
-
-    def fromfile(self, filename="stats"):
-        import h5py
-        self.fname = filename
-        self.f0 = h5py.File(filename+".h5", "a", driver="mpio", comm=comm)
-        N = self.shape[0]
-        self.num_samples = self.f0.attrs["num_samples"]
-        Nd = self.num_samples*self.shape[1]*self.shape[2]
-        #s = self.T.local_slice(False)[self.axis+1]
-        s = slice(self.rank*N, (self.rank+1)*N, 1)
-        for i, name in enumerate(("U", "V", "W")):
-            self.Umean[i, :] = self.f0["Average/"+name][s]*Nd
-        self.phim[:] = self.f0["Average/phi"][s]*Nd
-        for i, name in enumerate(("UU", "VV", "WW", "UV", "UW", "VW")):
-            self.UU[i, :] = self.f0["Reynolds Stress/"+name][s]*Nd
-        self.pp[:] = self.f0["Reynolds Stress/pp"][s]*Nd
-        self.f0.close()
+        solver.stats(c)
 
 def init_from_file(filename, solver, context):
     import h5py
@@ -242,8 +153,10 @@ if __name__ == "__main__":
                                         'phi': [(context.phi, [slice(None), slice(None), 0]),
                                                 (context.phi, [slice(None), 0, slice(None)])]
                                        }
-    solver.stats = Stats(context.U, solver.comm, filename="KMM_RB_stats")
+    solver.stats = ChannelStats(context, filename="KMM_RB_stats", flush=10,
+                                scalars=('phi_hat',))
     solve(solver, context)
+    solver.stats.flush()
     if solver.rank == 0:
         from mpi4py_fft import generate_xdmf
         generate_xdmf('KMM_RB_677a_w.h5')
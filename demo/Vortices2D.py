@@ -5,15 +5,18 @@ from numpy import zeros, exp, pi, loadtxt, allclose, where
 import matplotlib.pyplot as plt
 from shenfun import Array
 from spectralDNS import config, get_solver, solve
+from spectralDNS.maths import wavenumber_squared
 
-def initialize(U, X, U_hat, K_over_K2, T, **context):
+def initialize(U, X, U_hat, K, T, **context):
     w = exp(-((X[0]-pi)**2+(X[1]-pi+pi/4)**2)/(0.2)) \
        + exp(-((X[0]-pi)**2+(X[1]-pi-pi/4)**2)/(0.2)) \
        - 0.5*exp(-((X[0]-pi-pi/4)**2+(X[1]-pi-pi/4)**2)/(0.4))
     w_hat = U_hat[0].copy()
     w_hat = T.forward(w, w_hat)
-    U[0] = T.backward(1j*K_over_K2[1]*w_hat, U[0])
-    U[1] = T.backward(-1j*K_over_K2[0]*w_hat, U[1])
+    K2 = wavenumber_squared(K)
+    w_hat /= where(K2 == 0, 1, K2)
+    U[0] = T.backward(1j*K[1]*w_hat, U[0])
+    U[1] = T.backward(-1j*K[0]*w_hat, U[1])
     U_hat = U.forward(U_hat)
 
 def regression_test(context):
@@ -60,7 +63,7 @@ if __name__ == '__main__':
         solver.get_velocity(**context)
         solver.get_pressure(**context)
         solver.get_curl(**context)
-        K2 = context['K2']
+        K2 = wavenumber_squared(context['K'])
         context['stream'] = context['T'].backward(-context['W_hat']/where(K2 == 0, 1, K2), context['stream'])
 
     context.hdf5file.update_components = update_components
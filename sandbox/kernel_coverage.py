@@ -0,0 +1,23 @@
+"""
+Report which optimized kernels exist for a solver
+
+Lists, for every function decorated with optimizer that the solver uses,
+whether numexpr, numba, cython and pythran provide an optimized version for
+the given solver, dimensions and precision, followed by the functions that
+run unoptimized with the chosen optimization. Takes the regular solver
+arguments, e.g.,
+
+    python kernel_coverage.py --optimization numba --precision single MHD
+    python kernel_coverage.py --optimization cython Bq2D
+"""
+import sys
+from spectralDNS import get_solver
+from spectralDNS.optimization import coverage_report
+
+meshes = {'NS2D': 'doublyperiodic', 'Bq2D': 'doublyperiodic'}
+for name in ('KMM', 'KMMr', 'KMMRK3', 'KMM_RB', 'KMMRK3_RB', 'Coupled', 'CoupledRK3'):
+    meshes[name] = 'channel'
+
+solver = get_solver(mesh=meshes.get(sys.argv[-1], 'triplyperiodic'),
+                    parse_args=sys.argv[1:])
+print(coverage_report(solver))
@@ -0,0 +1,71 @@
+"""
+Measure the batched wall normal solves of the KMM channel solver
+
+For increasing N[0] = 2**n, times the Biharmonic and Helmholtz solves of
+solve_linear with the serial solvers of shenfun and with the batched
+solvers of spectralDNS.shen.la, for each number of threads. The solves are
+linear in N[0], so the scaling column t_k/t_{k-1}/2 should be close to 1.
+Usage, e.g.,
+
+    python speed_channel_solve.py --N0 6 7 8 9 --M 6 6 --threads 1 2 4 --optimization numba
+"""
+import argparse
+from time import time
+import numpy as np
+from mpi4py import MPI
+from shenfun.chebyshev import la
+from spectralDNS import get_solver
+from spectralDNS.optimization import set_threads
+
+comm = MPI.COMM_WORLD
+
+args = argparse.ArgumentParser()
+args.add_argument('--N0', default=[6, 7, 8, 9], nargs='+', type=int)
+args.add_argument('--M', default=[6, 6], nargs=2, type=int)
+args.add_argument('--threads', default=[1, 2, 4], nargs='+', type=int)
+args.add_argument('--optimization', default='numba')
+args.add_argument('--repeats', default=10, type=int)
+args = args.parse_args()
+
+def timeit(f):
+    f()
+    comm.barrier()
+    t0 = time()
+    for i in range(args.repeats):
+        f()
+    comm.barrier()
+    return comm.allreduce((time()-t0)/args.repeats, op=MPI.MAX)
+
+results = {}
+for n in args.N0:
+    for threads in args.threads:
+        solver = get_solver(mesh='channel',
+                            parse_args=['--M', str(n)]+[str(m) for m in args.M]+
+                            ['--threads', str(threads),
+                             '--optimization', args.optimization, 'KMM'])
+        c = solver.get_context()
+        set_threads(threads)
+        rhs = np.random.random(c.dU.shape)+1j*np.random.random(c.dU.shape)
+        B, H = c.la.BiharmonicSolverU, c.la.HelmholtzSolverG
+        u_hat, g_hat = c.U_hat, c.g
+        res = results.setdefault(n, {})
+        if threads == args.threads[0]:
+            res['Biharmonic shenfun'] = timeit(
+                lambda: la.Biharmonic.__call__(B, rhs[0], u_hat[0]))
+            res['Helmholtz shenfun'] = timeit(
+                lambda: la.Helmholtz.__call__(H, rhs[1], g_hat))
+        res['Biharmonic {}'.format(threads)] = timeit(lambda: B(rhs[0], u_hat[0]))
+        res['Helmholtz {}'.format(threads)] = timeit(lambda: H(rhs[1], g_hat))
+        res['solve_linear {}'.format(threads)] = timeit(
+            lambda: solver.solve_linear(u_hat, g_hat, rhs, **c))
+
+if comm.Get_rank() == 0:
+    print('{} processors, optimization {}, M[1:] = {}'.format(
+        comm.Get_size(), args.optimization, args.M))
+    names = list(results[args.N0[0]])
+    print('{:24s}'.format('N[0]')+''.join('{:>20d}'.format(2**n) for n in args.N0))
+    for name in names:
+        t = [results[n][name] for n in args.N0]
+        print('{:24s}'.format(name)+''.join(
+            '{:12.4e} ({:5.2f})'.format(t[i], 0 if i == 0 else t[i]/t[i-1]/2)
+            for i in range(len(t))))
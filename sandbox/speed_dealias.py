@@ -0,0 +1,62 @@
+"""
+Compare cost of dealiasing rules for the triply periodic solvers
+
+Times ComputeRHS and reports the memory of the arrays used for the
+nonlinear term, for the 3/2-rule, 2/3-rule and phase-shift dealiasing.
+
+Usage, e.g.,
+
+    mpirun -np 4 python speed_dealias.py --M 6 6 6 --solver NS --convection Vortex
+"""
+import argparse
+from time import time
+import numpy as np
+from mpi4py import MPI
+from shenfun import Array
+from spectralDNS import config, get_solver
+
+comm = MPI.COMM_WORLD
+
+args = argparse.ArgumentParser()
+args.add_argument('--M', default=[6, 6, 6], nargs=3, type=int)
+args.add_argument('--solver', default='NS', choices=('NS', 'VV', 'MHD'))
+args.add_argument('--convection', default='Vortex')
+args.add_argument('--repeats', default=20, type=int)
+args = args.parse_args()
+
+def nbytes(context):
+    """Return bytes of all arrays in context and its work arrays"""
+    b = sum(v.nbytes for v in context.values() if isinstance(v, np.ndarray))
+    b += sum(v.nbytes for v in context.work.values())
+    return comm.allreduce(b)
+
+results = {}
+for dealias in ('3/2-rule', '2/3-rule', 'phase-shift'):
+    solver = get_solver(parse_args=['--M']+[str(m) for m in args.M]+
+                        ['--dealias', dealias, '--convection', args.convection,
+                         args.solver])
+    context = solver.get_context()
+    solver.conv = solver.getConvection(config.params.convection)
+    if dealias == 'phase-shift':
+        solver.conv = solver.phase_shifted(solver.conv, context)
+
+    VT = context.VT if args.solver != 'MHD' else context.VM
+    U = Array(VT)
+    U[:] = np.random.random(U.shape)-0.5
+    u = VT.forward(U, context.u)
+
+    rhs = context.dU
+    rhs = solver.ComputeRHS(rhs, u, solver, **context)
+    comm.barrier()
+    t0 = time()
+    for i in range(args.repeats):
+        rhs = solver.ComputeRHS(rhs, u, solver, **context)
+    comm.barrier()
+    t = comm.allreduce((time()-t0)/args.repeats, op=MPI.MAX)
+    results[dealias] = (t, nbytes(context))
+
+if comm.Get_rank() == 0:
+    t0, b0 = results['3/2-rule']
+    print('{:12s} {:>12s} {:>8s} {:>12s} {:>8s}'.format('dealias', 'time', 'ratio', 'MB', 'ratio'))
+    for dealias, (t, b) in results.items():
+        print('{:12s} {:12.4e} {:8.2f} {:12.1f} {:8.2f}'.format(dealias, t, t/t0, b/1e6, b/b0))
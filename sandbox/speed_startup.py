@@ -0,0 +1,58 @@
+"""
+Measure the startup time of spectralDNS
+
+Times, in fresh Python processes, the import of spectralDNS, get_solver
+(which imports the solver and the selected optimization backend),
+get_context and the first evaluation of the right hand side (where numba
+compiles its kernels, or loads them from the on-disk cache).
+
+Usage, e.g.,
+
+    python speed_startup.py --solver NS --optimization '' numba cython
+"""
+import sys
+import json
+import argparse
+import subprocess
+import numpy as np
+
+args = argparse.ArgumentParser()
+args.add_argument('--solver', default='NS', choices=('NS', 'VV', 'MHD'))
+args.add_argument('--M', default=[5, 5, 5], nargs=3, type=int)
+args.add_argument('--optimization', default=['', 'numba', 'cython', 'pythran'], nargs='+')
+args.add_argument('--repeats', default=5, type=int)
+args = args.parse_args()
+
+script = '''
+import json
+from time import perf_counter
+t0 = perf_counter()
+import spectralDNS
+t1 = perf_counter()
+solver = spectralDNS.get_solver(parse_args={parse_args})
+t2 = perf_counter()
+context = solver.get_context()
+t3 = perf_counter()
+solver.conv = solver.getConvection(solver.params.convection)
+solver.ComputeRHS(context.dU, context.u, solver, **context)
+t4 = perf_counter()
+print(json.dumps({{'import': t1-t0, 'get_solver': t2-t1,
+                  'get_context': t3-t2, 'first rhs': t4-t3}}))
+'''
+
+phases = ('import', 'get_solver', 'get_context', 'first rhs')
+print('{:12s}'.format('optimization')+''.join('{:>14s}'.format(p) for p in phases))
+for opt in args.optimization:
+    parse_args = ['--M']+[str(m) for m in args.M]+['--verbose']
+    if opt:
+        parse_args += ['--optimization', opt]
+    parse_args.append(args.solver)
+    code = script.format(parse_args=parse_args)
+    times = []
+    for i in range(args.repeats):
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True,
+                             text=True, check=True).stdout
+        times.append(json.loads(out.strip().splitlines()[-1]))
+    # The median hides the first run, where numba populates its cache
+    print('{:12s}'.format(opt or 'numpy')+''.join(
+        '{:14.4f}'.format(np.median([t[p] for t in times])) for p in phases))
@@ -0,0 +1,67 @@
+"""
+Measure hybrid MPI + threads scaling of the triply periodic NS solver
+
+For each number of threads, times the threaded pointwise kernels (cross1,
+cross2, add_pressure_diffusion), the right hand side and one RK4 time step.
+The threads are shared by the FFTs and the optimized kernels, so run with
+processors times threads equal to the number of cores, e.g.,
+
+    mpirun -np 2 python speed_threads.py --M 7 7 7 --threads 1 2 4 --optimization numba
+"""
+import argparse
+from time import time
+import numpy as np
+from mpi4py import MPI
+from spectralDNS import get_solver
+from spectralDNS.optimization import set_threads
+
+comm = MPI.COMM_WORLD
+
+args = argparse.ArgumentParser()
+args.add_argument('--M', default=[6, 6, 6], nargs=3, type=int)
+args.add_argument('--threads', default=[1, 2, 4], nargs='+', type=int)
+args.add_argument('--optimization', default='numba')
+args.add_argument('--decomposition', default='slab', choices=('slab', 'pencil'))
+args.add_argument('--repeats', default=10, type=int)
+args = args.parse_args()
+
+def timeit(f):
+    f()
+    comm.barrier()
+    t0 = time()
+    for i in range(args.repeats):
+        f()
+    comm.barrier()
+    return comm.allreduce((time()-t0)/args.repeats, op=MPI.MAX)
+
+results = {}
+for threads in args.threads:
+    solver = get_solver(parse_args=['--M']+[str(m) for m in args.M]+
+                        ['--threads', str(threads),
+                         '--optimization', args.optimization,
+                         '--decomposition', args.decomposition,
+                         'NS'])
+    set_threads(threads)
+    c = solver.get_context()
+    c.U[:] = np.random.random(c.U.shape)
+    c.U_hat[:] = c.T.forward(c.U, c.U_hat)
+    solver.conv = solver.getConvection(solver.params.convection)
+    integrate = solver.getintegrator(c.dU, c.u, solver, c)
+    W = np.zeros_like(c.U)
+    results[threads] = {
+        'cross1': timeit(lambda: solver.cross1(W, c.U, c.U)),
+        'cross2': timeit(lambda: solver.cross2(c.dU, c.K, c.U_hat)),
+        'add_pressure_diffusion': timeit(
+            lambda: solver.add_pressure_diffusion(c.dU, c.U_hat, 0.01, c.K, c.P_hat, c.work)),
+        'ComputeRHS': timeit(lambda: solver.ComputeRHS(c.dU, c.U_hat, solver, **c)),
+        'RK4 step': timeit(integrate)
+    }
+
+if comm.Get_rank() == 0:
+    print('{} processors, optimization {}'.format(comm.Get_size(), args.optimization))
+    t0 = results[args.threads[0]]
+    print('{:24s}'.format('threads')+''.join('{:>20d}'.format(t) for t in args.threads))
+    for name in t0:
+        print('{:24s}'.format(name)+''.join(
+            '{:12.4e} ({:5.2f})'.format(results[t][name], t0[name]/results[t][name])
+            for t in args.threads))
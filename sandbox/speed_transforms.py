@@ -0,0 +1,68 @@
+"""
+Compare serial, batched and pipelined transforms of several components
+
+Times the backward and forward transforms of m components of a triply
+periodic TensorProductSpace, either component by component, batched in
+one Alltoallw per stage, or pipelined with one nonblocking Ialltoallw per
+component and stage.
+
+Usage, e.g.,
+
+    mpirun -np 8 python speed_transforms.py --N 128 128 128 --m 6 --decomposition pencil
+"""
+import argparse
+from time import time
+import numpy as np
+from mpi4py import MPI
+from shenfun import FunctionSpace, TensorProductSpace, Array, Function
+from spectralDNS.utilities.transforms import BatchedTransform, PipelinedTransform
+
+comm = MPI.COMM_WORLD
+
+args = argparse.ArgumentParser()
+args.add_argument('--N', default=[64, 64, 64], nargs=3, type=int)
+args.add_argument('--m', default=6, type=int)
+args.add_argument('--decomposition', default='slab', choices=('slab', 'pencil'))
+args.add_argument('--repeats', default=20, type=int)
+args = args.parse_args()
+
+V = [FunctionSpace(args.N[0], 'F', dtype='D'),
+     FunctionSpace(args.N[1], 'F', dtype='D'),
+     FunctionSpace(args.N[2], 'F', dtype='d')]
+T = TensorProductSpace(comm, V, slab=(args.decomposition == 'slab'))
+m = args.m
+
+u = np.array([Array(T) for i in range(m)])
+u[:] = np.random.random(u.shape)
+u_hat = np.array([Function(T) for i in range(m)])
+
+def serial(transform):
+    def f(a, b):
+        for i in range(m):
+            b[i] = transform(a[i], b[i])
+        return b
+    return f
+
+def timeit(backward, forward):
+    u_hat[:] = forward(u, u_hat)
+    comm.barrier()
+    t0 = time()
+    for i in range(args.repeats):
+        v = backward(u_hat, u)
+        u_hat[:] = forward(v, u_hat)
+    comm.barrier()
+    return comm.allreduce((time()-t0)/args.repeats, op=MPI.MAX)
+
+results = {
+    'serial': timeit(serial(T.backward), serial(T.forward)),
+    'batched': timeit(BatchedTransform(T.backward, m),
+                      BatchedTransform(T.forward, m)),
+    'pipelined': timeit(PipelinedTransform(T.backward, m),
+                        PipelinedTransform(T.forward, m))
+}
+
+if comm.Get_rank() == 0:
+    t0 = results['serial']
+    print('{:12s} {:>12s} {:>8s}'.format('transform', 'time', 'ratio'))
+    for name, t in results.items():
+        print('{:12s} {:12.4e} {:8.2f}'.format(name, t, t/t0))
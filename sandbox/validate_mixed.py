@@ -0,0 +1,66 @@
+"""
+Validate mixed precision against double precision
+
+Runs a triply periodic solver from the Taylor-Green vortex, once in double
+and once in mixed precision, and compares the energy and dissipation of
+all time steps. Fails if the largest relative difference exceeds rtol.
+
+Usage, e.g.,
+
+    mpirun -np 4 python validate_mixed.py --M 5 5 5 --T 2 --solver NS
+"""
+import sys
+import json
+import argparse
+import numpy as np
+from mpi4py import MPI
+from spectralDNS import config, get_solver, solve
+
+comm = MPI.COMM_WORLD
+
+args = argparse.ArgumentParser()
+args.add_argument('--M', default=[5, 5, 5], nargs=3, type=int)
+args.add_argument('--T', default=1.0, type=float)
+args.add_argument('--dt', default=0.01, type=float)
+args.add_argument('--nu', default=0.005, type=float)
+args.add_argument('--solver', default='NS', choices=('NS', 'VV'))
+args.add_argument('--convection', default='Vortex')
+args.add_argument('--dealias', default='2/3-rule')
+args.add_argument('--rtol', default=1e-5, type=float)
+args = args.parse_args()
+
+def initialize(solver, context):
+    U, X = context.U, context.X
+    U[0] = np.sin(X[0])*np.cos(X[1])*np.cos(X[2])
+    U[1] = -np.cos(X[0])*np.sin(X[1])*np.cos(X[2])
+    U[2] = 0
+    solver.set_velocity(**context)
+    if args.solver == 'VV':
+        solver.cross2(context.W_hat, context.K, context.U_hat)
+    config.params.t = 0.0
+    config.params.tstep = 0
+
+names = ('energy', 'dissipation')
+history = {}
+for precision in ('double', 'mixed'):
+    solver = get_solver(parse_args=['--M']+[str(m) for m in args.M]+
+                        ['--precision', precision,
+                         '--T', str(args.T), '--dt', str(args.dt),
+                         '--nu', str(args.nu),
+                         '--dealias', args.dealias,
+                         '--convection', args.convection,
+                         '--diagnostics', json.dumps(dict.fromkeys(names, 1)),
+                         args.solver])
+    context = solver.get_context()
+    initialize(solver, context)
+    solve(solver, context)
+    history[precision] = np.array([[d[name] for name in names]
+                                   for tstep, t, d in solver.diagnostics.history])
+
+d, m = history['double'], history['mixed']
+error = np.abs(m-d).max(axis=0)/np.abs(d).max(axis=0)
+if comm.Get_rank() == 0:
+    print('{:12s} {:>16s} {:>16s} {:>12s}'.format('quantity', 'double', 'mixed', 'rel. error'))
+    for i, name in enumerate(names):
+        print('{:12s} {:16.10e} {:16.10e} {:12.4e}'.format(name, d[-1, i], m[-1, i], error[i]))
+sys.exit(int(np.any(error > args.rtol)))
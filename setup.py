@@ -28,9 +28,15 @@ class build_ext_subclass(build_ext):
             if has_flag(self.compiler, c):
                 extra_compile_args.append(c)
 
+        # The optimized kernels are threaded with OpenMP, if available
+        openmp = ['-fopenmp'] if has_flag(self.compiler, '-fopenmp') else []
+
         for e in self.extensions:
             e.extra_compile_args += extra_compile_args
             e.include_dirs.extend([get_include()])
+            if e.name.startswith('spectralDNS.optimization'):
+                e.extra_compile_args += openmp
+                e.extra_link_args += openmp
         build_ext.build_extensions(self)
 
 def get_extension():
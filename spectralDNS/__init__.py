@@ -51,6 +51,10 @@ def get_solver(update=None,
     except AttributeError:
         raise AttributeError("Wrong solver!")
 
+    if not hasattr(solver.get_context, '__wrapped__'):
+        from .utilities.wisdom import cache_wisdom
+        solver.get_context = cache_wisdom(solver.get_context)
+
     if update:
         solver.update = update
 
@@ -82,7 +86,28 @@ def solve(solver, context):
     solver.timer = solver.Timer()
     params = solver.params
 
+    from .optimization import set_threads
+    set_threads(params.threads)
+
     solver.conv = solver.getConvection(params.convection)
+    if params.dealias == 'phase-shift':
+        solver.conv = solver.phase_shifted(solver.conv, context)
+
+    solver.timer.instrument(solver, context)
+
+    diagnostics = None
+    if params.get('diagnostics'):
+        from .diagnostics import Diagnostics
+        diagnostics = solver.diagnostics = Diagnostics(context, params.diagnostics)
+
+    cfl = None
+    if params.get('cfl'):
+        from .utilities.cfl import CFLController
+        cfl = solver.cfl_controller = CFLController(context, params.cfl,
+                                                    params.cfl_hysteresis,
+                                                    params.dt_max,
+                                                    dx=solver.cfl_spacing(context),
+                                                    quantization=params.get('dt_quantization', 0))
 
     integrate = solver.getintegrator(context.dU, # rhs array
                                      context.u,  # primary variable
@@ -91,16 +116,38 @@ def solve(solver, context):
 
     dt_in = params.dt
 
-    while params.t + params.dt <= params.T+1e-12:
+    # With a CFL controller or an adaptive integrator dt varies, and the
+    # last step is clipped to end at T
+    clip = cfl is not None or params.get('integrator', '').endswith('_adaptive')
+
+    while (params.t + params.dt <= params.T+1e-12 or
+           clip and params.t < params.T-1e-12):
+
+        if clip and params.t + params.dt > params.T:
+            params.dt = params.T - params.t
 
         u, params.dt, dt_took = integrate()
 
         params.t += dt_took
         params.tstep += 1
 
-        solver.update(context)
+        if cfl is not None:
+            dt_cfl = cfl(solver.cfl_velocity(context), dt_took)
+            # Adaptive integrators return a new dt from their error estimate
+            params.dt = dt_cfl if params.dt == dt_took else min(params.dt, dt_cfl)
+
+        with solver.timer.phase('update'):
+            solver.update(context)
 
-        context.hdf5file.update(params, **context)
+        if diagnostics is not None:
+            with solver.timer.phase('diagnostics'):
+                results = diagnostics(context)
+            if results and params.verbose and solver.rank == 0:
+                print(params.tstep, params.t, ' '.join(
+                    '{}={:2.6e}'.format(*item) for item in results.items()))
+
+        with solver.timer.phase('io'):
+            context.hdf5file.update(params, **context)
 
         solver.timer()
 
@@ -113,7 +160,11 @@ def solve(solver, context):
 
     params.dt = dt_in
 
-    solver.timer.final(params.verbose)
+    solver.timer.final(params.verbose, params.timings)
+
+    if params.optimization == 'autotune' and params.verbose and solver.rank == 0:
+        from .optimization.autotune import report
+        print(report())
 
     if params.make_profile:
         solver.results = solver.create_profile(solver.profiler)
@@ -0,0 +1,160 @@
+"""
+Module for sampling plane averaged statistics of the channel solvers
+
+The statistics are computed from the spectral coefficients of the solution.
+Only the local Chebyshev axis is evaluated in physical space, with one
+matrix product per field, such that sampling requires neither transforms in
+the periodic directions nor global transposes. The local contributions of
+all statistics are reduced with a single Allreduce.
+"""
+import numpy as np
+from mpi4py import MPI
+from spectralDNS import config
+from spectralDNS.diagnostics import parseval_weights
+
+__all__ = ['ChannelStats']
+
+class ChannelStats(object):
+    """Class for sampling statistics of channel flow
+
+    The statistics are functions of the wall normal coordinate x, averaged
+    over the two periodic directions and over all samples in time::
+
+        mean         <u_i>
+        stress       <(u_i - <u_i>)(u_j - <u_j>)>
+
+    for all fields u_i, i.e., the velocity components U, V, W and the
+    scalars given. The plane average of a sample is its Fourier coefficient
+    of wavenumber (0, 0), and the covariances within the plane are given by
+    Parseval's theorem over the remaining Fourier coefficients. Samples are
+    accumulated in double precision with Welford's algorithm, where the
+    stress is the mean of the covariances within planes plus the covariance
+    in time of the plane averages. This avoids the cancellation in
+    <u_i u_j> - <u_i><u_j> for the large mean velocity.
+
+    args:
+        context      The solver's context
+        filename     Name of HDF5 file, without extension, that the
+                     statistics are written to. No file if empty
+        flush        Number of samples between each write to file
+        scalars      Names of spectral scalar fields of context to include,
+                     e.g., ('phi_hat',)
+        fromstats    Name of file, without extension, with statistics to
+                     continue sampling from
+
+    Calling an instance with the context adds a sample of the current
+    solution. The file is written by the first processor, and holds the
+    groups 'Average' and 'Reynolds Stress', the mesh 'x' and the number of
+    samples as attribute.
+    """
+    def __init__(self, context, filename='', flush=100, scalars=(), fromstats=''):
+        c = context
+        spaces = c.U_hat.function_space().flatten()
+        spaces += [c[name].function_space() for name in scalars]
+        T = spaces[0]
+        self.comm = T.comm
+        self.axis = axis = [b.family() for b in T.bases].index('chebyshev')
+        self.scalars = scalars
+        self.names = ['U', 'V', 'W'] + [name.replace('_hat', '') for name in scalars]
+        self.pairs = [(i, j) for i in range(len(spaces)) for j in range(i, len(spaces))]
+        self.pair_names = [self.names[i]+self.names[j] for i, j in self.pairs]
+        self.filename = filename
+        self.flush_every = flush
+
+        # Evaluate all fields in the points of the first
+        self.x = T.bases[axis].mesh(False, False)
+        self.V = [S.bases[axis].evaluate_basis_all(x=self.x, argument=1) for S in spaces]
+
+        # Weights of real and imaginary parts of the local Fourier modes.
+        # Wavenumber (0, 0) is the plane average, and has weight zero.
+        w = np.broadcast_to(parseval_weights(T, T.axes[-1][-1]), T.shape(True))
+        w = np.moveaxis(w, axis, 0)[0].ravel().astype(float)
+        s = T.local_slice(True)
+        self.has_mean = all((s[i].start or 0) == 0 for i in range(len(s)) if i != axis)
+        if self.has_mean:
+            w[0] = 0
+        self.weights = np.sqrt(np.repeat(w, 2))
+
+        n, m = len(self.x), len(spaces)
+        self.u = np.zeros((m, n, self.weights.size))
+        self.sums = np.zeros((m+len(self.pairs), n))
+        self.num_samples = 0
+        self.mean = np.zeros((m, n))
+        self.cov = np.zeros((len(self.pairs), n))
+        self.comoment = np.zeros((len(self.pairs), n))
+        if fromstats:
+            self.fromfile(fromstats)
+
+    def __call__(self, context):
+        c = context
+        fields = list(c.U_hat) + [c[name] for name in self.scalars]
+        m = len(fields)
+        for i, f in enumerate(fields):
+            # Real and imaginary parts of all modes as columns, axis first
+            f = np.ascontiguousarray(np.moveaxis(f, self.axis, 0))
+            np.dot(self.V[i], f.reshape((f.shape[0], -1)).view(float), out=self.u[i])
+        sums = self.sums
+        sums[:] = 0
+        if self.has_mean:
+            sums[:m] = self.u[:, :, 0]
+        self.u *= self.weights
+        for p, (i, j) in enumerate(self.pairs):
+            sums[m+p] = np.einsum('ij,ij->i', self.u[i], self.u[j])
+        self.comm.Allreduce(MPI.IN_PLACE, sums, op=MPI.SUM)
+        self.update(sums[:m], sums[m:])
+        if self.filename and self.num_samples % self.flush_every == 0:
+            self.flush()
+
+    def update(self, mean, cov):
+        """Add sample with plane averages mean and plane covariances cov"""
+        self.num_samples += 1
+        delta = mean - self.mean
+        self.mean += delta/self.num_samples
+        for p, (i, j) in enumerate(self.pairs):
+            self.comoment[p] += delta[i]*(mean[j] - self.mean[j])
+        self.cov += (cov - self.cov)/self.num_samples
+
+    def get_stats(self):
+        """Return dictionaries of mean profiles and Reynolds stresses"""
+        stress = self.cov + self.comoment/max(self.num_samples, 1)
+        return (dict(zip(self.names, self.mean)),
+                dict(zip(self.pair_names, stress)))
+
+    def reset_stats(self):
+        self.num_samples = 0
+        self.mean[:] = 0
+        self.cov[:] = 0
+        self.comoment[:] = 0
+
+    def flush(self):
+        """Write statistics to file"""
+        if not self.filename or self.comm.Get_rank() != 0:
+            return
+        import h5py
+        mean, stress = self.get_stats()
+        with h5py.File(self.filename+".h5", "w") as f:
+            f.create_dataset("x", data=self.x)
+            for name, val in mean.items():
+                f.create_dataset("Average/"+name, data=val)
+            for name, val in stress.items():
+                f.create_dataset("Reynolds Stress/"+name, data=val)
+            f.attrs.create("num_samples", self.num_samples)
+            f.attrs.create("t", config.params.t)
+
+    def fromfile(self, filename):
+        """Continue sampling from the statistics stored in filename
+
+        The stored stress is taken as the covariance within the planes of
+        the stored samples, which is exact for the combined statistics.
+        """
+        data = None
+        if self.comm.Get_rank() == 0:
+            import h5py
+            with h5py.File(filename+".h5", "r") as f:
+                data = (int(f.attrs["num_samples"]),
+                        [f["Average/"+name][:] for name in self.names],
+                        [f["Reynolds Stress/"+name][:] for name in self.pair_names])
+        self.num_samples, mean, stress = self.comm.bcast(data, root=0)
+        self.mean[:] = mean
+        self.cov[:] = stress
+        self.comoment[:] = 0
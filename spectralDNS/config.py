@@ -6,8 +6,9 @@ dictionary may be accessed as attributes, e.g.,
 M = config.params.M  does the same thing as M = config.params['M']
 
 Generic parameters for all solvers::
-    precision        (str)           ('double', 'single')
-    optimization     (str)           ('cython', 'numba', None)
+    precision        (str)           ('double', 'single', 'mixed')
+    optimization     (str)           ('cython', 'numba', 'pythran', 'autotune', None)
+    autotune_cache   (str)           Folder used to cache kernels picked by autotune ('' for no caching)
     make_profile     (int)           Whether on not to enable profiling
     dt               (float)         Time step for fixed time step integrators
     T                (float)         End time
@@ -18,17 +19,38 @@ Generic parameters for all solvers::
     M             (int, int(, int))  Mesh size   (2 for 2D, 3 for 3D)
     write_result     (int)           Store results as HDF5 every (*) time step
     checkpoint       (int)           Save intermediate result every (*)
-    dealias          (str)           ('3/2-rule', '2/3-rule', 'None')
+    dealias          (str)           ('3/2-rule', '2/3-rule', 'phase-shift', 'None')
     decomposition    (str)           ('slab', 'pencil')
     ntol             (int)           Tolerance (number of accurate digits used in tests)
-    threads          (int)           Number of threads used for FFTs
+    threads          (int)           Number of threads used for FFTs and the
+                                     threaded optimized kernels
+    wisdom           (str)           Folder used to cache FFTW wisdom ('' for no caching)
     h5filename       (str)           Filename for storing HDF5 results
+    async_io         (bool)          Write HDF5 files from a background thread
+    io_buffers       (int)           Number of snapshot buffers used by async_io
     verbose          (bool)          Print some timings in the end
+    timings          (str)           Store timings of phases of time step as json or csv
     convection       (str)           ('Standard', 'Divergence', 'Skewed', 'Vortex')
+    diagnostics      (dict)          Cadence of diagnostics, e.g., {"energy": 10} (see spectralDNS.diagnostics)
 
 Parameters for 3D explicit solvers::
-    integrator       (str)           ('RK4', 'ForwardEuler', 'AB2', 'BS5_adaptive', 'BS5_fixed')
-    TOL              (float)         Accuracy used in BS5_adaptive
+    integrator       (str)           ('RK4', 'ForwardEuler', 'AB2', 'BS5_adaptive', 'BS5_fixed',
+                                      'RK3_2N', 'RK4_2N', 'RK3_2N_adaptive', 'RK4_2N_adaptive',
+                                      'IFRK4', 'ETDRK4', 'BS3_adaptive', 'BS3_fixed', 'DP5_adaptive',
+                                      'DP5_fixed', 'Tsit5_adaptive', 'Tsit5_fixed')
+    TOL              (float)         Accuracy used in *_adaptive integrators
+    errnorm          (str)           ('2', 'inf') Norm of error estimate in adaptive integrators
+    controller       (str)           ('I', 'PI') Step size controller of adaptive integrators
+    cfl              (float)         Target Courant number for adaptive dt (0 for fixed dt)
+    cfl_hysteresis   (float)         Relative deviation from cfl tolerated before dt is modified
+    dt_max           (float)         Largest time step allowed by the CFL controller
+
+Parameters for KMM channel solvers::
+    cfl              (float)         Target Courant number for adaptive dt (0 for fixed dt)
+    cfl_hysteresis   (float)         Relative deviation from cfl tolerated before dt is modified
+    dt_max           (float)         Largest time step allowed by the CFL controller
+    dt_quantization  (float)         Relative spacing of the time steps allowed by the CFL controller
+    dt_cache         (int)           Number of recent time steps with cached factorizations
 
 Solver specific parameters triply periodic domain::
     MHD::
@@ -165,10 +187,13 @@ parser = argparse.ArgumentParser(prog='spectralDNS', add_help=False)
 
 # Arguments used by all solvers
 parser.add_argument('--precision', default='double',
-                    choices=('single', 'double'))
+                    choices=('single', 'double', 'mixed'),
+                    help='Mixed computes the nonlinear term of the triply and doubly periodic solvers in single precision')
 parser.add_argument('--optimization', default='',
-                    choices=('cython', 'weave', 'numba', 'pythran'),
-                    help='Choose implementation method for optimization')
+                    choices=('cython', 'weave', 'numba', 'pythran', 'autotune'),
+                    help='Choose implementation method for optimization. Autotune picks the fastest for each function')
+parser.add_argument('--autotune_cache', default='', type=str,
+                    help='Folder used to cache the kernels picked by autotune between runs. No caching if empty')
 parser.add_argument('--make_profile', default=0, type=int,
                     help='Enable cProfile profiler')
 parser.add_argument('--dt', default=0.01, type=float,
@@ -189,21 +214,40 @@ parser.add_argument('--filemode', default='w',
                     choices=('w', 'r', 'a'),
                     help='Choose mode for opening HDF5 files')
 parser.add_argument('--dealias', default='2/3-rule',
-                    choices=('2/3-rule', '3/2-rule', 'None'),
+                    choices=('2/3-rule', '3/2-rule', 'phase-shift', 'None'),
                     help='Choose dealiasing method')
 parser.add_argument('--decomposition', default='slab', choices=('slab', 'pencil'),
                     help="Choose MPI decomposition between slab and pencil.")
 parser.add_argument('--ntol', default=7, type=int,
                     help='Tolerance - number of accurate digits')
 parser.add_argument('--threads', default=1, type=int,
-                    help='Number of threads used for FFTs')
+                    help='Number of threads used for FFTs and optimized kernels')
 parser.add_argument('--planner_effort', action=PlanAction, default=fft_plans,
                     help="""Planning effort for FFTs. Usage, e.g., --planner_effort '{"dct":"FFTW_EXHAUSTIVE"}' """)
+parser.add_argument('--wisdom', default='', type=str,
+                    help='Folder used to cache FFTW wisdom between runs. No caching if empty')
 parser.add_argument('--h5filename', default='results', type=str,
                     help='Filename of HDF5 datafile used to store intermediate checkpoint data or timeseries results')
+parser.add_argument('--async_io', dest='async_io', action='store_true', help='Write HDF5 files from a background thread')
+parser.add_argument('--no-async_io', dest='async_io', action='store_false', help='Write HDF5 files from the time loop')
+parser.set_defaults(async_io=False)
+parser.add_argument('--io_buffers', default=2, type=int,
+                    help='Number of snapshot buffers used by async_io. The time loop blocks when all are in flight')
 parser.add_argument('--verbose', dest='verbose', action='store_true', help='Print timings in the end')
 parser.add_argument('--no-verbose', dest='verbose', action='store_false', help='Do not print timings in the end')
 parser.set_defaults(verbose=True)
+parser.add_argument('--timings', default='', type=str,
+                    help='Store per-phase timings of time steps on this file (.json or .csv)')
+parser.add_argument('--batch_transforms', dest='batch_transforms', action='store_true',
+                    help='Transform all components of the Vortex convection (and the MHD fields) in one batched call')
+parser.add_argument('--no-batch_transforms', dest='batch_transforms', action='store_false',
+                    help='Transform the components of the Vortex convection one vector at the time')
+parser.set_defaults(batch_transforms=False)
+parser.add_argument('--pipeline_transforms', dest='pipeline_transforms', action='store_true',
+                    help='Overlap serial FFTs with nonblocking Alltoallw of the previous component in multi-component transforms')
+parser.add_argument('--no-pipeline_transforms', dest='pipeline_transforms', action='store_false',
+                    help='Redistribute all components of multi-component transforms in one Alltoallw')
+parser.set_defaults(pipeline_transforms=False)
 parser.add_argument('--mask_nyquist', dest='mask_nyquist', action='store_true', help='Eliminate Nyquist frequency')
 parser.add_argument('--no-mask_nyquist', dest='mask_nyquist', action='store_false', help='Do not eliminate Nyquist frequency')
 parser.set_defaults(mask_nyquist=True)
@@ -219,10 +263,25 @@ triplyperiodic.add_argument('--L', default=[2*pi, 2*pi, 2*pi], metavar=("Lx", "L
 
 triplyperiodic.add_argument('--M', default=[6, 6, 6], metavar=("Mx", "My", "Mz"), nargs=3,
                             help='Mesh size is pow(2, M[i]) in direction i. Used if N is missing.')
+triplyperiodic.add_argument('--diagnostics', default={}, type=json.loads,
+                            help="""Compute diagnostics every tstep. Usage, e.g., --diagnostics '{"energy": 1, "skewness": 100}' """)
 triplyperiodic.add_argument('--TOL', type=float, default=1e-6,
                             help='Tolerance for adaptive time integrator')
+triplyperiodic.add_argument('--errnorm', default='2', choices=('2', 'inf'),
+                            help='Norm of error estimate in adaptive time integrator')
+triplyperiodic.add_argument('--controller', default='I', choices=('I', 'PI'),
+                            help='Step size controller of adaptive time integrator')
+triplyperiodic.add_argument('--cfl', type=float, default=0,
+                            help='Adapt dt to target Courant number. 0 for fixed dt')
+triplyperiodic.add_argument('--cfl_hysteresis', type=float, default=0.2,
+                            help='Relative deviation from cfl tolerated before dt is modified')
+triplyperiodic.add_argument('--dt_max', type=float, default=None,
+                            help='Largest time step allowed by the cfl controller')
 triplyperiodic.add_argument('--integrator', default='RK4',
-                            choices=('RK4', 'ForwardEuler', 'AB2', 'BS5_adaptive', 'BS5_fixed'),
+                            choices=('RK4', 'ForwardEuler', 'AB2', 'BS5_adaptive', 'BS5_fixed',
+                                     'RK3_2N', 'RK4_2N', 'RK3_2N_adaptive', 'RK4_2N_adaptive',
+                                     'IFRK4', 'ETDRK4', 'BS3_adaptive', 'BS3_fixed',
+                                     'DP5_adaptive', 'DP5_fixed', 'Tsit5_adaptive', 'Tsit5_fixed'),
                             help='Integrator for triply periodic domain')
 
 trippelsubparsers = triplyperiodic.add_subparsers(dest='solver')
@@ -241,15 +300,30 @@ parser_Bq.add_argument('--Pr', default=1.0, type=float, help='Prandtl number')
 # Arguments for 2D periodic solvers
 doublyperiodic = argparse.ArgumentParser(parents=[parser])
 doublyperiodic.add_argument('--integrator', default='RK4',
-                            choices=('RK4', 'ForwardEuler', 'AB2', 'BS5_fixed', 'BS5_adaptive'),
+                            choices=('RK4', 'ForwardEuler', 'AB2', 'BS5_fixed', 'BS5_adaptive',
+                                     'RK3_2N', 'RK4_2N', 'RK3_2N_adaptive', 'RK4_2N_adaptive',
+                                     'IFRK4', 'ETDRK4', 'BS3_adaptive', 'BS3_fixed',
+                                     'DP5_adaptive', 'DP5_fixed', 'Tsit5_adaptive', 'Tsit5_fixed'),
                             help='Integrator for doubly periodic domain')
 doublyperiodic.add_argument('--L', default=[2*pi, 2*pi], nargs=2, metavar=('Lx', 'Ly'),
                             help='Physical mesh size')
 doublyperiodic.add_argument('--convection', default='Vortex',
                             choices=('Vortex'),
                             help='Choose method for computing the nonlinear convective term')
+doublyperiodic.add_argument('--diagnostics', default={}, type=json.loads,
+                            help="""Compute diagnostics every tstep. Usage, e.g., --diagnostics '{"energy": 1, "skewness": 100}' """)
 doublyperiodic.add_argument('--TOL', type=float, default=1e-6,
                             help='Tolerance for adaptive time integrator')
+doublyperiodic.add_argument('--errnorm', default='2', choices=('2', 'inf'),
+                            help='Norm of error estimate in adaptive time integrator')
+doublyperiodic.add_argument('--controller', default='I', choices=('I', 'PI'),
+                            help='Step size controller of adaptive time integrator')
+doublyperiodic.add_argument('--cfl', type=float, default=0,
+                            help='Adapt dt to target Courant number. 0 for fixed dt')
+doublyperiodic.add_argument('--cfl_hysteresis', type=float, default=0.2,
+                            help='Relative deviation from cfl tolerated before dt is modified')
+doublyperiodic.add_argument('--dt_max', type=float, default=None,
+                            help='Largest time step allowed by the cfl controller')
 doublyperiodic.add_argument('--M', default=[6, 6], nargs=2, metavar=('Mx', 'My'),
                             help='Mesh size is pow(2, M[i]) in direction i. Used if N is missing.')
 
@@ -275,6 +349,16 @@ channel.add_argument('--Bquad', default='GC', choices=('GC', 'GL'),
                      help="Choose quadrature scheme for Biharmonic space. GC = Chebyshev-Gauss (x_k=cos((2k+1)/(2N+2)*pi)) and GL = Gauss-Lobatto (x_k=cos(k*pi/N))")
 channel.add_argument('--Nquad', default='GC', choices=('GC', 'GL'),
                      help="Choose quadrature scheme for Neumann space. GC = Chebyshev-Gauss (x_k=cos((2k+1)/(2N+2)*pi)) and GL = Gauss-Lobatto (x_k=cos(k*pi/N))")
+channel.add_argument('--cfl', type=float, default=0,
+                     help='Adapt dt to target Courant number. 0 for fixed dt')
+channel.add_argument('--cfl_hysteresis', type=float, default=0.2,
+                     help='Relative deviation from cfl tolerated before dt is modified')
+channel.add_argument('--dt_max', type=float, default=None,
+                     help='Largest time step allowed by the cfl controller')
+channel.add_argument('--dt_quantization', type=float, default=0.05,
+                     help='Relative spacing q of time steps dt*(1+q)**n allowed by the cfl controller')
+channel.add_argument('--dt_cache', type=int, default=4,
+                     help='Number of recent time steps with cached dt dependent factorizations')
 channelsubparsers = channel.add_subparsers(dest='solver')
 
 KMM = channelsubparsers.add_parser('KMM', help='Kim Moin Moser channel solver with Crank-Nicolson and Adams-Bashforth discretization.')
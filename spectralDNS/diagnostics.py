@@ -0,0 +1,264 @@
+"""
+Module for in-situ turbulence diagnostics of the triply and doubly periodic
+solvers
+
+All diagnostics are computed from the Fourier coefficients of the velocity,
+using Parseval's theorem. Only the skewness needs a transform to physical
+space. The local contributions to all diagnostics that are due at a time
+step are stacked into one array and reduced with a single Allreduce.
+"""
+import numpy as np
+from mpi4py import MPI
+from shenfun import Array, Function
+from spectralDNS import config
+from spectralDNS.maths import cross2, inverse_curl, wavenumber_squared
+
+__all__ = ['Diagnostics', 'SpectralBins', 'spectral_bins', 'parseval_weights']
+
+#pylint: disable=unused-argument
+
+def parseval_weights(T, axis=-1):
+    """Return weights of Parseval's theorem for the real-to-complex axis of T
+
+    All wavenumbers of the real-to-complex axis (by default the last), except
+    0 and N/2, also represent their complex conjugate and are counted twice.
+    The returned array broadcasts against the local spectral arrays of T.
+    """
+    N = T.dims()[axis]
+    n = T.bases[axis].N
+    k = np.arange(N)[T.local_slice(True)[axis]]
+    w = np.where((k == 0) | ((n % 2 == 0) & (k == n//2)), 1, 2)
+    shape = [1]*len(T)
+    shape[axis] = -1
+    return w.reshape(shape)
+
+class Diagnostics(object):
+    """Class for computing diagnostics of homogeneous turbulence
+
+    The diagnostics are (all quantities are volume averages)::
+
+        energy          <u.u>/2
+        enstrophy       <w.w>/2, where w = curl(u)
+        dissipation     nu <du_i/dx_j du_i/dx_j>
+        helicity        <u.w> (only 3D)
+        divergence      sqrt(<div(u)**2>)
+        Re_lambda       sqrt(20 energy**2 / (3 nu dissipation))
+        skewness        <(du_i/dx_i)**3> / <(du_i/dx_i)**2>**(3/2),
+                        averaged over i
+
+    args:
+        context      The solver's context
+        cadence      Dictionary with number of time steps between each
+                     computation of a diagnostic, e.g.,
+                     {'energy': 1, 'skewness': 100}. Diagnostics not in
+                     cadence are not computed. If None, then all
+                     diagnostics are computed every time step.
+
+    Calling an instance with the context computes all diagnostics due at
+    the current time step. The results are returned as a dictionary, which
+    is also appended to the list ``history`` together with tstep and t.
+    """
+
+    names = ('energy', 'enstrophy', 'dissipation', 'helicity', 'divergence',
+             'Re_lambda', 'skewness')
+
+    def __init__(self, context, cadence=None):
+        c = context
+        self.T = c.T
+        self.comm = c.T.comm
+        self.dim = len(c.K)
+        if cadence is None:
+            cadence = dict.fromkeys(self.names, 1)
+        for name in cadence:
+            assert name in self.names, 'Unknown diagnostic {}'.format(name)
+        if self.dim == 2:
+            assert 'helicity' not in cadence, 'No helicity in 2D'
+        self.cadence = cadence
+        self.history = []
+
+        self.weights = parseval_weights(c.T).astype(c.K[0].dtype)
+
+        self.u_hat = Function(c.VT)
+        self.dudx = Array(c.VT)
+
+    def due(self, tstep):
+        """Return list of diagnostics due at time step tstep"""
+        return [name for name in self.names
+                if name in self.cadence and tstep % self.cadence[name] == 0]
+
+    def velocity(self, context):
+        """Return Fourier coefficients of velocity"""
+        c = context
+        if 'W_hat' in c and c.u is c.W_hat:
+            # Velocity-vorticity formulation: u_hat = i k x w_hat / k^2
+            return inverse_curl(self.u_hat, c.K, c.W_hat)
+        return c.U_hat
+
+    def __call__(self, context, tstep=None):
+        params = config.params
+        tstep = params.tstep if tstep is None else tstep
+        due = self.due(tstep)
+        if len(due) == 0:
+            return {}
+
+        c = context
+        K = c.K
+        w = self.weights
+        u_hat = self.velocity(c)
+        need = set(due)
+        if 'Re_lambda' in need:
+            need.update(('energy', 'dissipation'))
+        if 'enstrophy' in need:
+            need.update(('dissipation', 'divergence'))
+
+        # Local contributions, stacked for one single reduction
+        sums = {}
+        if need & set(('energy', 'dissipation')):
+            uu = u_hat[0].real**2 + u_hat[0].imag**2
+            for i in range(1, self.dim):
+                uu += u_hat[i].real**2
+                uu += u_hat[i].imag**2
+            uu *= w
+            if 'energy' in need:
+                sums['energy'] = np.sum(uu)
+            if 'dissipation' in need:
+                sums['dissipation'] = np.sum(uu*wavenumber_squared(K))
+
+        if 'divergence' in need:
+            div = K[0]*u_hat[0]
+            for i in range(1, self.dim):
+                div += K[i]*u_hat[i]
+            sums['divergence'] = np.sum(w*(div.real**2 + div.imag**2))
+
+        if 'helicity' in need:
+            curl_hat = cross2(c.work[(u_hat, 0, False)], K, u_hat)
+            h = u_hat[0].real*curl_hat[0].real + u_hat[0].imag*curl_hat[0].imag
+            for i in range(1, 3):
+                h += u_hat[i].real*curl_hat[i].real
+                h += u_hat[i].imag*curl_hat[i].imag
+            sums['helicity'] = np.sum(w*h)
+
+        if 'skewness' in need:
+            dudx_hat = self.u_hat if u_hat is not self.u_hat else c.work[(u_hat, 0, False)]
+            for i in range(self.dim):
+                dudx_hat[i] = 1j*K[i]*u_hat[i]
+            dudx = c.VT.backward(dudx_hat, self.dudx)
+            M = np.prod(params.N)*self.dim
+            sums['skewness2'] = np.sum(dudx**2)/M
+            sums['skewness3'] = np.sum(dudx**3)/M
+
+        keys = list(sums.keys())
+        buf = np.array([sums[key] for key in keys], dtype=float)
+        self.comm.Allreduce(MPI.IN_PLACE, buf, op=MPI.SUM)
+        sums = dict(zip(keys, buf))
+
+        nu = params.nu
+        results = {}
+        if 'energy' in need:
+            results['energy'] = 0.5*sums['energy']
+        if 'dissipation' in need:
+            results['dissipation'] = nu*sums['dissipation']
+        if 'divergence' in need:
+            results['divergence'] = np.sqrt(sums['divergence'])
+        if 'enstrophy' in need:
+            # |k x u|^2 = k^2 |u|^2 - |k.u|^2
+            results['enstrophy'] = 0.5*(sums['dissipation'] - sums['divergence'])
+        if 'helicity' in need:
+            results['helicity'] = sums['helicity']
+        if 'Re_lambda' in need:
+            eps = max(results['dissipation'], 1e-300)
+            results['Re_lambda'] = np.sqrt(20*results['energy']**2/(3*nu*eps))
+        if 'skewness' in need:
+            results['skewness'] = sums['skewness3']/max(sums['skewness2'], 1e-300)**1.5
+        results = {name: float(results[name]) for name in due}
+        self.history.append((tstep, params.t, results))
+        return results
+
+
+class SpectralBins(object):
+    """Class for binning spectral quantities in shells of constant |k|
+
+    The shell index of all local wavenumbers is computed once. Spectra are
+    then computed with one weighted bincount and one Allreduce, regardless
+    of how many spectra are computed in the same call.
+
+    The shell width is the smallest wavenumber of the box, dk = min(2 pi/L),
+    and shell i contains all wavenumbers with (i-1/2)dk < |k| <= (i+1/2)dk.
+
+    args:
+        T            TensorProductSpace (Fourier in all directions)
+        K            List of broadcastable (scaled) wavenumbers
+
+    Spectra are scaled such that they sum to the volume average, e.g.,
+    sum(spectrum(u_hat)) = <u.u>/2.
+    """
+    def __init__(self, T, K):
+        params = config.params
+        K2 = wavenumber_squared(K)
+        self.comm = T.comm
+        self.dk = np.min(2*np.pi/params.L)
+        kmax = np.sqrt(np.sum((np.array(params.N)//2*2*np.pi/params.L)**2))
+        self.nbins = int(np.rint(kmax/self.dk)) + 1
+        self.k = self.dk*np.arange(self.nbins)
+        self.shape = K2.shape
+        self.weights = np.broadcast_to(parseval_weights(T), K2.shape).ravel()
+        self.index = np.rint(np.sqrt(K2)/self.dk).astype(np.intp).ravel()
+        self._stacked = {1: self.index}
+        self.counts = self.bincount(self.weights[None])[0]
+
+    def bincount(self, fields):
+        """Return fields, shape (m, ...), summed in shells and over processors"""
+        m = len(fields)
+        if m not in self._stacked:
+            offset = self.nbins*np.arange(m, dtype=np.intp)
+            self._stacked[m] = (self.index[None, :] + offset[:, None]).ravel()
+        out = np.bincount(self._stacked[m], weights=np.ravel(fields),
+                          minlength=m*self.nbins).reshape((m, self.nbins))
+        self.comm.Allreduce(MPI.IN_PLACE, out, op=MPI.SUM)
+        return out
+
+    def cospectra(self, pairs):
+        """Return co-spectra of all pairs (a_hat, b_hat) in list pairs
+
+        The co-spectrum of a pair is the shell sum of Re(conj(a_hat).b_hat),
+        where the dot product is over components for vectors. Returns array
+        of shape (len(pairs), nbins).
+        """
+        fields = np.empty((len(pairs), self.index.size))
+        for j, (a, b) in enumerate(pairs):
+            ab = a.real*b.real + a.imag*b.imag
+            if ab.shape != self.shape:
+                ab = np.sum(ab, axis=0)
+            fields[j] = ab.ravel()*self.weights
+        return self.bincount(fields)
+
+    def cospectrum(self, a_hat, b_hat):
+        """Return co-spectrum of a_hat and b_hat"""
+        return self.cospectra([(a_hat, b_hat)])[0]
+
+    def spectrum(self, u_hat):
+        """Return spectrum of u_hat, scaled such that sum is <u.u>/2"""
+        return 0.5*self.cospectra([(u_hat, u_hat)])[0]
+
+    def transfer(self, u_hat, N_hat):
+        """Return transfer spectrum
+
+        The transfer is the co-spectrum of u_hat and the nonlinear term N_hat,
+        as it appears on the right hand side of the momentum equation.
+        """
+        return self.cospectrum(u_hat, N_hat)
+
+    def flux(self, u_hat, N_hat):
+        """Return spectral flux through the shells
+
+        The flux through shell k is minus the transfer summed over all
+        shells up to and including k.
+        """
+        return -np.cumsum(self.transfer(u_hat, N_hat))
+
+
+def spectral_bins(context):
+    """Return SpectralBins of context, created on first call"""
+    if 'spectral_bins' not in context:
+        context.spectral_bins = SpectralBins(context.T, context.K)
+    return context.spectral_bins
@@ -1,7 +1,10 @@
 import os
 import sys
+import threading
+import queue
+import numpy as np
 from mpi4py import MPI
-from shenfun import ShenfunFile
+from mpi4py_fft.io import HDF5File as H5File
 
 __all__ = ['HDF5File']
 
@@ -52,53 +55,83 @@ class HDF5File(object):
     are store for physical space, i.e., the input to a forward transform of the
     space.
 
+    With ``params.async_io`` the data are copied into a snapshot buffer and
+    written to disk by a background thread, such that the solver may continue
+    integrating while the data are pushed through MPI-IO. At most
+    ``params.io_buffers`` snapshots are in flight at any time. If the writer
+    falls behind, then ``update`` blocks until a buffer has been released.
+
     """
 
     def __init__(self, filename, checkpoint={}, results={}):
         self.cfile = None
         self.wfile = None
+        self.writer = None
         self.filename = filename
         self.checkpoint = checkpoint
         self.results = results
 
     def update(self, params, **kw):
         if self.cfile is None:
-            self.cfile = ShenfunFile(self.filename+'_c',
-                                     self.checkpoint['space'],
-                                     mode=params.filemode)
+            self.cfile = _File(self.filename+'_c',
+                               self.checkpoint['space'],
+                               mode=params.filemode)
             self.cfile.open()
             self.cfile.f.attrs.create('tstep', 0)
             self.cfile.f.attrs.create('t', 0.0)
             self.cfile.close()
         if self.wfile is None:
-            self.wfile = ShenfunFile(self.filename+'_w',
-                                     self.results['space'],
-                                     mode=params.filemode)
+            self.wfile = _File(self.filename+'_w',
+                               self.results['space'],
+                               mode=params.filemode)
+        if self.writer is None and params.async_io:
+            self.writer = AsyncWriter.create(params.io_buffers)
+            if self.writer is not None:
+                self.cfile.iocomm = self.wfile.iocomm = self.writer.comm
 
         if params.tstep % params.write_result == 0:
             self.update_components(**kw)
-            self.wfile.write(params.tstep, self.results['data'], as_scalar=True)
+            self.submit(self.write_results, params.tstep, self.results['data'])
 
         kill = self.check_if_kill()
         if params.tstep % params.checkpoint == 0 or kill:
-            for key, val in self.checkpoint['data'].items():
-                self.cfile.write(int(key), val)
-                self.cfile.open()
-                self.cfile.f.attrs['tstep'] = params.tstep
-                self.cfile.f.attrs['t'] = params.t
-                self.cfile.close()
+            self.submit(self.write_checkpoint, params.tstep,
+                        self.checkpoint['data'], params.t)
 
             if kill:
+                self.close()
                 sys.exit(1)
 
     def update_components(self, **kw):
         pass
 
+    def submit(self, write, tstep, data, *args):
+        """Write ``data`` using ``write``, possibly through the writer thread"""
+        if self.writer is None:
+            write(tstep, data, *args)
+        else:
+            self.writer.put(write, tstep, data, *args)
+
+    def write_results(self, tstep, data):
+        self.wfile.write(tstep, data, as_scalar=True)
+
+    def write_checkpoint(self, tstep, data, t):
+        for key, val in data.items():
+            self.cfile.write(int(key), val)
+            self.cfile.open()
+            self.cfile.f.attrs['tstep'] = tstep
+            self.cfile.f.attrs['t'] = t
+            self.cfile.close()
+
     def open(self):
         self.cfile.open()
         self.wfile.open()
 
     def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.cfile.iocomm = self.wfile.iocomm = comm
         if self.cfile.f:
             self.cfile.close()
         if self.wfile.f:
@@ -118,3 +151,122 @@ class HDF5File(object):
             return True
         else:
             return False
+
+
+class _File(H5File):
+    """HDF5 file opened on the communicator ``iocomm``
+
+    Same as :func:`shenfun.ShenfunFile` for hdf5, except that the
+    communicator used for MPI-IO may be replaced. The writer thread uses a
+    duplicate of COMM_WORLD, such that its collective calls never interleave
+    with the collectives of the solver.
+    """
+    def __init__(self, name, T, mode='r'):
+        self.iocomm = comm
+        H5File.__init__(self, name+'.h5',
+                        domain=[np.squeeze(d) for d in T.mesh()],
+                        mode=mode)
+
+    def open(self, mode='r+'):
+        import h5py
+        self.f = h5py.File(self.filename, mode, driver="mpio", comm=self.iocomm)
+
+
+class AsyncWriter(object):
+    """Background thread for writing snapshots of spectralDNS data
+
+    Jobs are drained in the order they are submitted, which is the same on
+    all processors. Each job gets its own set of snapshot buffers, taken
+    from a pool of ``nbuffers`` sets. The pool is what bounds the queue:
+    when all buffers are in flight, ``put`` blocks until the writer has
+    released one.
+
+    args:
+        nbuffers    Number of snapshot buffers. 2 gives double buffering
+    """
+
+    def __init__(self, nbuffers=2):
+        assert nbuffers > 0
+        self.comm = comm.Dup()
+        self.error = None
+        self.free = queue.Queue()
+        for _ in range(nbuffers):
+            self.free.put({})
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name='spectralDNS-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    @classmethod
+    def create(cls, nbuffers=2):
+        """Return AsyncWriter, or None if MPI does not allow threaded writes"""
+        if MPI.Query_thread() < MPI.THREAD_MULTIPLE:
+            if comm.Get_rank() == 0:
+                print('MPI not initialized with THREAD_MULTIPLE. Writing synchronously')
+            return None
+        return cls(nbuffers)
+
+    def put(self, write, tstep, data, *args):
+        """Copy ``data`` into a free snapshot buffer and queue ``write``"""
+        self._raise()
+        buffers = self.free.get()
+        self.jobs.put((write, tstep, snapshot(data, buffers), args, buffers))
+
+    def flush(self):
+        """Block until all queued jobs have been written"""
+        self.jobs.join()
+        self._raise()
+
+    def close(self):
+        """Drain queue and stop the writer thread"""
+        self.jobs.put(None)
+        self.thread.join()
+        self.comm.Free()
+        self._raise()
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                self.jobs.task_done()
+                break
+            write, tstep, data, args, buffers = job
+            try:
+                if self.error is None:
+                    write(tstep, data, *args)
+            except Exception as e: #pylint: disable=broad-except
+                self.error = e
+            finally:
+                self.free.put(buffers)
+                self.jobs.task_done()
+
+
+def snapshot(data, buffers):
+    """Return copy of data dictionary, with arrays copied into ``buffers``
+
+    ``data`` is either a results or a checkpoint dictionary (see
+    :class:`HDF5File`). ``buffers`` maps the id of the source arrays to their
+    copies, and is reused for subsequent snapshots of the same data.
+    """
+    if isinstance(data, dict):
+        return {key: snapshot(val, buffers) for key, val in data.items()}
+    fields = []
+    for field in data:
+        if isinstance(field, (tuple, list)):
+            fields.append((_copy(field[0], buffers), field[1]))
+        else:
+            fields.append(_copy(field, buffers))
+    return fields
+
+def _copy(u, buffers):
+    b = buffers.get(id(u))
+    if b is None or b.shape != u.shape or b.dtype != u.dtype:
+        b = buffers[id(u)] = u.copy()
+    else:
+        b[...] = u
+    return b
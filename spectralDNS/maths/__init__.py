@@ -1,3 +1,3 @@
-from .cross import cross1, cross2
-from .maths import project
+from .cross import cross1, cross2, inverse_curl
+from .maths import project, wavenumber_squared, gradient
 from .integrators import getintegrator
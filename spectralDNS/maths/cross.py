@@ -6,9 +6,11 @@ __date__ = "2015-04-07"
 __copyright__ = "Copyright (C) 2015-2018 " + __author__
 __license__ = "GNU Lesser GPL version 3 or any later version"
 
+import numpy as np
 from ..optimization import optimizer
+from .maths import wavenumber_squared
 
-__all__ = ['cross1', 'cross2']
+__all__ = ['cross1', 'cross2', 'inverse_curl']
 
 @optimizer
 def cross1(c, a, b):
@@ -30,3 +32,15 @@ def cross2(c, a, b):
     c = cross1(c, a, b)
     c *= 1j
     return c
+
+@optimizer
+def inverse_curl(c, K, b):
+    """c = 1j*(K x b)/|K|^2, where K is the broadcastable wavenumber mesh
+
+    If b are the Fourier coefficients of the curl of a divergence free
+    field u, then c are the Fourier coefficients of u.
+    """
+    c = cross2(c, K, b)
+    K2 = wavenumber_squared(K)
+    c /= np.where(K2 == 0, 1, K2)
+    return c
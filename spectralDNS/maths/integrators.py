@@ -12,28 +12,116 @@ comm = MPI.COMM_WORLD
 
 __all__ = ['getintegrator']
 
-def adaptiveRK(A, b, bhat, err_order, fY_hat, u0_new, sc, err, fsal, offset,
-               aTOL, rTOL, adaptive, errnorm, rhs, u0, solver, dt, tstep,
-               context, additional_callback, params, predictivecontroller=False):
+# Explicit embedded Runge-Kutta methods. Lower triangular part of A (by row), b,
+# bhat, order of embedded method and whether first stage is same as last.
+# b and bhat are padded with zeros to the number of stages
+explicit_rk_tableaus = {
+    # Bogacki and Shampine (1989), 3(2)
+    'BS3': ([[],
+             [1/2],
+             [0, 3/4],
+             [2/9, 1/3, 4/9]],
+            [2/9, 1/3, 4/9, 0],
+            [7/24, 1/4, 1/3, 1/8], 2, True),
+    # Dormand and Prince (1980), 5(4)
+    'DP5': ([[],
+             [1/5],
+             [3/40, 9/40],
+             [44/45, -56/15, 32/9],
+             [19372/6561, -25360/2187, 64448/6561, -212/729],
+             [9017/3168, -355/33, 46732/5247, 49/176, -5103/18656],
+             [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84]],
+            [35/384, 0, 500/1113, 125/192, -2187/6784, 11/84, 0],
+            [5179/57600, 0, 7571/16695, 393/640, -92097/339200, 187/2100, 1/40], 4, True),
+    # Tsitouras (2011), 5(4)
+    'Tsit5': ([[],
+               [0.161],
+               [-0.008480655492356989, 0.335480655492357],
+               [2.897153057105493, -6.359448489975075, 4.3622954328695815],
+               [5.325864828439257, -11.748883564062828, 7.4955393428898365, -0.09249506636175525],
+               [5.86145544294642, -12.92096931784711, 8.159367898576159, -0.071584973281401, -0.028269050394068383],
+               [0.09646076681806523, 0.01, 0.4798896504144996, 1.379008574103742, -3.290069515436081, 2.324710524099774]],
+              [0.09646076681806523, 0.01, 0.4798896504144996, 1.379008574103742, -3.290069515436081, 2.324710524099774, 0],
+              [0.09824077787029101, 0.010816434459656746, 0.4720087724042376, 1.5237195812770048, -3.872426680888636, 2.7827926300289607, -0.015151515151515152], 4, True),
+    # Bogacki and Shampine (1996), 5(4)
+    'BS5': ([[],
+             [1/6],
+             [2/27, 4/27],
+             [183/1372, -162/343, 1053/1372],
+             [68/297, -4/11, 42/143, 1960/3861],
+             [597/22528, 81/352, 63099/585728, 58653/366080, 4617/20480],
+             [174197/959244, -30942/79937, 8152137/19744439, 666106/1039181, -29421/29068, 482048/414219],
+             [587/8064, 0, 4440339/15491840, 24353/124800, 387/44800, 2152/5985, 7267/94080]],
+            [587/8064, 0, 4440339/15491840, 24353/124800, 387/44800, 2152/5985, 7267/94080, 0],
+            [2479/34992, 0, 123/416, 612941/3411720, 43/1440, 2272/6561, 79937/1113912, 3293/556956], 4, True)
+    }
+
+def explicit_rk_tableau(name, dtype=float):
+    """Return A, b, e = b - bhat, order of embedded method and fsal"""
+    rows, b, bhat, err_order, fsal = explicit_rk_tableaus[name]
+    s = len(rows)
+    A = np.zeros((s, s))
+    for i, row in enumerate(rows):
+        A[i, :len(row)] = row
+    b = np.array(b)
+    e = b - np.array(bhat)
+    return A.astype(dtype), b.astype(dtype), e.astype(dtype), err_order, fsal
+
+@optimizer
+def scaled_error(err, u0, u1, aTOL, rTOL, errnorm, work):
+    """Return local part of error norm
+
+    The error is scaled by sc = aTOL + rTOL*max(|u0|, |u1|). Returns the sum
+    of |err/sc|**2 for errnorm "2" and the max of |err/sc| for "inf". work
+    is a real array of shape (2,)+u0.shape
     """
-    Take a step using any Runge-Kutta method.
+    sc, x = work
+    np.abs(u0, out=sc)
+    np.abs(u1, out=x)
+    np.maximum(sc, x, out=sc)
+    sc *= rTOL
+    sc += aTOL
+    np.abs(err, out=x)
+    x /= sc
+    if errnorm == "inf":
+        return x.max(initial=0)
+    x = x.ravel()
+    return np.dot(x, x)
+
+def adaptiveRK(A, b, e, err_order, stages, u1, err, work, fsal, state, aTOL,
+               rTOL, adaptive, errnorm, controller, rhs, u0, solver, dt,
+               context, additional_callback):
+    """
+    Take a step using any explicit embedded Runge-Kutta method.
+
     Parameters
     ----------
-    A, b, bhat : arrays
+    A, b : arrays
         Runge-Kutta coefficients
+    e : array
+        Error coefficients, b - bhat
     err_order : int
         Order of embedded method
-    fY_hat, U_tmp, u0_new, sc, err : work arrays
+    stages : list of arrays
+        The s stage derivatives. The list is rotated for FSAL methods, such
+        that the last stage of an accepted step becomes the first of the next
+    u1, err, work : work arrays
     fsal : boolean
         Whether method is first-same-as-last
-    offset : length-1 array of int
-        Where to find the previous RHS evaluation (for FSAL methods).  This can probably be eliminated.
+    state : dict
+        Holds 'N', the global number of unknowns, 'est', the error estimate
+        of the last accepted step, and 'fsal', whether stages[0] holds the
+        derivative of u0. Note that if u0 is modified between steps, then
+        state['fsal'] must be set to False
     aTOL, rTOL : float
         Error tolerances
     adaptive : boolean
         If true, adapt the step size
     errnorm : str
-        Which norm to use in computing the error estimate.  One of {"2", "inf"}.
+        Which norm to use in computing the error estimate. One of {"2", "inf"}
+    controller : str
+        Step size controller. "I" for the classical controller, "PI" for the
+        proportional-integral controller of Gustafsson (1991)
     rhs : array
         RHS evaluation
     u0 : array
@@ -42,109 +130,277 @@ def adaptiveRK(A, b, bhat, err_order, fY_hat, u0_new, sc, err, fsal, offset,
         contains method ComputeRHS for computing RHS of evolution equation
     dt : float
         time step size
-    tstep : int
-        Number of steps taken so far
-    predictivecontroller : boolean
-        If True use PI controller
+
+    The error norm is computed in one pass and reduced with a single
+    Allreduce. See p167, Hairer, Norsett and Wanner. "Solving Ordinary
+    Differential Equations 1" for details on the step size control.
     """
     s = A.shape[0]
-
-    #Some parameters for adaptive time-stepping. See p167, Hairer, Norsett and Wanner. "Solving Ordinary Differential Equations 1"
-    #for details.
-    facmax_default = 2
-    facmax = facmax_default
-    fac = 0.8
-    facmin = 0.01
+    fac, facmin, facmax = 0.8, 0.01, 2
+    k = err_order + 1
 
     #We may need to repeat the time-step until a small enough value is used.
     while True:
-        dt_prev = dt
-        if fsal:
-            offset[0] = (offset[0] - 1) % s
-        for i in range(0, s):
-            if not fsal or (tstep == 0 or i != 0):
-                fY_hat[(i + offset[0]) % s] = u0
-                for j in range(0, i):
-                    fY_hat[(i+offset[0]) % s] += dt*A[i, j]*fY_hat[(j+offset[0]) % s]
-                #Compute F(Y)
-                rhs = solver.ComputeRHS(rhs, fY_hat[(i+offset[0]) % s], solver, **context)
-                fY_hat[(i+offset[0]) % s] = rhs
+        for i in range(s):
+            if i > 0 or not (fsal and state['fsal']):
+                u1[:] = u0
+                for j in range(i):
+                    if A[i, j] != 0:
+                        u1 += (dt*A[i, j])*stages[j]
+                rhs = solver.ComputeRHS(rhs, u1, solver, **context)
+                stages[i][:] = rhs
 
             if i == 0:
-                context.fu0 = fY_hat[(0+offset[0]) % s]
+                context.fu0 = stages[0]
                 additional_callback(context)
 
-        #Calculate the new value
-        u0_new[:] = u0
-        u0_new[:] += dt*b[0]*fY_hat[(0+offset[0]) % s]
-        err[:] = dt*(b[0] - bhat[0])*fY_hat[(0+offset[0]) % s]
-
-        for j in range(1, s):
-            u0_new[:] += dt*b[j]*fY_hat[(j+offset[0])%s]
-            err[:] += dt*(b[j] - bhat[j])*fY_hat[(j+offset[0])%s]
-
-        est = 0.0
-        sc[:] = aTOL + np.maximum(np.abs(u0), np.abs(u0_new))*rTOL
-        if errnorm == "2":
-            est_to_bcast = None
-            nsquared = np.zeros(u0.shape[0])
-            for k in range(u0.shape[0]):
-                nsquared[k] = comm.reduce(np.sum(np.power(np.abs(err[k]/sc[k]), 2)))
-            if comm.Get_rank() == 0:
-                est_to_bcast = np.zeros(1)
-                est = np.max(np.sqrt(nsquared))
-                est /= np.sqrt(np.array(context.T.shape(True)).prod())
-                est_to_bcast[0] = est
-            est_to_bcast = comm.bcast(est_to_bcast, root=0)
-            est = est_to_bcast[0]
-
-        elif errnorm == "inf":
-            raise AssertionError("Don't use this, not sure if it works")
-            #TODO: Test this error norm
-            sc[:] = aTOL + np.maximum(np.abs(u0), np.abs(u0_new))*rTOL
-            err[:] = err[:] / sc[:]
-            err = np.abs(err, out=err)
-            asdf = np.max(err)
-            x = np.zeros(asdf.shape)
-            comm.Allreduce(asdf, x, op=MPI.MAX)
-            est = np.abs(np.max(x))
-            est /= np.sqrt(np.array(context.T.shape(True)).prod())
-        else:
-            assert False, "Wrong error norm"
+        if not fsal:
+            # For fsal methods the last stage is computed from the new solution
+            u1[:] = u0
+            for j in range(s):
+                if b[j] != 0:
+                    u1 += (dt*b[j])*stages[j]
 
-        #Check error estimate
-        exponent = 1.0 / (err_order + 1)
-        if not predictivecontroller:
-            factor = min(facmax, max(facmin, fac*pow((1/est), exponent)))
-        else:
-            if "last_dt" not in vars(params):
-                params.last_dt = dt
-            if "last_est" not in vars(params):
-                params.last_est = est
-
-            last_dt = params.last_dt
-            last_est = params.last_est
-            factor = min(facmax, max(facmin, fac*pow((1/est), exponent)*dt/last_dt*pow(last_est/est, exponent)))
-        if adaptive:
+        if not adaptive:
+            break
+
+        err[:] = 0
+        for j in range(s):
+            if e[j] != 0:
+                err += (dt*e[j])*stages[j]
+        est = np.array([scaled_error(err, u0, u1, aTOL, rTOL, errnorm, work)])
+        comm.Allreduce(MPI.IN_PLACE, est, op=MPI.MAX if errnorm == "inf" else MPI.SUM)
+        est = est[0] if errnorm == "inf" else np.sqrt(est[0]/state['N'])
+        est = max(est, 1e-16)
+
+        factor = fac*pow(1/est, 1/k)
+        if controller == "PI":
+            factor = fac*pow(1/est, 0.7/k)*pow(state['est'], 0.4/k)
+        factor = min(facmax, max(facmin, factor))
+
+        if est > 1.0:
+            facmax = 1
+            context.is_step_rejected_callback = True
+            context.dt_rejected = dt
             dt = dt*factor
-            if  est > 1.0:
-                facmax = 1
-                context.is_step_rejected_callback = True
-                context.dt_rejected = dt_prev
-                additional_callback(context)
-                #The offset gets decreased in the  next step, which is something we do not want.
-                if fsal:
-                    offset[0] += 1
-                continue
-
-        #if predictivecontroller:
-            #context.time_integrator["last_dt"] = dt_prev
-            #context.time_integrator["last_est"] = est
+            additional_callback(context)
+            continue
+
+        state['est'] = est
         break
 
     #Update u0 and U
-    u0[:] = u0_new
-    return u0, dt, dt_prev
+    u0[:] = u1
+    if fsal:
+        stages.insert(0, stages.pop())
+        state['fsal'] = True
+    return u0, dt*factor if adaptive else dt, dt
+
+def lowstorage_tableau(name, dtype=float):
+    """Return coefficients of low-storage (2N) Runge-Kutta method
+
+    The methods are on the form of Williamson (1980)::
+
+        du = a[i]*du + dt*F(u)
+        u = u + b[i]*du,    i = 0, 1, ..., s-1
+
+    which requires only two registers, u and du. The embedded methods of
+    one order lower use the same stages, but not the second. Their weights
+    are computed from the order conditions of the equivalent Butcher form.
+    The error of the embedded method is then obtained as sum(e[i]*du_i),
+    and requires a third register.
+
+    Returns a, b, e and order of the embedded method.
+    """
+    a, b, order = {
+        # Williamson (1980), 3 stages, third order
+        'RK3_2N': ([0, -5/9, -153/128],
+                   [1/3, 15/16, 8/15], 3),
+        # Carpenter and Kennedy (1994), 5 stages, fourth order
+        'RK4_2N': ([0, -567301805773/1357537059087,
+                    -2404267990393/2016746695238,
+                    -3550918686646/2091501179385,
+                    -1275806237668/842570457699],
+                   [1432997174477/9575080441755,
+                    5161836677717/13612068292357,
+                    1720146321549/2090206949498,
+                    3134564353537/4481467310338,
+                    2277821191437/14882151754819], 4)}[name]
+    a, b = np.array(a), np.array(b)
+    s = len(a)
+
+    # Butcher form: du_i = sum_j P[i, j]*dt*F_j, with P[i, j] = prod(a[j+1:i+1])
+    P = np.zeros((s, s))
+    for i in range(s):
+        for j in range(i+1):
+            P[i, j] = np.prod(a[j+1:i+1])
+    A = np.zeros((s, s))
+    for i in range(s):
+        for j in range(i):
+            A[i, j] = np.dot(b[j:i], P[j:i, j])
+    bb = np.dot(b, P)
+    c = A.sum(1)
+
+    # Order conditions of embedded method, not using the second stage
+    cond = [(np.ones(s), 1), (c, 1/2), (c**2, 1/3), (np.dot(A, c), 1/6)]
+    cond = cond[:{2: 2, 3: 4}[order-1]]
+    M = np.array([m for m, _ in cond])
+    r = np.array([v for _, v in cond])
+    ix = [i for i in range(s) if i != 1]
+    bhat = np.zeros(s)
+    bhat[ix] = np.linalg.lstsq(M[:, ix], r, rcond=None)[0]
+
+    # Error as linear combination of the du registers: P^T e = b - bhat
+    e = np.linalg.solve(P.T, bb - bhat)
+    return a.astype(dtype), b.astype(dtype), e.astype(dtype), order-1
+
+@optimizer
+def RK2N(u0, u1, rhs, a, b, dt, solver, context):
+    """Low-storage (2N) Runge Kutta. See lowstorage_tableau"""
+    for rk in range(a.shape[0]):
+        rhs = solver.ComputeRHS(rhs, u0, solver, **context)
+        if rk == 0:
+            u1[:] = dt*rhs
+        else:
+            u1 *= a[rk]
+            u1 += dt*rhs
+        u0 += b[rk]*u1
+    return u0, dt, dt
+
+@optimizer
+def RK2N_embedded(u0, u1, err, rhs, a, b, e, dt, solver, context):
+    """Low-storage (2N) Runge Kutta, with error of embedded method in err"""
+    for rk in range(a.shape[0]):
+        rhs = solver.ComputeRHS(rhs, u0, solver, **context)
+        if rk == 0:
+            u1[:] = dt*rhs
+            err[:] = e[rk]*u1
+        else:
+            u1 *= a[rk]
+            u1 += dt*rhs
+            err += e[rk]*u1
+        u0 += b[rk]*u1
+    return u0, dt, dt
+
+def lowstorageRK(u0, u1, u2, err, work, state, rhs, a, b, e, err_order, aTOL,
+                 rTOL, errnorm, dt, solver, context, additional_callback):
+    """Take one step with embedded low-storage Runge Kutta
+
+    The solution at the start of the step is kept in u2, such that a step
+    with an error estimate above tolerance is rejected and repeated with a
+    smaller time step, like in adaptiveRK. The error norm is computed in one
+    pass by scaled_error and reduced with a single Allreduce. The real work
+    array work of shape (2,)+u0.shape is a view of the register u1, that is
+    free once the step is taken, such that the adaptive method holds the
+    three registers u1, u2 and err besides u0. state['N'] is the global
+    number of unknowns.
+
+    Returns u0, next dt and dt used for the step.
+    """
+    fac, facmin, facmax = 0.8, 0.2, 2
+    k = err_order + 1
+    u2[:] = u0
+    while True:
+        u0, _, dt_took = RK2N_embedded(u0, u1, err, rhs, a, b, e, dt, solver, context)
+
+        est = np.array([scaled_error(err, u2, u0, aTOL, rTOL, errnorm, work)])
+        comm.Allreduce(MPI.IN_PLACE, est, op=MPI.MAX if errnorm == "inf" else MPI.SUM)
+        est = est[0] if errnorm == "inf" else np.sqrt(est[0]/state['N'])
+        est = max(est, 1e-16)
+        factor = min(facmax, max(facmin, fac*pow(1/est, 1/k)))
+        if est <= 1.0:
+            return u0, dt*factor, dt_took
+
+        # Reject step and repeat from the start with smaller dt
+        facmax = 1
+        context.is_step_rejected_callback = True
+        context.dt_rejected = dt
+        dt = dt*factor
+        u0[:] = u2
+        additional_callback(context)
+
+def _etd_functions(z):
+    ez = np.exp(z)
+    z3 = z**3
+    return ((np.exp(z/2)-1)/z,
+            (-4-z+ez*(4-3*z+z**2))/z3,
+            (2+z+ez*(z-2))/z3,
+            (-4-3*z-z**2+ez*(4-z))/z3)
+
+def etdrk4_coefficients(L, dt, dtype=float, M=32):
+    """Return coefficients of ETDRK4 for diagonal linear operator L
+
+    The coefficients of Cox and Matthews (2002) suffer from cancellation
+    errors for small |L dt|. Following Kassam and Trefethen (2005) they are
+    there computed as the mean over M points on a unit circle around L dt.
+    The functions are evaluated once for each unique value of L dt.
+
+    Returns E = exp(L dt), E2 = exp(L dt/2), Q = (E2-1)/L and f1, f2, f3
+    """
+    z = np.asarray(L, dtype=float)*dt
+    zu, inv = np.unique(z.ravel(), return_inverse=True)
+    small = abs(zu) < 1
+    g = np.zeros((4, zu.size))
+    g[:, ~small] = _etd_functions(zu[~small])
+    r = np.exp(1j*np.pi*(np.arange(M)+0.5)/M)
+    g[:, small] = np.mean(_etd_functions(zu[small, None]+r), axis=-1).real
+    g = dt*g[:, inv].reshape((4,)+z.shape)
+    return tuple(c.astype(dtype) for c in (np.exp(z), np.exp(z/2)) + tuple(g))
+
+def ifrk4_coefficients(L, dt, dtype=float):
+    """Return coefficients E = exp(L dt) and E2 = exp(L dt/2) of IFRK4"""
+    z = np.asarray(L, dtype=float)*dt
+    return np.exp(z).astype(dtype), np.exp(z/2).astype(dtype)
+
+def nonlinear(rhs, u, L, solver, context):
+    """Return nonlinear part N(u) = rhs(u) - L u of the right hand side"""
+    rhs = solver.ComputeRHS(rhs, u, solver, **context)
+    rhs -= L*u
+    return rhs
+
+def IFRK4(u0, u1, u2, rhs, L, E, E2, dt, solver, context):
+    """Integrating factor Runge Kutta 4 for du/dt = L u + N(u)
+
+    Classical RK4 applied to v = exp(-L t) u (Lawson, 1967). The linear
+    operator L is diagonal and treated exactly. See solver.linear_operator
+
+    Note that the accuracy is reduced for strongly damped modes that are
+    forced by N. ETDRK4 does not have this problem.
+    """
+    rhs = nonlinear(rhs, u0, L, solver, context)
+    u2[:] = E*rhs
+    u1[:] = E2*(u0 + 0.5*dt*rhs)
+    rhs = nonlinear(rhs, u1, L, solver, context)
+    u2 += 2*E2*rhs
+    u1[:] = E2*u0 + 0.5*dt*rhs
+    rhs = nonlinear(rhs, u1, L, solver, context)
+    u2 += 2*E2*rhs
+    u1[:] = E*u0 + dt*E2*rhs
+    rhs = nonlinear(rhs, u1, L, solver, context)
+    u2 += rhs
+    u0 *= E
+    u0 += dt/6*u2
+    return u0, dt, dt
+
+def ETDRK4(u0, u1, u2, N0, N1, rhs, L, E, E2, Q, f1, f2, f3, dt, solver,
+           context):
+    """Exponential time differencing Runge Kutta 4 for du/dt = L u + N(u)
+
+    The method of Cox and Matthews (2002). The linear operator L is diagonal
+    and treated exactly. See solver.linear_operator and etdrk4_coefficients
+    """
+    N0 = nonlinear(N0, u0, L, solver, context)
+    u1[:] = E2*u0 + Q*N0
+    N1 = nonlinear(N1, u1, L, solver, context)
+    u2[:] = E2*u0 + Q*N1
+    rhs = nonlinear(rhs, u2, L, solver, context)
+    N1 += rhs
+    u1 *= E2
+    u1 += Q*(2*rhs - N0)
+    rhs = nonlinear(rhs, u1, L, solver, context)
+    u0 *= E
+    u0 += f1*N0 + 2*f2*N1 + f3*rhs
+    return u0, dt, dt
 
 @optimizer
 def RK4(u0, u1, u2, rhs, a, b, dt, solver, context):
@@ -178,52 +434,35 @@ def getintegrator(rhs, u0, solver, context):
     """Return integrator using choice in global parameter integrator.
     """
     params = solver.params
-    u1 = u0.copy()
 
     if params.integrator == "RK4":
         # RK4 parameters
         a = np.array([1./6., 1./3., 1./3., 1./6.], dtype=context.float)
         b = np.array([0.5, 0.5, 1.], dtype=context.float)
+        u1 = u0.copy()
         u2 = u0.copy()
         @wraps(RK4)
         def func():
             return RK4(u0, u1, u2, rhs, a, b, params.dt, solver, context)
         return func
 
-    elif params.integrator in ("BS5_adaptive", "BS5_fixed"):
-        # Remove nodepy dependency since it requires matplotlib and six
-        #import nodepy
-        #A = nodepy.rk.loadRKM("BS5").A.astype(context.float)
-        #b = nodepy.rk.loadRKM("BS5").b.astype(context.float)
-        #bhat = nodepy.rk.loadRKM("BS5").bhat.astype(context.float)
-        A = np.array([[0, 0, 0, 0, 0, 0, 0, 0],
-                      [1/6, 0, 0, 0, 0, 0, 0, 0],
-                      [2/27, 4/27, 0, 0, 0, 0, 0, 0],
-                      [183/1372, -162/343, 1053/1372, 0, 0, 0, 0, 0],
-                      [68/297, -4/11, 42/143, 1960/3861, 0, 0, 0, 0],
-                      [597/22528, 81/352, 63099/585728, 58653/366080, 4617/20480, 0, 0, 0],
-                      [174197/959244, -30942/79937, 8152137/19744439, 666106/1039181, -29421/29068, 482048/414219, 0, 0],
-                      [587/8064, 0, 4440339/15491840, 24353/124800, 387/44800, 2152/5985, 7267/94080, 0]], dtype=context.float)
-        b = np.array([587/8064, 0, 4440339/15491840, 24353/124800, 387/44800, 2152/5985, 7267/94080, 0], dtype=context.float)
-        bhat = np.array([2479/34992, 0, 123/416, 612941/3411720, 43/1440, 2272/6561, 79937/1113912, 3293/556956], dtype=context.float)
-        err_order = 4
-        errnorm = "2"
-        fsal = True
-        adaptive = True if params.integrator == "BS5_adaptive" else False
-
-        #Offset for fsal stuff. #TODO: infer this from tstep
-        offset = [0]
-        s = A.shape[0]
-        fY_hat = np.zeros((s,) + u0.shape, dtype=u0.dtype)
-        sc = np.zeros_like(u0)
+    elif params.integrator.rsplit("_", 1)[0] in explicit_rk_tableaus:
+        name, kind = params.integrator.rsplit("_", 1)
+        A, b, e, err_order, fsal = explicit_rk_tableau(name, context.float)
+        stages = list(np.zeros((A.shape[0],) + u0.shape, dtype=u0.dtype))
+        u1 = np.zeros_like(u0)
         err = np.zeros_like(u0)
+        work = np.zeros((2,) + u0.shape, dtype=context.float)
+        state = {'N': comm.allreduce(u0.size), 'est': 1., 'fsal': False}
+        adaptive = kind == "adaptive"
 
         @wraps(adaptiveRK)
         def func():
-            return adaptiveRK(A, b, bhat, err_order, fY_hat, u1, sc, err, fsal,
-                              offset, params.TOL, params.TOL, adaptive, errnorm,
-                              rhs, u0, solver, params.dt, params.tstep, context,
-                              solver.additional_callback, params)
+            return adaptiveRK(A, b, e, err_order, stages, u1, err, work, fsal,
+                              state, params.TOL, params.TOL, adaptive,
+                              params.errnorm, params.controller, rhs, u0,
+                              solver, params.dt, context,
+                              solver.additional_callback)
         return func
 
     elif params.integrator == "ForwardEuler":
@@ -232,7 +471,64 @@ def getintegrator(rhs, u0, solver, context):
             return ForwardEuler(u0, rhs, params.dt, solver, context)
         return func
 
+    elif params.integrator in ("RK3_2N", "RK4_2N"):
+        a, b, e, err_order = lowstorage_tableau(params.integrator, context.float)
+        u1 = np.zeros_like(u0)
+        @wraps(RK2N)
+        def func():
+            return RK2N(u0, u1, rhs, a, b, params.dt, solver, context)
+        return func
+
+    elif params.integrator in ("RK3_2N_adaptive", "RK4_2N_adaptive"):
+        a, b, e, err_order = lowstorage_tableau(params.integrator[:6], context.float)
+        u1 = np.zeros_like(u0)
+        u2 = np.zeros_like(u0)
+        err = np.zeros_like(u0)
+        if np.iscomplexobj(u1):
+            work = np.asarray(u1).view(context.float).reshape((2,) + u0.shape)
+        else:
+            work = np.zeros((2,) + u0.shape, dtype=context.float)
+        state = {'N': comm.allreduce(u0.size)}
+        @wraps(lowstorageRK)
+        def func():
+            return lowstorageRK(u0, u1, u2, err, work, state, rhs, a, b, e,
+                                err_order, params.TOL, params.TOL, params.errnorm,
+                                params.dt, solver, context,
+                                solver.additional_callback)
+        return func
+
+    elif params.integrator in ("IFRK4", "ETDRK4"):
+        L = solver.linear_operator(context)
+        u1 = np.zeros_like(u0)
+        u2 = np.zeros_like(u0)
+        cache = {}
+        def coefficients(dt):
+            # Cached, since dt is modified by adaptive solvers and end_of_tstep
+            if dt not in cache:
+                if len(cache) == 4:
+                    cache.pop(next(iter(cache)))
+                coef = {"IFRK4": ifrk4_coefficients,
+                        "ETDRK4": etdrk4_coefficients}[params.integrator]
+                cache[dt] = coef(L, dt, context.float)
+            return cache[dt]
+
+        if params.integrator == "IFRK4":
+            @wraps(IFRK4)
+            def func():
+                return IFRK4(u0, u1, u2, rhs, L, *coefficients(params.dt),
+                             params.dt, solver, context)
+            return func
+
+        N0 = np.zeros_like(u0)
+        N1 = np.zeros_like(u0)
+        @wraps(ETDRK4)
+        def func():
+            return ETDRK4(u0, u1, u2, N0, N1, rhs, L, *coefficients(params.dt),
+                          params.dt, solver, context)
+        return func
+
     elif params.integrator == "AB2":
+        u1 = u0.copy()
         @wraps(AB2)
         def func():
             return AB2(u0, u1, rhs, params.dt, params.tstep, solver, context)
@@ -3,9 +3,49 @@ __date__ = "2015-04-07"
 __copyright__ = "Copyright (C) 2015-2018 " + __author__
 __license__ = "GNU Lesser GPL version 3 or any later version"
 
-__all__ = ['project']
+import numpy as np
+from ..optimization import optimizer
 
-def project(u, K, K_over_K2):
+__all__ = ['project', 'wavenumber_squared', 'gradient']
+
+def wavenumber_squared(K, out=None):
+    """Return |K|^2 of the broadcastable wavenumber mesh K
+
+    K is the list of 1D broadcastable wavenumbers returned by
+    local_wavenumbers. The returned array is full size. In the right hand
+    sides it is computed in place in out, a real work array of the spectral
+    shape, and should only be used as a temporary.
+    """
+    if out is None:
+        K2 = K[0]*K[0]
+        for k in K[1:]:
+            K2 = K2 + k*k
+        return K2
+    K2 = np.multiply(K[0], K[0], out=out)
+    for k in K[1:]:
+        K2 += k*k
+    return K2
+
+@optimizer
+def project(u, K):
     """Project u onto divergence free space"""
-    u -= sum(K_over_K2*u, 0)*K
+    K2 = wavenumber_squared(K)
+    div = K[0]*u[0]
+    for i in range(1, len(K)):
+        div += K[i]*u[i]
+    div /= np.where(K2 == 0, 1, K2)
+    for i in range(len(K)):
+        u[i] -= div*K[i]
     return u
+
+@optimizer
+def gradient(c, K, a):
+    """c[i*dim+j] = 1j*K[j]*a[i], i.e., the gradient of all components of a
+
+    c has shape (len(a)*dim,)+a.shape[1:]
+    """
+    dim = len(K)
+    for i in range(a.shape[0]):
+        for j in range(dim):
+            np.multiply(a[i], 1j*K[j], out=c[i*dim+j])
+    return c
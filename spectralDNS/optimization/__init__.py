@@ -5,10 +5,38 @@ __license__ = "GNU Lesser GPL version 3 or any later version"
 
 import importlib
 from functools import wraps
+import numpy as np
 from spectralDNS import config
 
 #pylint: disable=bare-except,no-member
 
+# All functions decorated with optimizer, used by coverage
+_registry = {}
+
+def _optimized(name, precision, optimization=None):
+    """Return optimized version of function name for given precision
+
+    The implementation is taken from the backend optimization, which
+    defaults to config.params.optimization.
+    """
+    optimization = optimization or config.params.optimization
+    mod = get_backend(optimization, precision)
+
+    # Check for generic implementation first, then solver specific
+    if len(config.params.N) == 2:
+        fun = getattr(mod, name+"_2D", None)
+
+    else:
+        fun = getattr(mod, name, None)
+
+    if not fun:
+        fun = getattr(mod, name+"_"+config.params.solver, None)
+
+    if not fun and hasattr(config, 'mesh'):
+        fun = getattr(mod, name+"_"+config.mesh, None)
+
+    return fun
+
 def optimizer(func):
     """Decorator used to wrap calls to optimized versions of functions.
 
@@ -20,30 +48,41 @@ def optimizer(func):
     is an optimized version of "add_pressure_diffusion" for the
     NS solver.
 
+    In mixed precision both the single and double precision versions
+    are looked up, and the call is dispatched on the datatype of the
+    first array argument.
+
+    With optimization 'autotune' the fastest available implementation is
+    chosen on the first call, see spectralDNS.optimization.autotune.
+
     """
+    _registry['.'.join((func.__module__, func.__name__))] = func
 
-    try: # Look for optimized version of function
-        mod = globals()["_".join((config.params.optimization,
-                                  config.params.precision))]
+    if config.params.optimization == "autotune":
+        from .autotune import Autotuned
+        return Autotuned(func)
 
-        # Check for generic implementation first, then solver specific
+    try: # Look for optimized version of function
         name = func.__name__
-        if len(config.params.N) == 2:
-            fun = getattr(mod, name+"_2D", None)
+        if config.params.precision == "mixed":
+            fun_single = _optimized(name, "single")
+            fun_double = _optimized(name, "double")
+            assert fun_single and fun_double
+
+            @wraps(func)
+            def wrapped_function(*args, **kwargs):
+                a = next(a for a in args if isinstance(a, np.ndarray))
+                if a.dtype in (np.float32, np.complex64):
+                    return fun_single(*args, **kwargs)
+                return fun_double(*args, **kwargs)
 
         else:
-            fun = getattr(mod, name, None)
+            fun = _optimized(name, config.params.precision)
 
-        if not fun:
-            fun = getattr(mod, name+"_"+config.params.solver, None)
-
-        if not fun:
-            fun = getattr(mod, name+"_"+config.mesh, None)
-
-        @wraps(func)
-        def wrapped_function(*args, **kwargs):
-            u0 = fun(*args, **kwargs)
-            return u0
+            @wraps(func)
+            def wrapped_function(*args, **kwargs):
+                u0 = fun(*args, **kwargs)
+                return u0
 
     except: # Otherwise revert to default numpy implementation
         print(func.__name__ + ' not optimized')
@@ -54,26 +93,110 @@ def optimizer(func):
 
     return wrapped_function
 
-try:
-    from . import cython_double, cython_single
-
-except:
-    pass
-
-try:
-    from . import numba_module as numba_single
-    from . import numba_module as numba_double
-except:
-    pass
+# Backend modules, imported on first use by get_backend
+_modules = {'cython_single': 'cython_single',
+            'cython_double': 'cython_double',
+            'numba_single': 'numba_module',
+            'numba_double': 'numba_module',
+            'numexpr_single': 'numexpr_module',
+            'numexpr_double': 'numexpr_module',
+            'pythran_single': 'pythran_module',
+            'pythran_double': 'pythran_module'}
+_backends = {}
+
+def get_backend(optimization, precision):
+    """Return module with the optimized functions of a backend
+
+    The module is imported on the first call. Raises ImportError if the
+    backend is unknown or cannot be imported, e.g., since numba is not
+    installed or the cython extensions are not compiled.
+    """
+    name = "_".join((optimization, precision))
+    if name not in _backends:
+        try:
+            _backends[name] = importlib.import_module('.'+_modules[name], __name__)
+            if hasattr(_backends[name], 'set_threads'):
+                _backends[name].set_threads(config.params.get('threads', 1))
+        except (KeyError, ImportError):
+            _backends[name] = None
+    if _backends[name] is None:
+        raise ImportError('Optimization {} not available'.format(name))
+    return _backends[name]
+
+def set_threads(threads):
+    """Set number of threads used by the kernels of all loaded backends
+
+    The threaded kernels (numba prange, and OpenMP loops in cython and
+    pythran) share params.threads with the FFTs. With MPI, threads is the
+    number of threads per processor.
+    """
+    for mod in set(_backends.values()):
+        if mod is not None and hasattr(mod, 'set_threads'):
+            mod.set_threads(threads)
 
-try:
-    from . import numexpr_module
+_all_backends = ('numexpr', 'numba', 'cython', 'pythran')
 
-except:
-    pass
+def _used_by(func, solver):
+    """Return whether solver uses func
 
-try:
-    from . import pythran_module as pythran_single
-    from . import pythran_module as pythran_double
-except:
-    pass
+    Generic functions in spectralDNS.maths are available to all solvers,
+    solver specific functions must be found in the solver's namespace.
+    """
+    if func.__module__.startswith('spectralDNS.maths'):
+        return True
+    wrapped = getattr(solver, func.__name__, None)
+    return getattr(wrapped, '__wrapped__', wrapped) is func
+
+def coverage(solver):
+    """Return dictionary of backend coverage of the functions used by solver
+
+    For each function decorated with optimizer the dictionary holds, for
+    each backend, True if an optimized version exists for the current
+    solver, dimensions and precision, False if not, and None if the backend
+    is not available.
+    """
+    precision = config.params.precision
+    precisions = ('single', 'double') if precision == 'mixed' else (precision,)
+    cov = {}
+    for key in sorted(_registry):
+        func = _registry[key]
+        if not _used_by(func, solver):
+            continue
+        cov[key] = {}
+        for backend in _all_backends:
+            try:
+                cov[key][backend] = all(bool(_optimized(func.__name__, p, backend))
+                                        for p in precisions)
+            except ImportError:
+                cov[key][backend] = None
+    return cov
+
+def unoptimized(solver):
+    """Return names of the functions that run with numpy for current flags"""
+    optimization = config.params.optimization
+    if optimization == 'autotune':
+        return []
+    cov = coverage(solver)
+    return [key for key, c in cov.items() if not c.get(optimization)]
+
+def coverage_report(solver):
+    """Return table of the backend coverage of the functions used by solver
+
+    Each backend is marked 'x' if the function is optimized, '-' if not and
+    'n/a' if the backend is not available. Functions that run unoptimized
+    with the current optimization are listed at the end.
+    """
+    params = config.params
+    cov = coverage(solver)
+    mark = {True: 'x', False: '-', None: 'n/a'}
+    lines = ['{} ({}, {} precision, optimization {})'.format(
+        params.solver, 'x'.join(str(n) for n in params.N), params.precision,
+        params.optimization or 'none')]
+    lines.append('{:55s}'.format('function')+''.join('{:>9s}'.format(b) for b in _all_backends))
+    for key, c in cov.items():
+        lines.append('{:55s}'.format(key)+''.join('{:>9s}'.format(mark[c[b]]) for b in _all_backends))
+    if params.optimization:
+        missing = unoptimized(solver)
+        lines.append('Unoptimized with {}: {}'.format(params.optimization,
+                                                      ', '.join(missing) or 'none'))
+    return '\n'.join(lines)
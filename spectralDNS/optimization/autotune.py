@@ -0,0 +1,201 @@
+"""
+Module for autotuning the optimized kernels of spectralDNS
+
+With ``--optimization autotune`` every function decorated with ``optimizer``
+is timed with all available implementations (numpy, numexpr, numba, cython
+and pythran) on the first call with a new shape and datatype, that is, on
+the actual arrays of the solver. Each implementation is run on copies of
+the arguments, and is rejected if it fails or if its result differs from
+numpy. The fastest implementation is used for all subsequent calls. If not
+even numpy succeeds, the first available of ``preferred`` is used, and
+nothing is cached.
+
+The winners are stored per (function, shape, dtype, threads). With
+``params.autotune_cache`` set to a folder, each processor stores its
+winners there, and the benchmarks are skipped in later runs.
+"""
+import os
+import json
+import types
+import tempfile
+from time import perf_counter
+from functools import update_wrapper
+import numpy as np
+from mpi4py import MPI
+from spectralDNS import config
+
+__all__ = ['Autotuned', 'report']
+
+comm = MPI.COMM_WORLD
+
+backends = ('numpy', 'numexpr', 'numba', 'cython', 'pythran')
+
+# Used for functions that cannot be benchmarked on copies of their
+# arguments, like the integrators that call back into the solver
+preferred = ('cython', 'pythran', 'numba', 'numexpr', 'numpy')
+
+_winners = {}
+_loaded = []
+_report = {}
+
+def _cache_file(path, rank):
+    return os.path.join(path, 'autotune{}.json'.format(rank))
+
+def _load(path):
+    """Read winners stored by all processors in folder path"""
+    if not os.path.isdir(path):
+        return
+    for fname in sorted(os.listdir(path)):
+        if fname.startswith('autotune') and fname.endswith('.json'):
+            with open(os.path.join(path, fname)) as f:
+                _winners.update(json.load(f))
+
+def _save(path):
+    os.makedirs(path, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(_winners, f, indent=2, sort_keys=True)
+    os.replace(tmp, _cache_file(path, comm.Get_rank()))
+
+def _copy(a):
+    if isinstance(a, np.ndarray):
+        return a.copy()
+    if isinstance(a, (list, tuple)):
+        return type(a)(_copy(x) for x in a)
+    return a
+
+def _arrays(args):
+    """Return list of all arrays in args, also inside lists and tuples"""
+    arrays = []
+    for a in args:
+        if isinstance(a, np.ndarray):
+            arrays.append(a)
+        elif isinstance(a, (list, tuple)):
+            arrays += _arrays(a)
+    return arrays
+
+def _benchmarkable(args):
+    # Dictionaries of work arrays are shared, but the solver and its context
+    # cannot be copied
+    return not any(isinstance(a, (types.ModuleType, config.AttributeDict))
+                   for a in args)
+
+def _allclose(a, b):
+    rtol = 1e-4 if a.dtype in (np.float32, np.complex64) else 1e-10
+    return a.shape == b.shape and np.allclose(a, b, rtol=rtol,
+                                              atol=rtol*np.abs(b).max(initial=0))
+
+class Autotuned(object):
+    """Function dispatching to the fastest available implementation of func
+
+    args:
+        func         The numpy implementation of a function decorated with
+                     optimizer
+        repeats      Number of timed calls of each implementation
+    """
+    def __init__(self, func, repeats=3):
+        update_wrapper(self, func)
+        self.func = func
+        self.name = '.'.join((func.__module__, func.__name__))
+        self.repeats = repeats
+        self._functions = {}
+
+    def __call__(self, *args, **kwargs):
+        arrays = _arrays(args)
+        key = (arrays[0].shape, arrays[0].dtype.str) if arrays else None
+        fun = self._functions.get(key)
+        if fun is None:
+            fun = self._functions[key] = self._tune(key, args, kwargs)
+        return fun(*args, **kwargs)
+
+    def candidates(self, precision):
+        """Return dictionary of available implementations for precision"""
+        from . import _optimized
+        funs = {'numpy': self.func}
+        for backend in backends[1:]:
+            try:
+                fun = _optimized(self.func.__name__, precision, backend)
+            except ImportError:
+                fun = None
+            if fun:
+                funs[backend] = fun
+        return funs
+
+    def _tune(self, key, args, kwargs):
+        params = config.params
+        precision = 'double'
+        if key is not None and np.dtype(key[1]) in (np.float32, np.complex64):
+            precision = 'single'
+        funs = self.candidates(precision)
+        name = '|'.join((self.name, str(key[0] if key else ()),
+                         key[1] if key else '', str(params.threads)))
+        path = params.get('autotune_cache', '')
+        if path and path not in _loaded:
+            _load(path)
+            _loaded.append(path)
+
+        times = 'cached'
+        backend = _winners.get(name)
+        if backend not in funs:
+            if _benchmarkable(list(args)+list(kwargs.values())):
+                times = self.benchmark(funs, args, kwargs)
+                valid = [(t, b) for b, t in times.items() if t is not None]
+                if valid:
+                    backend = _winners[name] = min(valid)[1]
+                    if path:
+                        _save(path)
+                else:
+                    # Nothing could be validated, not even numpy
+                    backend = next(b for b in preferred if b in funs)
+            else:
+                times = 'not benchmarked'
+                backend = next(b for b in preferred if b in funs)
+        _report[name] = (backend, times)
+        return funs[backend]
+
+    def benchmark(self, funs, args, kwargs):
+        """Return time of each implementation in funs, None if rejected
+
+        The numpy implementation is the reference, and is always first. If
+        it fails, all other implementations are rejected as well.
+        """
+        times = {}
+        reference = None
+        for backend, fun in funs.items():
+            try:
+                a, kw = _copy(args), {k: _copy(v) for k, v in kwargs.items()}
+                result = _arrays([fun(*a, **kw)]) + _arrays(a)
+                if backend == 'numpy':
+                    reference = result
+                elif (reference is None or len(result) != len(reference) or
+                      not all(_allclose(x, y) for x, y in zip(result, reference))):
+                    times[backend] = None
+                    continue
+                t = np.inf
+                for i in range(self.repeats):
+                    a, kw = _copy(args), {k: _copy(v) for k, v in kwargs.items()}
+                    t0 = perf_counter()
+                    fun(*a, **kw)
+                    t = min(t, perf_counter()-t0)
+                times[backend] = t
+            except Exception: #pylint: disable=broad-except
+                times[backend] = None
+        return times
+
+def report():
+    """Return table of the implementation used for each autotuned function
+
+    Benchmarked functions list the time of all implementations, where '-'
+    means that the implementation failed or gave a wrong result. Otherwise
+    the kernel was either read from the cache, or not benchmarked since the
+    function calls back into the solver.
+    """
+    lines = ['{:60s} {:>8s}  {}'.format('function|shape|dtype|threads', 'kernel', 'times')]
+    for name in sorted(_report):
+        backend, times = _report[name]
+        t = times
+        if isinstance(times, dict):
+            t = ' '.join('{}={}'.format(b, '-' if s is None else '{:2.2e}'.format(s))
+                         for b, s in times.items())
+        lines.append('{:60s} {:>8s}  {}'.format(name, backend, t))
+    return '\n'.join(lines)
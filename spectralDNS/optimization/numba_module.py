@@ -1,92 +1,138 @@
-from numba import jit
+from numba import jit, prange, set_num_threads, config as numba_config
 
-@jit(nopython=True, fastmath=True)
+def set_threads(threads):
+    """Set number of threads used by the parallel kernels"""
+    set_num_threads(max(1, min(threads, numba_config.NUMBA_NUM_THREADS)))
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def loop1(U_hat, U_hat0, U_hat1):
-    for i in range(U_hat.shape[0]):
-        for j in range(U_hat.shape[1]):
-            for k in range(U_hat.shape[2]):
-                for l in range(U_hat.shape[3]):
-                    z = U_hat[i, j, k, l]
-                    U_hat1[i, j, k, l] = z
-                    U_hat0[i, j, k, l] = z
-
-@jit(nopython=True, fastmath=True)
+    for i in prange(U_hat.shape[0]):
+        z = U_hat[i]
+        U_hat1[i] = z
+        U_hat0[i] = z
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def loop2(dU, U_hat, U_hat0, b, dt):
-    for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat[i, j, k, l] = U_hat0[i, j, k, l] + b*dt*dU[i, j, k, l]
+    for i in prange(dU.shape[0]):
+        U_hat[i] = U_hat0[i] + b*dt*dU[i]
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def loop3(dU, U_hat1, a, dt):
-    for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat1[i, j, k, l] = U_hat1[i, j, k, l] + a*dt*dU[i, j, k, l]
+    for i in prange(dU.shape[0]):
+        U_hat1[i] = U_hat1[i] + a*dt*dU[i]
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def loop4(U_hat, U_hat1):
-    for i in range(U_hat.shape[0]):
-        for j in range(U_hat.shape[1]):
-            for k in range(U_hat.shape[2]):
-                for l in range(U_hat.shape[3]):
-                    U_hat[i, j, k, l] = U_hat1[i, j, k, l]
+    for i in prange(U_hat.shape[0]):
+        U_hat[i] = U_hat1[i]
 
 def RK4(U_hat, U_hat0, U_hat1, dU, a, b, dt, solver, context):
-    loop1(U_hat, U_hat0, U_hat1)
+    # The register updates are pointwise, and work on flattened arrays
+    u, u0, u1 = U_hat.reshape(-1), U_hat0.reshape(-1), U_hat1.reshape(-1)
+    loop1(u, u0, u1)
     c = context
     for rk in range(4):
         dU = solver.ComputeRHS(dU, U_hat, solver, **c)
         if rk < 3:
-            loop2(dU, U_hat, U_hat0, b[rk], dt)
-        loop3(dU, U_hat1, a[rk], dt)
-    loop4(U_hat, U_hat1)
+            loop2(dU.reshape(-1), u, u0, b[rk], dt)
+        loop3(dU.reshape(-1), u1, a[rk], dt)
+    loop4(u, u1)
     return U_hat, dt, dt
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def loop5(dU, U_hat, dt):
-    for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat[i, j, k, l] += dU[i, j, k, l]*dt
+    for i in prange(dU.shape[0]):
+        U_hat[i] += dU[i]*dt
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def loop6(dU, U_hat, U_hat0, dt):
-    for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat[i, j, k, l] = U_hat[i, j, k, l] + 1.5*dU[i, j, k, l]*dt - 0.5*U_hat0[i, j, k, l]
+    for i in prange(dU.shape[0]):
+        U_hat[i] = U_hat[i] + 1.5*dU[i]*dt - 0.5*U_hat0[i]
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def loop7(dU, U_hat0, dt):
-    for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat0[i, j, k, l] = dU[i, j, k, l]*dt
+    for i in prange(dU.shape[0]):
+        U_hat0[i] = dU[i]*dt
 
 def ForwardEuler(U_hat, dU, dt, solver, context):
     dU = solver.ComputeRHS(dU, U_hat, solver, **context)
-    loop5(dU, U_hat, dt)
+    loop5(dU.reshape(-1), U_hat.reshape(-1), dt)
     return U_hat, dt, dt
 
 def AB2(U_hat, U_hat0, dU, dt, tstep, solver, context):
     dU = solver.ComputeRHS(dU, U_hat, solver, **context)
+    u, u0, du = U_hat.reshape(-1), U_hat0.reshape(-1), dU.reshape(-1)
     if tstep == 0:
-        loop5(dU, U_hat, dt)
+        loop5(du, u, dt)
     else:
-        loop6(dU, U_hat, U_hat0, dt)
-    loop7(dU, U_hat0, dt)
+        loop6(du, u, u0, dt)
+    loop7(du, u0, dt)
     return U_hat, dt, dt
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def lowstorage_stage(U_hat, U_hat1, dU, a, b, dt, first):
+    for i in prange(U_hat.shape[0]):
+        if first:
+            z = dt*dU[i]
+        else:
+            z = a*U_hat1[i] + dt*dU[i]
+        U_hat1[i] = z
+        U_hat[i] += b*z
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def lowstorage_stage_err(U_hat, U_hat1, err, dU, a, b, e, dt, first):
+    for i in prange(U_hat.shape[0]):
+        if first:
+            z = dt*dU[i]
+            err[i] = e*z
+        else:
+            z = a*U_hat1[i] + dt*dU[i]
+            err[i] += e*z
+        U_hat1[i] = z
+        U_hat[i] += b*z
+
+def RK2N(U_hat, U_hat1, dU, a, b, dt, solver, context):
+    u, u1 = U_hat.reshape(-1), U_hat1.reshape(-1)
+    for rk in range(a.shape[0]):
+        dU = solver.ComputeRHS(dU, U_hat, solver, **context)
+        lowstorage_stage(u, u1, dU.reshape(-1), a[rk], b[rk], dt, rk == 0)
+    return U_hat, dt, dt
+
+def RK2N_embedded(U_hat, U_hat1, err, dU, a, b, e, dt, solver, context):
+    u, u1, er = U_hat.reshape(-1), U_hat1.reshape(-1), err.reshape(-1)
+    for rk in range(a.shape[0]):
+        dU = solver.ComputeRHS(dU, U_hat, solver, **context)
+        lowstorage_stage_err(u, u1, er, dU.reshape(-1), a[rk], b[rk], e[rk], dt, rk == 0)
+    return U_hat, dt, dt
+
+RK4_2D = RK4
+ForwardEuler_2D = ForwardEuler
+AB2_2D = AB2
+RK2N_2D = RK2N
+RK2N_embedded_2D = RK2N_embedded
+
+@jit(nopython=True, fastmath=True, cache=True)
+def _scaled_error(err, u0, u1, aTOL, rTOL, inf):
+    s = 0.0
+    for i in range(err.shape[0]):
+        sc = aTOL + rTOL*max(abs(u0[i]), abs(u1[i]))
+        x = abs(err[i])/sc
+        if inf:
+            s = max(s, x)
+        else:
+            s += x*x
+    return s
+
+def scaled_error(err, u0, u1, aTOL, rTOL, errnorm, work):
+    return _scaled_error(err.reshape(-1), u0.reshape(-1), u1.reshape(-1),
+                         aTOL, rTOL, errnorm == "inf")
+
+scaled_error_2D = scaled_error
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def cross1(c, a, b):
     """Regular c = a x b"""
-    for i in range(a.shape[1]):
+    for i in prange(a.shape[1]):
         for j in range(a.shape[2]):
             for k in range(a.shape[3]):
                 a0 = a[0, i, j, k]
@@ -100,10 +146,10 @@ def cross1(c, a, b):
                 c[2, i, j, k] = a0*b1 - a1*b0
     return c
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def cross2a(c, a, b):
     """ c = 1j*(a x b)"""
-    for i in range(a.shape[1]):
+    for i in prange(a.shape[1]):
         for j in range(a.shape[2]):
             for k in range(a.shape[3]):
                 a0 = a[0, i, j, k]
@@ -117,10 +163,10 @@ def cross2a(c, a, b):
                 c[2, i, j, k] = -(a0*b1.imag - a1*b0.imag) + 1j*(a0*b1.real - a1*b0.real)
     return c
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def cross2c(c, a0, a1, a2, b):
     """ c = 1j*(a x b)"""
-    for i in range(b.shape[1]):
+    for i in prange(b.shape[1]):
         for j in range(b.shape[2]):
             for k in range(b.shape[3]):
                 a00 = a0[i, 0, 0]
@@ -141,44 +187,411 @@ def cross2(c, a, b):
         c = cross2a(c, a, b)
     return c
 
-def add_pressure_diffusion_NS(du, u_hat, nu, ksq, kk, p_hat, k_over_k2):
-    du = add_pressure_diffusion_NS_(du, u_hat, nu, ksq, kk[0][:, 0, 0],
-                                    kk[1][0, :, 0], kk[2][0, 0, :], p_hat, k_over_k2)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _inverse_curl(c, a0, a1, a2, b):
+    """ c = 1j*(a x b)/|a|^2"""
+    for i in prange(b.shape[1]):
+        a00 = a0[i]
+        for j in range(b.shape[2]):
+            a11 = a1[j]
+            for k in range(b.shape[3]):
+                a22 = a2[k]
+                z = a00*a00+a11*a11+a22*a22
+                z = 1/z if z > 0 else 0*z
+                b0 = b[0, i, j, k]*z
+                b1 = b[1, i, j, k]*z
+                b2 = b[2, i, j, k]*z
+                c[0, i, j, k] = -(a11*b2.imag - a22*b1.imag) + 1j*(a11*b2.real - a22*b1.real)
+                c[1, i, j, k] = -(a22*b0.imag - a00*b2.imag) + 1j*(a22*b0.real - a00*b2.real)
+                c[2, i, j, k] = -(a00*b1.imag - a11*b0.imag) + 1j*(a00*b1.real - a11*b0.real)
+    return c
+
+def inverse_curl(c, K, b):
+    c = _inverse_curl(c, K[0][:, 0, 0], K[1][0, :, 0], K[2][0, 0, :], b)
+    return c
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _project(u, kx, ky, kz):
+    for i in prange(u.shape[1]):
+        k0 = kx[i]
+        for j in range(u.shape[2]):
+            k1 = ky[j]
+            for k in range(u.shape[3]):
+                k2 = kz[k]
+                z = k0*k0+k1*k1+k2*k2
+                z = 1/z if z > 0 else 0*z
+                p = (k0*u[0, i, j, k]+k1*u[1, i, j, k]+k2*u[2, i, j, k])*z
+                u[0, i, j, k] = u[0, i, j, k] - p*k0
+                u[1, i, j, k] = u[1, i, j, k] - p*k1
+                u[2, i, j, k] = u[2, i, j, k] - p*k2
+    return u
+
+def project(u, K):
+    u = _project(u, K[0][:, 0, 0], K[1][0, :, 0], K[2][0, 0, :])
+    return u
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def cross1_2D(c, a, b):
+    """Regular c = a x b"""
+    for i in prange(a.shape[1]):
+        for j in range(a.shape[2]):
+            c[i, j] = a[0, i, j]*b[1, i, j] - a[1, i, j]*b[0, i, j]
+    return c
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def cross2a_2D(c, a, b):
+    """ c = 1j*(a x b)"""
+    for i in prange(a.shape[1]):
+        for j in range(a.shape[2]):
+            a0 = a[0, i, j]
+            a1 = a[1, i, j]
+            b0 = b[0, i, j]
+            b1 = b[1, i, j]
+            c[i, j] = -(a0*b1.imag - a1*b0.imag) + 1j*(a0*b1.real - a1*b0.real)
+    return c
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def cross2c_2D(c, kx, ky, b):
+    """ c = 1j*(k x b)"""
+    for i in prange(b.shape[1]):
+        k0 = kx[i]
+        for j in range(b.shape[2]):
+            k1 = ky[j]
+            b0 = b[0, i, j]
+            b1 = b[1, i, j]
+            c[i, j] = -(k0*b1.imag - k1*b0.imag) + 1j*(k0*b1.real - k1*b0.real)
+    return c
+
+def cross2_2D(c, a, b):
+    if isinstance(a, list):
+        c = cross2c_2D(c, a[0][:, 0], a[1][0, :], b)
+    else:
+        c = cross2a_2D(c, a, b)
+    return c
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _inverse_curl_2D(c, kx, ky, b):
+    """ c = 1j*(k x b)/|k|^2"""
+    for i in prange(b.shape[1]):
+        k0 = kx[i]
+        for j in range(b.shape[2]):
+            k1 = ky[j]
+            z = k0*k0+k1*k1
+            z = 1/z if z > 0 else 0*z
+            b0 = b[0, i, j]*z
+            b1 = b[1, i, j]*z
+            c[i, j] = -(k0*b1.imag - k1*b0.imag) + 1j*(k0*b1.real - k1*b0.real)
+    return c
+
+def inverse_curl_2D(c, K, b):
+    c = _inverse_curl_2D(c, K[0][:, 0], K[1][0, :], b)
+    return c
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _project_2D(u, kx, ky):
+    for i in prange(u.shape[1]):
+        k0 = kx[i]
+        for j in range(u.shape[2]):
+            k1 = ky[j]
+            z = k0*k0+k1*k1
+            z = 1/z if z > 0 else 0*z
+            p = (k0*u[0, i, j]+k1*u[1, i, j])*z
+            u[0, i, j] = u[0, i, j] - p*k0
+            u[1, i, j] = u[1, i, j] - p*k1
+    return u
+
+def project_2D(u, K):
+    u = _project_2D(u, K[0][:, 0], K[1][0, :])
+    return u
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _gradient(c, kx, ky, kz, a):
+    for i in prange(a.shape[1]):
+        k0 = 1j*kx[i]
+        for l in range(a.shape[0]):
+            for j in range(a.shape[2]):
+                k1 = 1j*ky[j]
+                for k in range(a.shape[3]):
+                    k2 = 1j*kz[k]
+                    c[3*l, i, j, k] = k0*a[l, i, j, k]
+                    c[3*l+1, i, j, k] = k1*a[l, i, j, k]
+                    c[3*l+2, i, j, k] = k2*a[l, i, j, k]
+    return c
+
+def gradient(c, K, a):
+    c = _gradient(c, K[0][:, 0, 0], K[1][0, :, 0], K[2][0, 0, :], a)
+    return c
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _gradient_2D(c, kx, ky, a):
+    for i in prange(a.shape[1]):
+        k0 = 1j*kx[i]
+        for l in range(a.shape[0]):
+            for j in range(a.shape[2]):
+                k1 = 1j*ky[j]
+                c[2*l, i, j] = k0*a[l, i, j]
+                c[2*l+1, i, j] = k1*a[l, i, j]
+    return c
+
+def gradient_2D(c, K, a):
+    c = _gradient_2D(c, K[0][:, 0], K[1][0, :], a)
+    return c
+
+def add_pressure_diffusion_NS(du, u_hat, nu, kk, p_hat, work):
+    du = add_pressure_diffusion_NS_(du, u_hat, nu, kk[0][:, 0, 0],
+                                    kk[1][0, :, 0], kk[2][0, 0, :], p_hat)
     return du
 
-@jit(nopython=True, fastmath=True)
-def add_pressure_diffusion_NS_(du, u_hat, nu, ksq, kx, ky, kz, p_hat, k_over_k2):
-    for i in range(ksq.shape[0]):
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def add_pressure_diffusion_NS_(du, u_hat, nu, kx, ky, kz, p_hat):
+    for i in prange(du.shape[1]):
         k0 = kx[i]
-        for j in range(ksq.shape[1]):
+        for j in range(du.shape[2]):
             k1 = ky[j]
-            for k in range(ksq.shape[2]):
-                z = nu*ksq[i, j, k]
+            for k in range(du.shape[3]):
                 k2 = kz[k]
-                p_hat[i, j, k] = du[0, i, j, k]*k_over_k2[0, i, j, k]+du[1, i, j, k]*k_over_k2[1, i, j, k]+du[2, i, j, k]*k_over_k2[2, i, j, k]
+                ksq = k0*k0+k1*k1+k2*k2
+                z = nu*ksq
+                ksq = 1/ksq if ksq > 0 else 0*ksq
+                p_hat[i, j, k] = (du[0, i, j, k]*k0+du[1, i, j, k]*k1+du[2, i, j, k]*k2)*ksq
                 du[0, i, j, k] = du[0, i, j, k] - (p_hat[i, j, k]*k0+u_hat[0, i, j, k]*z)
                 du[1, i, j, k] = du[1, i, j, k] - (p_hat[i, j, k]*k1+u_hat[1, i, j, k]*z)
                 du[2, i, j, k] = du[2, i, j, k] - (p_hat[i, j, k]*k2+u_hat[2, i, j, k]*z)
     return du
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def compute_vw(u_hat, f_hat, g_hat, k_over_k2):
-    for i in range(u_hat.shape[1]):
+    for i in prange(u_hat.shape[1]):
         for j in range(u_hat.shape[2]):
             for k in range(u_hat.shape[3]):
-                u_hat[1, i, j, k] = -1j*(k_over_k2[0, i, j, k]*f_hat[i, j, k] - k_over_k2[1, i, j, k]*g_hat[i, j, k])
-                u_hat[2, i, j, k] = -1j*(k_over_k2[1, i, j, k]*f_hat[i, j, k] + k_over_k2[0, i, j, k]*g_hat[i, j, k])
+                u_hat[1, i, j, k] = -1j*(k_over_k2[0, 0, j, k]*f_hat[i, j, k] - k_over_k2[1, 0, j, k]*g_hat[i, j, k])
+                u_hat[2, i, j, k] = -1j*(k_over_k2[1, 0, j, k]*f_hat[i, j, k] + k_over_k2[0, 0, j, k]*g_hat[i, j, k])
     return u_hat
 
 def mult_K1j(K, a, f):
     f = _mult_K1j(K[1][0, :, 0], K[2][0, 0], a, f)
     return f
 
-@jit(nopython=True, fastmath=True)
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
 def _mult_K1j(Ky, Kz, a, f):
-    for i in range(a.shape[0]):
+    for i in prange(a.shape[0]):
         for j in range(a.shape[1]):
             for k in range(a.shape[2]):
                 f[0, i, j, k] = 1j*Kz[k]*a[i, j, k]
                 f[1, i, j, k] = -1j*Ky[j]*a[i, j, k]
     return f
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _assembleAB(H_hat0, H_hat, H_hat1):
+    for i in prange(H_hat.shape[0]):
+        H_hat0[i] = 1.5*H_hat[i] - 0.5*H_hat1[i]
+
+def assembleAB(H_hat0, H_hat, H_hat1):
+    _assembleAB(H_hat0.reshape(-1), H_hat.reshape(-1), H_hat1.reshape(-1))
+    return H_hat0
+
+def add_pressure_diffusion_NS2D(du, u_hat, nu, K, p_hat, work):
+    du = _add_pressure_diffusion_NS2D(du, u_hat, nu, K[0][:, 0], K[1][0, :], p_hat)
+    return du
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _add_pressure_diffusion_NS2D(du, u_hat, nu, kx, ky, p_hat):
+    for i in prange(du.shape[1]):
+        k0 = kx[i]
+        for j in range(du.shape[2]):
+            k1 = ky[j]
+            ksq = k0*k0+k1*k1
+            z = nu*ksq
+            ksq = 1/ksq if ksq > 0 else 0*ksq
+            p_hat[i, j] = (du[0, i, j]*k0+du[1, i, j]*k1)*ksq
+            du[0, i, j] = du[0, i, j] - (p_hat[i, j]*k0+u_hat[0, i, j]*z)
+            du[1, i, j] = du[1, i, j] - (p_hat[i, j]*k1+u_hat[1, i, j]*z)
+    return du
+
+def add_pressure_diffusion_Bq2D(du, ur_hat, p_hat, K, nu, Ri, Pr, work):
+    du = _add_pressure_diffusion_Bq2D(du, ur_hat, p_hat, K[0][:, 0], K[1][0, :],
+                                      nu, Ri, Pr)
+    return du
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _add_pressure_diffusion_Bq2D(du, ur_hat, p_hat, kx, ky, nu, Ri, Pr):
+    for i in prange(du.shape[1]):
+        k0 = kx[i]
+        for j in range(du.shape[2]):
+            k1 = ky[j]
+            ksq = k0*k0+k1*k1
+            z = nu*ksq
+            ksq = 1/ksq if ksq > 0 else 0*ksq
+            p_hat[i, j] = (du[0, i, j]*k0+(du[1, i, j] - Ri*ur_hat[2, i, j])*k1)*ksq
+            du[0, i, j] = du[0, i, j] - (p_hat[i, j]*k0+ur_hat[0, i, j]*z)
+            du[1, i, j] = du[1, i, j] - (p_hat[i, j]*k1+ur_hat[1, i, j]*z+Ri*ur_hat[2, i, j])
+            du[2, i, j] = du[2, i, j] - ur_hat[2, i, j]*z/Pr
+    return du
+
+def add_pressure_diffusion_MHD(du, ub_hat, nu, eta, K, p_hat, work):
+    du = _add_pressure_diffusion_MHD(du, ub_hat, nu, eta, K[0][:, 0, 0],
+                                     K[1][0, :, 0], K[2][0, 0, :], p_hat)
+    return du
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _add_pressure_diffusion_MHD(du, ub_hat, nu, eta, kx, ky, kz, p_hat):
+    for i in prange(du.shape[1]):
+        k0 = kx[i]
+        for j in range(du.shape[2]):
+            k1 = ky[j]
+            for k in range(du.shape[3]):
+                k2 = kz[k]
+                ksq = k0*k0+k1*k1+k2*k2
+                z = nu*ksq
+                y = eta*ksq
+                ksq = 1/ksq if ksq > 0 else 0*ksq
+                p_hat[i, j, k] = (du[0, i, j, k]*k0+du[1, i, j, k]*k1+du[2, i, j, k]*k2)*ksq
+                du[0, i, j, k] = du[0, i, j, k] - (p_hat[i, j, k]*k0+ub_hat[0, i, j, k]*z)
+                du[1, i, j, k] = du[1, i, j, k] - (p_hat[i, j, k]*k1+ub_hat[1, i, j, k]*z)
+                du[2, i, j, k] = du[2, i, j, k] - (p_hat[i, j, k]*k2+ub_hat[2, i, j, k]*z)
+                du[3, i, j, k] = du[3, i, j, k] - ub_hat[3, i, j, k]*y
+                du[4, i, j, k] = du[4, i, j, k] - ub_hat[4, i, j, k]*y
+                du[5, i, j, k] = du[5, i, j, k] - ub_hat[5, i, j, k]*y
+    return du
+
+def set_Elsasser(c, ZZ, K):
+    c = _set_Elsasser(c, ZZ, K[0][:, 0, 0], K[1][0, :, 0], K[2][0, 0, :])
+    return c
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _set_Elsasser(c, ZZ, kx, ky, kz):
+    """c[:3] = -1j*div(sym(ZZ)), c[3:] = 1j*div(skew(ZZ))"""
+    for i in prange(c.shape[1]):
+        k0 = 0.5*kx[i]
+        for j in range(c.shape[2]):
+            k1 = 0.5*ky[j]
+            for k in range(c.shape[3]):
+                k2 = 0.5*kz[k]
+                for l in range(3):
+                    s = (k0*(ZZ[l, 0, i, j, k]+ZZ[0, l, i, j, k])
+                         + k1*(ZZ[l, 1, i, j, k]+ZZ[1, l, i, j, k])
+                         + k2*(ZZ[l, 2, i, j, k]+ZZ[2, l, i, j, k]))
+                    d = (k0*(ZZ[0, l, i, j, k]-ZZ[l, 0, i, j, k])
+                         + k1*(ZZ[1, l, i, j, k]-ZZ[l, 1, i, j, k])
+                         + k2*(ZZ[2, l, i, j, k]-ZZ[l, 2, i, j, k]))
+                    c[l, i, j, k] = s.imag - 1j*s.real
+                    c[l+3, i, j, k] = -d.imag + 1j*d.real
+    return c
+
+def Elsasser_products(ZZ, work, ub):
+    _Elsasser_products(ZZ.reshape((9, -1)), ub.reshape((6, -1)))
+    return ZZ
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _Elsasser_products(zz, ub):
+    """zz[3*i+j] = (u[i]+b[i])*(u[j]-b[j]), without storing u+b and u-b"""
+    for n in prange(ub.shape[1]):
+        for i in range(3):
+            z0 = ub[i, n]+ub[i+3, n]
+            for j in range(3):
+                zz[3*i+j, n] = z0*(ub[j, n]-ub[j+3, n])
+
+def add_linear_VV(rhs, w_hat, nu, K, Source, work):
+    rhs = _add_linear_VV(rhs, w_hat, nu, K[0][:, 0, 0], K[1][0, :, 0],
+                         K[2][0, 0, :], Source)
+    return rhs
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _add_linear_VV(rhs, w_hat, nu, kx, ky, kz, source):
+    for i in prange(rhs.shape[1]):
+        k0 = kx[i]
+        for j in range(rhs.shape[2]):
+            k1 = ky[j]
+            for k in range(rhs.shape[3]):
+                k2 = kz[k]
+                z = nu*(k0*k0+k1*k1+k2*k2)
+                for l in range(3):
+                    rhs[l, i, j, k] = rhs[l, i, j, k] - z*w_hat[l, i, j, k] + source[l, i, j, k]
+    return rhs
+
+def add_linear_KMMRK3(rhs, u, g, work, AB, AC, SBB, ABB, BBB, nu, dt, K2, K4, a, b):
+    diff_g = work[(g, 1, False)]
+    w0 = work[(g, 2, False)]
+    w1 = work[(g, 3, False)]
+    w2 = work[(g, 4, False)]
+    diff_g = AB.matvec(g, diff_g)
+    _add_linear_KMMRK3(rhs[0], SBB.matvec(u, w0), ABB.matvec(u, w1),
+                       BBB.matvec(u, w2), K2, K4, nu*(a+b)*dt)
+    rhs[1] += diff_g
+    return rhs
+
+add_linear_KMMRK3_RB = add_linear_KMMRK3
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def _add_linear_KMMRK3(rhs, s, a, b, K2, K4, c):
+    """rhs += c/2*s + (1-c*K2)*a - (K2-c/2*K4)*b"""
+    for i in prange(rhs.shape[0]):
+        for j in range(rhs.shape[1]):
+            for k in range(rhs.shape[2]):
+                k2 = K2[0, j, k]
+                k4 = K4[0, j, k]
+                rhs[i, j, k] += 0.5*c*s[i, j, k] + (1-c*k2)*a[i, j, k] - (k2-0.5*c*k4)*b[i, j, k]
+    return rhs
+
+# Batched solvers of spectralDNS.shen.la. Right hand sides b, solutions u
+# and LU factors are (N, P) arrays of N Chebyshev coefficients for P
+# wavenumber pairs. Blocks of pairs are swept row by row, and the work
+# array s holds the running sums of the back substitution.
+solve_block = 64
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def Solve_Helmholtz_batched(b, u, d0, d1, d2, L, s):
+    N = d0.shape[0]-2
+    P = b.shape[1]
+    for n in prange((P+solve_block-1)//solve_block):
+        p0 = n*solve_block
+        p1 = min(p0+solve_block, P)
+        for p in range(p0, p1):
+            u[0, p] = b[0, p]
+            u[1, p] = b[1, p]
+            s[0, p] = 0
+            s[1, p] = 0
+        for i in range(2, N):
+            for p in range(p0, p1):
+                u[i, p] = b[i, p] - L[i-2, p]*u[i-2, p]
+        for p in range(p0, p1):
+            u[N-1, p] = u[N-1, p]/d0[N-1, p]
+            u[N-2, p] = u[N-2, p]/d0[N-2, p]
+            u[N-3, p] = (u[N-3, p] - d1[N-3, p]*u[N-1, p])/d0[N-3, p]
+            u[N-4, p] = (u[N-4, p] - d1[N-4, p]*u[N-2, p])/d0[N-4, p]
+        for i in range(N-5, -1, -1):
+            for p in range(p0, p1):
+                s[i % 2, p] += u[i+4, p]
+                u[i, p] = (u[i, p] - d1[i, p]*u[i+2, p] - d2[i, p]*s[i % 2, p])/d0[i, p]
+
+@jit(nopython=True, fastmath=True, cache=True, parallel=True)
+def Solve_Biharmonic_batched(odd, b, u, u0, u1, u2, l0, l1, ak, bk, a0, s):
+    """Solve the even (odd=0) or odd (odd=1) coefficients"""
+    M = u0.shape[0]
+    P = b.shape[1]
+    for n in prange((P+solve_block-1)//solve_block):
+        p0 = n*solve_block
+        p1 = min(p0+solve_block, P)
+        for p in range(p0, p1):
+            u[odd, p] = b[odd, p]
+            u[2+odd, p] = b[2+odd, p] - l0[0, p]*u[odd, p]
+            s[0, p] = 0
+            s[1, p] = 0
+        for i in range(2, M):
+            k = 2*i+odd
+            for p in range(p0, p1):
+                u[k, p] = b[k, p] - l0[i-1, p]*u[k-2, p] - l1[i-2, p]*u[k-4, p]
+        for p in range(p0, p1):
+            k = 2*(M-1)+odd
+            u[k, p] = u[k, p]/u0[M-1, p]
+            u[k-2, p] = (u[k-2, p] - u1[M-2, p]*u[k, p])/u0[M-2, p]
+            u[k-4, p] = (u[k-4, p] - u1[M-3, p]*u[k-2, p] - u2[M-3, p]*u[k, p])/u0[M-3, p]
+        for i in range(M-4, -1, -1):
+            k = 2*i+odd
+            c1 = 1./(k+9.)
+            c2 = c1*(k+8)*(k+8)
+            for p in range(p0, p1):
+                s[0, p] += c1*u[k+6, p]
+                s[1, p] += c2*u[k+6, p]
+                u[k, p] = (u[k, p] - u1[i, p]*u[k+2, p] - u2[i, p]*u[k+4, p]
+                           - a0*(ak[i, p]*s[0, p] + bk[i, p]*s[1, p]))/u0[i, p]
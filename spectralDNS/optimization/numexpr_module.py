@@ -2,7 +2,11 @@ import numexpr
 
 #pylint: disable=unused-variable,unused-argument
 
-__all__ = ['add_pressure_diffusion', 'cross1', 'cross2']
+__all__ = ['add_pressure_diffusion', 'cross1', 'cross2', 'set_threads']
+
+def set_threads(threads):
+    """Set number of threads used by numexpr"""
+    numexpr.set_num_threads(max(1, threads))
 
 def cross1(c, a, b):
     a0, a1, a2 = a[0], a[1], a[2]
@@ -17,9 +21,12 @@ def cross2(c, a, b):
     c *= 1j
     return c
 
-def add_pressure_diffusion(dU, U_hat, K2, K, P_hat, K_over_K2, nu):
+def add_pressure_diffusion(dU, U_hat, nu, K, P_hat, work):
     du0, du1, du2 = dU[0], dU[1], dU[2]
-    k_0, k_1, k_2 = K_over_K2[0], K_over_K2[1], K_over_K2[2]
-    P_hat[:] = numexpr.evaluate("du0*k_0+du1*k_1+du2*k_2")
-    dU[:] = numexpr.evaluate("dU - P_hat*K - nu*K2*U_hat")
+    k_0, k_1, k_2 = K[0], K[1], K[2]
+    K2 = numexpr.evaluate("k_0*k_0+k_1*k_1+k_2*k_2", out=work[(P_hat.real, 0, False)])
+    P_hat[:] = numexpr.evaluate("(du0*k_0+du1*k_1+du2*k_2)/where(K2 == 0, 1, K2)")
+    for i in range(3):
+        du, u, k = dU[i], U_hat[i], K[i]
+        dU[i] = numexpr.evaluate("du - P_hat*k - nu*K2*u")
     return dU
@@ -1,72 +1,98 @@
-#pythran export loop1(complex64[:, :, :, :], complex64[:, :, :, :], complex64[:, :, :, :])
-#pythran export loop1(complex128[:, :, :, :], complex128[:, :, :, :], complex128[:, :, :, :])
+#pythran export loop1(complex64[:], complex64[:], complex64[:])
+#pythran export loop1(complex128[:], complex128[:], complex128[:])
 def loop1(U_hat, U_hat0, U_hat1):
+    #omp parallel for
     for i in range(U_hat.shape[0]):
-        for j in range(U_hat.shape[1]):
-            for k in range(U_hat.shape[2]):
-                for l in range(U_hat.shape[3]):
-                    z = U_hat[i, j, k, l]
-                    U_hat1[i, j, k, l] = z
-                    U_hat0[i, j, k, l] = z
-
-#pythran export loop2(complex64[:, :, :, :], complex64[:, :, :, :], complex64[:, :, :, :], float32, float32)
-#pythran export loop2(complex128[:, :, :, :], complex128[:, :, :, :], complex128[:, :, :, :], float64, float64)
+        z = U_hat[i]
+        U_hat1[i] = z
+        U_hat0[i] = z
+
+#pythran export loop2(complex64[:], complex64[:], complex64[:], float32, float32)
+#pythran export loop2(complex128[:], complex128[:], complex128[:], float64, float64)
 def loop2(dU, U_hat, U_hat0, b, dt):
+    #omp parallel for
     for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat[i, j, k, l] = U_hat0[i, j, k, l] + b*dt*dU[i, j, k, l]
+        U_hat[i] = U_hat0[i] + b*dt*dU[i]
 
-#pythran export loop3(complex64[:, :, :, :], complex64[:, :, :, :], float32, float32)
-#pythran export loop3(complex128[:, :, :, :], complex128[:, :, :, :], float64, float64)
+#pythran export loop3(complex64[:], complex64[:], float32, float32)
+#pythran export loop3(complex128[:], complex128[:], float64, float64)
 def loop3(dU, U_hat1, a, dt):
+    #omp parallel for
     for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat1[i, j, k, l] = U_hat1[i, j, k, l] + a*dt*dU[i, j, k, l]
+        U_hat1[i] = U_hat1[i] + a*dt*dU[i]
 
-#pythran export loop4(complex64[:, :, :, :], complex64[:, :, :, :])
-#pythran export loop4(complex128[:, :, :, :], complex128[:, :, :, :])
+#pythran export loop4(complex64[:], complex64[:])
+#pythran export loop4(complex128[:], complex128[:])
 def loop4(U_hat, U_hat1):
+    #omp parallel for
     for i in range(U_hat.shape[0]):
-        for j in range(U_hat.shape[1]):
-            for k in range(U_hat.shape[2]):
-                for l in range(U_hat.shape[3]):
-                    U_hat[i, j, k, l] = U_hat1[i, j, k, l]
+        U_hat[i] = U_hat1[i]
 
-#pythran export loop5(complex64[:, :, :, :], complex64[:, :, :, :], float32)
-#pythran export loop5(complex128[:, :, :, :], complex128[:, :, :, :], float64)
+#pythran export loop5(complex64[:], complex64[:], float32)
+#pythran export loop5(complex128[:], complex128[:], float64)
 def loop5(dU, U_hat, dt):
+    #omp parallel for
     for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat[i, j, k, l] += dU[i, j, k, l]*dt
+        U_hat[i] = U_hat[i] + dU[i]*dt
 
-#pythran export loop6(complex64[:, :, :, :], complex64[:, :, :, :], complex64[:, :, :, :], float32)
-#pythran export loop6(complex128[:, :, :, :], complex128[:, :, :, :], complex128[:, :, :, :], float64)
+#pythran export loop6(complex64[:], complex64[:], complex64[:], float32)
+#pythran export loop6(complex128[:], complex128[:], complex128[:], float64)
 def loop6(dU, U_hat, U_hat0, dt):
+    #omp parallel for
     for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat[i, j, k, l] = U_hat[i, j, k, l] + 1.5*dU[i, j, k, l]*dt - 0.5*U_hat0[i, j, k, l]
+        U_hat[i] = U_hat[i] + 1.5*dU[i]*dt - 0.5*U_hat0[i]
 
-#pythran export loop7(complex64[:, :, :, :], complex64[:, :, :, :], float32)
-#pythran export loop7(complex128[:, :, :, :], complex128[:, :, :, :], float64)
+#pythran export loop7(complex64[:], complex64[:], float32)
+#pythran export loop7(complex128[:], complex128[:], float64)
 def loop7(dU, U_hat0, dt):
+    #omp parallel for
     for i in range(dU.shape[0]):
-        for j in range(dU.shape[1]):
-            for k in range(dU.shape[2]):
-                for l in range(dU.shape[3]):
-                    U_hat0[i, j, k, l] = dU[i, j, k, l]*dt
+        U_hat0[i] = dU[i]*dt
+
+#pythran export lowstorage_stage(complex64[:], complex64[:], complex64[:], float32, float32, float32, bool)
+#pythran export lowstorage_stage(complex128[:], complex128[:], complex128[:], float64, float64, float64, bool)
+def lowstorage_stage(U_hat, U_hat1, dU, a, b, dt, first):
+    #omp parallel for private(z)
+    for i in range(U_hat.shape[0]):
+        if first:
+            z = dt*dU[i]
+        else:
+            z = a*U_hat1[i] + dt*dU[i]
+        U_hat1[i] = z
+        U_hat[i] += b*z
+
+#pythran export lowstorage_stage_err(complex64[:], complex64[:], complex64[:], complex64[:], float32, float32, float32, float32, bool)
+#pythran export lowstorage_stage_err(complex128[:], complex128[:], complex128[:], complex128[:], float64, float64, float64, float64, bool)
+def lowstorage_stage_err(U_hat, U_hat1, err, dU, a, b, e, dt, first):
+    #omp parallel for private(z)
+    for i in range(U_hat.shape[0]):
+        if first:
+            z = dt*dU[i]
+            err[i] = e*z
+        else:
+            z = a*U_hat1[i] + dt*dU[i]
+            err[i] += e*z
+        U_hat1[i] = z
+        U_hat[i] += b*z
+
+#pythran export _scaled_error(complex64[:], complex64[:], complex64[:], float, float, bool)
+#pythran export _scaled_error(complex128[:], complex128[:], complex128[:], float, float, bool)
+def _scaled_error(err, u0, u1, aTOL, rTOL, inf):
+    s = 0.0
+    for i in range(err.shape[0]):
+        sc = aTOL + rTOL*max(abs(u0[i]), abs(u1[i]))
+        x = abs(err[i])/sc
+        if inf:
+            s = max(s, x)
+        else:
+            s += x*x
+    return s
 
 #pythran export cross1(float32[:, :, :, :], float32[:, :, :, :], float32[:, :, :, :])
 #pythran export cross1(float64[:, :, :, :], float64[:, :, :, :], float64[:, :, :, :])
 def cross1(c, a, b):
     """Regular c = a x b"""
+    #omp parallel for
     for i in range(a.shape[1]):
         for j in range(a.shape[2]):
             for k in range(a.shape[3]):
@@ -85,6 +111,7 @@ def cross1(c, a, b):
 #pythran export cross2a(complex128[:, :, :, :], float64[:, :, :, :], complex128[:, :, :, :])
 def cross2a(c, a, b):
     """ c = 1j*(a x b)"""
+    #omp parallel for
     for i in range(a.shape[1]):
         for j in range(a.shape[2]):
             for k in range(a.shape[3]):
@@ -103,6 +130,7 @@ def cross2a(c, a, b):
 #pythran export cross2c(complex128[:, :, :, :], float64[:], float64[:], float64[:], complex128[:, :, :, :])
 def cross2c(c, a0, a1, a2, b):
     """ c = 1j*(a x b)"""
+    #omp parallel for
     for i in range(b.shape[1]):
         for j in range(b.shape[2]):
             for k in range(b.shape[3]):
@@ -117,17 +145,88 @@ def cross2c(c, a0, a1, a2, b):
                 c[2, i, j, k] = -(a00*b1.imag - a11*b0.imag) + 1j*(a00*b1.real - a11*b0.real)
     return c
 
-#pythran export add_pressure_diffusion_NS_(complex128[:, :, :, :], complex128[:, :, :, :], float64, float64[:, :, :], float64[:], float64[:], float64[:], complex128[:, :, :], float64[:, :, :, :])
-#pythran export add_pressure_diffusion_NS_(complex64[:, :, :, :], complex64[:, :, :, :], float32, float32[:, :, :], float32[:], float32[:], float32[:], complex64[:, :, :], float32[:, :, :, :])
-def add_pressure_diffusion_NS_(du, u_hat, nu, ksq, kx, ky, kz, p_hat, k_over_k2):
-    for i in range(ksq.shape[0]):
+#pythran export _inverse_curl(complex64[:, :, :, :], float32[:], float32[:], float32[:], complex64[:, :, :, :])
+#pythran export _inverse_curl(complex128[:, :, :, :], float64[:], float64[:], float64[:], complex128[:, :, :, :])
+def _inverse_curl(c, a0, a1, a2, b):
+    """ c = 1j*(a x b)/|a|^2"""
+    #omp parallel for
+    for i in range(b.shape[1]):
+        a00 = a0[i]
+        for j in range(b.shape[2]):
+            a11 = a1[j]
+            for k in range(b.shape[3]):
+                a22 = a2[k]
+                z = a00*a00+a11*a11+a22*a22
+                z = 1/z if z > 0 else 0*z
+                b0 = b[0, i, j, k]*z
+                b1 = b[1, i, j, k]*z
+                b2 = b[2, i, j, k]*z
+                c[0, i, j, k] = -(a11*b2.imag - a22*b1.imag) + 1j*(a11*b2.real - a22*b1.real)
+                c[1, i, j, k] = -(a22*b0.imag - a00*b2.imag) + 1j*(a22*b0.real - a00*b2.real)
+                c[2, i, j, k] = -(a00*b1.imag - a11*b0.imag) + 1j*(a00*b1.real - a11*b0.real)
+    return c
+
+#pythran export _project(complex128[:, :, :, :], float64[:], float64[:], float64[:])
+#pythran export _project(complex64[:, :, :, :], float32[:], float32[:], float32[:])
+def _project(u, kx, ky, kz):
+    #omp parallel for
+    for i in range(u.shape[1]):
         k0 = kx[i]
-        for j in range(ksq.shape[1]):
+        for j in range(u.shape[2]):
             k1 = ky[j]
-            for k in range(ksq.shape[2]):
-                z = nu*ksq[i, j, k]
+            for k in range(u.shape[3]):
                 k2 = kz[k]
-                p_hat[i, j, k] = du[0, i, j, k]*k_over_k2[0, i, j, k]+du[1, i, j, k]*k_over_k2[1, i, j, k]+du[2, i, j, k]*k_over_k2[2, i, j, k]
+                z = k0*k0+k1*k1+k2*k2
+                z = 1/z if z > 0 else 0*z
+                p = (k0*u[0, i, j, k]+k1*u[1, i, j, k]+k2*u[2, i, j, k])*z
+                u[0, i, j, k] = u[0, i, j, k] - p*k0
+                u[1, i, j, k] = u[1, i, j, k] - p*k1
+                u[2, i, j, k] = u[2, i, j, k] - p*k2
+    return u
+
+#pythran export _project_2D(complex128[:, :, :], float64[:], float64[:])
+#pythran export _project_2D(complex64[:, :, :], float32[:], float32[:])
+def _project_2D(u, kx, ky):
+    for i in range(u.shape[1]):
+        k0 = kx[i]
+        for j in range(u.shape[2]):
+            k1 = ky[j]
+            z = k0*k0+k1*k1
+            z = 1/z if z > 0 else 0*z
+            p = (k0*u[0, i, j]+k1*u[1, i, j])*z
+            u[0, i, j] = u[0, i, j] - p*k0
+            u[1, i, j] = u[1, i, j] - p*k1
+    return u
+
+#pythran export _gradient(complex128[:, :, :, :], float64[:], float64[:], float64[:], complex128[:, :, :, :])
+#pythran export _gradient(complex64[:, :, :, :], float32[:], float32[:], float32[:], complex64[:, :, :, :])
+def _gradient(c, kx, ky, kz, a):
+    for l in range(a.shape[0]):
+        for i in range(a.shape[1]):
+            k0 = 1j*kx[i]
+            for j in range(a.shape[2]):
+                k1 = 1j*ky[j]
+                for k in range(a.shape[3]):
+                    k2 = 1j*kz[k]
+                    c[3*l, i, j, k] = k0*a[l, i, j, k]
+                    c[3*l+1, i, j, k] = k1*a[l, i, j, k]
+                    c[3*l+2, i, j, k] = k2*a[l, i, j, k]
+    return c
+
+#pythran export add_pressure_diffusion_NS_(complex128[:, :, :, :], complex128[:, :, :, :], float64, float64[:], float64[:], float64[:], complex128[:, :, :])
+#pythran export add_pressure_diffusion_NS_(complex64[:, :, :, :], complex64[:, :, :, :], float32, float32[:], float32[:], float32[:], complex64[:, :, :])
+def add_pressure_diffusion_NS_(du, u_hat, nu, kx, ky, kz, p_hat):
+    #omp parallel for
+    for i in range(du.shape[1]):
+        k0 = kx[i]
+        for j in range(du.shape[2]):
+            k1 = ky[j]
+            for k in range(du.shape[3]):
+                k2 = kz[k]
+                ksq = k0*k0+k1*k1+k2*k2
+                z = nu*ksq
+                ksq = 1/ksq if ksq > 0 else 0*ksq
+                p_hat[i, j, k] = (du[0, i, j, k]*k0+du[1, i, j, k]*k1+du[2, i, j, k]*k2)*ksq
                 du[0, i, j, k] = du[0, i, j, k] - (p_hat[i, j, k]*k0+u_hat[0, i, j, k]*z)
                 du[1, i, j, k] = du[1, i, j, k] - (p_hat[i, j, k]*k1+u_hat[1, i, j, k]*z)
                 du[2, i, j, k] = du[2, i, j, k] - (p_hat[i, j, k]*k2+u_hat[2, i, j, k]*z)
@@ -136,18 +235,278 @@ def add_pressure_diffusion_NS_(du, u_hat, nu, ksq, kx, ky, kz, p_hat, k_over_k2)
 #pythran export compute_vw(complex128[:, :, :, :], complex128[:, :, :], complex128[:, :, :], float64[:, :, :, :])
 #pythran export compute_vw(complex64[:, :, :, :], complex64[:, :, :], complex64[:, :, :], float32[:, :, :, :])
 def compute_vw(u_hat, f_hat, g_hat, k_over_k2):
+    #omp parallel for
     for i in range(u_hat.shape[1]):
         for j in range(u_hat.shape[2]):
             for k in range(u_hat.shape[3]):
-                u_hat[1, i, j, k] = -1j*(k_over_k2[0, i, j, k]*f_hat[i, j, k] - k_over_k2[1, i, j, k]*g_hat[i, j, k])
-                u_hat[2, i, j, k] = -1j*(k_over_k2[1, i, j, k]*f_hat[i, j, k] + k_over_k2[0, i, j, k]*g_hat[i, j, k])
+                u_hat[1, i, j, k] = -1j*(k_over_k2[0, 0, j, k]*f_hat[i, j, k] - k_over_k2[1, 0, j, k]*g_hat[i, j, k])
+                u_hat[2, i, j, k] = -1j*(k_over_k2[1, 0, j, k]*f_hat[i, j, k] + k_over_k2[0, 0, j, k]*g_hat[i, j, k])
     return u_hat
 
 #pythran export _mult_K1j(float64[:], float64[:], complex128[:, :, :], complex128[:, :, :, :])
+#pythran export _mult_K1j(float32[:], float32[:], complex64[:, :, :], complex64[:, :, :, :])
 def _mult_K1j(Ky, Kz, a, f):
+    #omp parallel for
     for i in range(a.shape[0]):
         for j in range(a.shape[1]):
             for k in range(a.shape[2]):
                 f[0, i, j, k] = 1j*Kz[k]*a[i, j, k]
                 f[1, i, j, k] = -1j*Ky[j]*a[i, j, k]
     return f
+
+#pythran export cross1_2D(float64[:, :], float64[:, :, :], float64[:, :, :])
+#pythran export cross1_2D(float32[:, :], float32[:, :, :], float32[:, :, :])
+def cross1_2D(c, a, b):
+    """Regular c = a x b"""
+    #omp parallel for
+    for i in range(a.shape[1]):
+        for j in range(a.shape[2]):
+            c[i, j] = a[0, i, j]*b[1, i, j] - a[1, i, j]*b[0, i, j]
+    return c
+
+#pythran export cross2a_2D(complex128[:, :], float64[:, :, :], complex128[:, :, :])
+#pythran export cross2a_2D(complex64[:, :], float32[:, :, :], complex64[:, :, :])
+def cross2a_2D(c, a, b):
+    """ c = 1j*(a x b)"""
+    #omp parallel for
+    for i in range(a.shape[1]):
+        for j in range(a.shape[2]):
+            a0 = a[0, i, j]
+            a1 = a[1, i, j]
+            b0 = b[0, i, j]
+            b1 = b[1, i, j]
+            c[i, j] = -(a0*b1.imag - a1*b0.imag) + 1j*(a0*b1.real - a1*b0.real)
+    return c
+
+#pythran export cross2c_2D(complex128[:, :], float64[:], float64[:], complex128[:, :, :])
+#pythran export cross2c_2D(complex64[:, :], float32[:], float32[:], complex64[:, :, :])
+def cross2c_2D(c, kx, ky, b):
+    """ c = 1j*(k x b)"""
+    #omp parallel for
+    for i in range(b.shape[1]):
+        k0 = kx[i]
+        for j in range(b.shape[2]):
+            k1 = ky[j]
+            b0 = b[0, i, j]
+            b1 = b[1, i, j]
+            c[i, j] = -(k0*b1.imag - k1*b0.imag) + 1j*(k0*b1.real - k1*b0.real)
+    return c
+
+#pythran export _inverse_curl_2D(complex128[:, :], float64[:], float64[:], complex128[:, :, :])
+#pythran export _inverse_curl_2D(complex64[:, :], float32[:], float32[:], complex64[:, :, :])
+def _inverse_curl_2D(c, kx, ky, b):
+    """ c = 1j*(k x b)/|k|^2"""
+    #omp parallel for
+    for i in range(b.shape[1]):
+        k0 = kx[i]
+        for j in range(b.shape[2]):
+            k1 = ky[j]
+            z = k0*k0+k1*k1
+            z = 1/z if z > 0 else 0*z
+            b0 = b[0, i, j]*z
+            b1 = b[1, i, j]*z
+            c[i, j] = -(k0*b1.imag - k1*b0.imag) + 1j*(k0*b1.real - k1*b0.real)
+    return c
+
+#pythran export _gradient_2D(complex128[:, :, :], float64[:], float64[:], complex128[:, :, :])
+#pythran export _gradient_2D(complex64[:, :, :], float32[:], float32[:], complex64[:, :, :])
+def _gradient_2D(c, kx, ky, a):
+    for l in range(a.shape[0]):
+        for i in range(a.shape[1]):
+            k0 = 1j*kx[i]
+            for j in range(a.shape[2]):
+                k1 = 1j*ky[j]
+                c[2*l, i, j] = k0*a[l, i, j]
+                c[2*l+1, i, j] = k1*a[l, i, j]
+    return c
+
+#pythran export _add_pressure_diffusion_NS2D(complex128[:, :, :], complex128[:, :, :], float, float64[:], float64[:], complex128[:, :])
+#pythran export _add_pressure_diffusion_NS2D(complex64[:, :, :], complex64[:, :, :], float, float32[:], float32[:], complex64[:, :])
+def _add_pressure_diffusion_NS2D(du, u_hat, nu, kx, ky, p_hat):
+    #omp parallel for
+    for i in range(du.shape[1]):
+        k0 = kx[i]
+        for j in range(du.shape[2]):
+            k1 = ky[j]
+            ksq = k0*k0+k1*k1
+            z = nu*ksq
+            ksq = 1/ksq if ksq > 0 else 0*ksq
+            p_hat[i, j] = (du[0, i, j]*k0+du[1, i, j]*k1)*ksq
+            du[0, i, j] = du[0, i, j] - (p_hat[i, j]*k0+u_hat[0, i, j]*z)
+            du[1, i, j] = du[1, i, j] - (p_hat[i, j]*k1+u_hat[1, i, j]*z)
+    return du
+
+#pythran export _add_pressure_diffusion_Bq2D(complex128[:, :, :], complex128[:, :, :], complex128[:, :], float64[:], float64[:], float, float, float)
+#pythran export _add_pressure_diffusion_Bq2D(complex64[:, :, :], complex64[:, :, :], complex64[:, :], float32[:], float32[:], float, float, float)
+def _add_pressure_diffusion_Bq2D(du, ur_hat, p_hat, kx, ky, nu, Ri, Pr):
+    #omp parallel for
+    for i in range(du.shape[1]):
+        k0 = kx[i]
+        for j in range(du.shape[2]):
+            k1 = ky[j]
+            ksq = k0*k0+k1*k1
+            z = nu*ksq
+            ksq = 1/ksq if ksq > 0 else 0*ksq
+            p_hat[i, j] = (du[0, i, j]*k0+(du[1, i, j] - Ri*ur_hat[2, i, j])*k1)*ksq
+            du[0, i, j] = du[0, i, j] - (p_hat[i, j]*k0+ur_hat[0, i, j]*z)
+            du[1, i, j] = du[1, i, j] - (p_hat[i, j]*k1+ur_hat[1, i, j]*z+Ri*ur_hat[2, i, j])
+            du[2, i, j] = du[2, i, j] - ur_hat[2, i, j]*z/Pr
+    return du
+
+#pythran export _add_pressure_diffusion_MHD(complex128[:, :, :, :], complex128[:, :, :, :], float, float, float64[:], float64[:], float64[:], complex128[:, :, :])
+#pythran export _add_pressure_diffusion_MHD(complex64[:, :, :, :], complex64[:, :, :, :], float, float, float32[:], float32[:], float32[:], complex64[:, :, :])
+def _add_pressure_diffusion_MHD(du, ub_hat, nu, eta, kx, ky, kz, p_hat):
+    #omp parallel for
+    for i in range(du.shape[1]):
+        k0 = kx[i]
+        for j in range(du.shape[2]):
+            k1 = ky[j]
+            for k in range(du.shape[3]):
+                k2 = kz[k]
+                ksq = k0*k0+k1*k1+k2*k2
+                z = nu*ksq
+                y = eta*ksq
+                ksq = 1/ksq if ksq > 0 else 0*ksq
+                p_hat[i, j, k] = (du[0, i, j, k]*k0+du[1, i, j, k]*k1+du[2, i, j, k]*k2)*ksq
+                du[0, i, j, k] = du[0, i, j, k] - (p_hat[i, j, k]*k0+ub_hat[0, i, j, k]*z)
+                du[1, i, j, k] = du[1, i, j, k] - (p_hat[i, j, k]*k1+ub_hat[1, i, j, k]*z)
+                du[2, i, j, k] = du[2, i, j, k] - (p_hat[i, j, k]*k2+ub_hat[2, i, j, k]*z)
+                du[3, i, j, k] = du[3, i, j, k] - ub_hat[3, i, j, k]*y
+                du[4, i, j, k] = du[4, i, j, k] - ub_hat[4, i, j, k]*y
+                du[5, i, j, k] = du[5, i, j, k] - ub_hat[5, i, j, k]*y
+    return du
+
+#pythran export _set_Elsasser(complex128[:, :, :, :], complex128[:, :, :, :, :], float64[:], float64[:], float64[:])
+#pythran export _set_Elsasser(complex64[:, :, :, :], complex64[:, :, :, :, :], float32[:], float32[:], float32[:])
+def _set_Elsasser(c, ZZ, kx, ky, kz):
+    """c[:3] = -1j*div(sym(ZZ)), c[3:] = 1j*div(skew(ZZ))"""
+    #omp parallel for
+    for i in range(c.shape[1]):
+        k0 = 0.5*kx[i]
+        for j in range(c.shape[2]):
+            k1 = 0.5*ky[j]
+            for k in range(c.shape[3]):
+                k2 = 0.5*kz[k]
+                for l in range(3):
+                    s = (k0*(ZZ[l, 0, i, j, k]+ZZ[0, l, i, j, k])
+                         + k1*(ZZ[l, 1, i, j, k]+ZZ[1, l, i, j, k])
+                         + k2*(ZZ[l, 2, i, j, k]+ZZ[2, l, i, j, k]))
+                    d = (k0*(ZZ[0, l, i, j, k]-ZZ[l, 0, i, j, k])
+                         + k1*(ZZ[1, l, i, j, k]-ZZ[l, 1, i, j, k])
+                         + k2*(ZZ[2, l, i, j, k]-ZZ[l, 2, i, j, k]))
+                    c[l, i, j, k] = s.imag - 1j*s.real
+                    c[l+3, i, j, k] = -d.imag + 1j*d.real
+    return c
+
+#pythran export _Elsasser_products(float64[:, :], float64[:, :])
+#pythran export _Elsasser_products(float32[:, :], float32[:, :])
+def _Elsasser_products(zz, ub):
+    """zz[3*i+j] = (u[i]+b[i])*(u[j]-b[j]), without storing u+b and u-b"""
+    #omp parallel for
+    for n in range(ub.shape[1]):
+        for i in range(3):
+            z0 = ub[i, n]+ub[i+3, n]
+            for j in range(3):
+                zz[3*i+j, n] = z0*(ub[j, n]-ub[j+3, n])
+
+#pythran export _add_linear_VV(complex128[:, :, :, :], complex128[:, :, :, :], float, float64[:], float64[:], float64[:], complex128[:, :, :, :])
+#pythran export _add_linear_VV(complex64[:, :, :, :], complex64[:, :, :, :], float, float32[:], float32[:], float32[:], complex64[:, :, :, :])
+def _add_linear_VV(rhs, w_hat, nu, kx, ky, kz, source):
+    #omp parallel for
+    for i in range(rhs.shape[1]):
+        k0 = kx[i]
+        for j in range(rhs.shape[2]):
+            k1 = ky[j]
+            for k in range(rhs.shape[3]):
+                k2 = kz[k]
+                z = nu*(k0*k0+k1*k1+k2*k2)
+                for l in range(3):
+                    rhs[l, i, j, k] = rhs[l, i, j, k] - z*w_hat[l, i, j, k] + source[l, i, j, k]
+    return rhs
+
+#pythran export _assembleAB(complex128[:], complex128[:], complex128[:])
+#pythran export _assembleAB(complex64[:], complex64[:], complex64[:])
+def _assembleAB(H_hat0, H_hat, H_hat1):
+    #omp parallel for
+    for i in range(H_hat.shape[0]):
+        H_hat0[i] = 1.5*H_hat[i] - 0.5*H_hat1[i]
+
+#pythran export _add_linear_KMMRK3(complex128[:, :, :], complex128[:, :, :], complex128[:, :, :], complex128[:, :, :], float64[:, :, :], float64[:, :, :], float)
+#pythran export _add_linear_KMMRK3(complex64[:, :, :], complex64[:, :, :], complex64[:, :, :], complex64[:, :, :], float32[:, :, :], float32[:, :, :], float)
+def _add_linear_KMMRK3(rhs, s, a, b, K2, K4, c):
+    """rhs += c/2*s + (1-c*K2)*a - (K2-c/2*K4)*b"""
+    #omp parallel for
+    for i in range(rhs.shape[0]):
+        for j in range(rhs.shape[1]):
+            for k in range(rhs.shape[2]):
+                k2 = K2[0, j, k]
+                k4 = K4[0, j, k]
+                rhs[i, j, k] += 0.5*c*s[i, j, k] + (1-c*k2)*a[i, j, k] - (k2-0.5*c*k4)*b[i, j, k]
+    return rhs
+
+# Batched solvers of spectralDNS.shen.la. Right hand sides b, solutions u
+# and LU factors are (N, P) arrays of N Chebyshev coefficients for P
+# wavenumber pairs. Blocks of pairs are swept row by row, and the work
+# array s holds the running sums of the back substitution.
+solve_block = 64
+
+#pythran export Solve_Helmholtz_batched(complex128[:, :] order(C), complex128[:, :] order(C), float64[:, :] order(C), float64[:, :] order(C), float64[:, :] order(C), float64[:, :] order(C), complex128[:, :] order(C))
+#pythran export Solve_Helmholtz_batched(complex128[:, :] order(F), complex128[:, :] order(F), float64[:, :] order(F), float64[:, :] order(F), float64[:, :] order(F), float64[:, :] order(F), complex128[:, :] order(C))
+def Solve_Helmholtz_batched(b, u, d0, d1, d2, L, s):
+    N = d0.shape[0]-2
+    P = b.shape[1]
+    #omp parallel for
+    for n in range((P+solve_block-1)//solve_block):
+        p0 = n*solve_block
+        p1 = min(p0+solve_block, P)
+        for p in range(p0, p1):
+            u[0, p] = b[0, p]
+            u[1, p] = b[1, p]
+            s[0, p] = 0
+            s[1, p] = 0
+        for i in range(2, N):
+            for p in range(p0, p1):
+                u[i, p] = b[i, p] - L[i-2, p]*u[i-2, p]
+        for p in range(p0, p1):
+            u[N-1, p] = u[N-1, p]/d0[N-1, p]
+            u[N-2, p] = u[N-2, p]/d0[N-2, p]
+            u[N-3, p] = (u[N-3, p] - d1[N-3, p]*u[N-1, p])/d0[N-3, p]
+            u[N-4, p] = (u[N-4, p] - d1[N-4, p]*u[N-2, p])/d0[N-4, p]
+        for i in range(N-5, -1, -1):
+            for p in range(p0, p1):
+                s[i % 2, p] += u[i+4, p]
+                u[i, p] = (u[i, p] - d1[i, p]*u[i+2, p] - d2[i, p]*s[i % 2, p])/d0[i, p]
+
+#pythran export Solve_Biharmonic_batched(int, complex128[:, :] order(C), complex128[:, :] order(C), float64[:, :] order(C), float64[:, :] order(C), float64[:, :] order(C), float64[:, :] order(C), float64[:, :] order(C), float64[:, :] order(C), float64[:, :] order(C), float, complex128[:, :] order(C))
+#pythran export Solve_Biharmonic_batched(int, complex128[:, :] order(F), complex128[:, :] order(F), float64[:, :] order(F), float64[:, :] order(F), float64[:, :] order(F), float64[:, :] order(F), float64[:, :] order(F), float64[:, :] order(F), float64[:, :] order(F), float, complex128[:, :] order(C))
+def Solve_Biharmonic_batched(odd, b, u, u0, u1, u2, l0, l1, ak, bk, a0, s):
+    """Solve the even (odd=0) or odd (odd=1) coefficients"""
+    M = u0.shape[0]
+    P = b.shape[1]
+    #omp parallel for
+    for n in range((P+solve_block-1)//solve_block):
+        p0 = n*solve_block
+        p1 = min(p0+solve_block, P)
+        for p in range(p0, p1):
+            u[odd, p] = b[odd, p]
+            u[2+odd, p] = b[2+odd, p] - l0[0, p]*u[odd, p]
+            s[0, p] = 0
+            s[1, p] = 0
+        for i in range(2, M):
+            k = 2*i+odd
+            for p in range(p0, p1):
+                u[k, p] = b[k, p] - l0[i-1, p]*u[k-2, p] - l1[i-2, p]*u[k-4, p]
+        for p in range(p0, p1):
+            k = 2*(M-1)+odd
+            u[k, p] = u[k, p]/u0[M-1, p]
+            u[k-2, p] = (u[k-2, p] - u1[M-2, p]*u[k, p])/u0[M-2, p]
+            u[k-4, p] = (u[k-4, p] - u1[M-3, p]*u[k-2, p] - u2[M-3, p]*u[k, p])/u0[M-3, p]
+        for i in range(M-4, -1, -1):
+            k = 2*i+odd
+            c1 = 1./(k+9.)
+            c2 = c1*(k+8)*(k+8)
+            for p in range(p0, p1):
+                s[0, p] += c1*u[k+6, p]
+                s[1, p] += c2*u[k+6, p]
+                u[k, p] = (u[k, p] - u1[i, p]*u[k+2, p] - u2[i, p]*u[k+4, p]
+                           - a0*(ak[i, p]*s[0, p] + bk[i, p]*s[1, p]))/u0[i, p]
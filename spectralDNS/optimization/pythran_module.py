@@ -1,31 +1,80 @@
+import ctypes
+import ctypes.util
 from .pythran_maths import loop1, loop2, loop3, loop4, loop5, loop6, loop7, \
-    cross1, cross2a, cross2c, add_pressure_diffusion_NS_, _mult_K1j, compute_vw
+    cross1, cross2a, cross2c, add_pressure_diffusion_NS_, _mult_K1j, compute_vw, \
+    lowstorage_stage, lowstorage_stage_err, _scaled_error, _inverse_curl, \
+    _project, _project_2D, _gradient, cross1_2D, cross2a_2D, cross2c_2D, \
+    _inverse_curl_2D, _gradient_2D, _add_pressure_diffusion_NS2D, \
+    _add_pressure_diffusion_Bq2D, _add_pressure_diffusion_MHD, _set_Elsasser, \
+    _Elsasser_products, _add_linear_VV, _assembleAB, _add_linear_KMMRK3, \
+    Solve_Helmholtz_batched, Solve_Biharmonic_batched
+
+# The OpenMP runtime that pythran_maths is linked with, used to set the
+# number of threads of the parallel loops
+_omp = None
+for _lib in ('gomp', 'omp', 'iomp5'):
+    if ctypes.util.find_library(_lib):
+        _omp = ctypes.CDLL(ctypes.util.find_library(_lib))
+        break
+
+def set_threads(threads):
+    """Set number of OpenMP threads used by the parallel kernels"""
+    if _omp is not None:
+        _omp.omp_set_num_threads(max(1, threads))
 
 def RK4(U_hat, U_hat0, U_hat1, dU, a, b, dt, solver, context):
-    loop1(U_hat, U_hat0, U_hat1)
+    # The register updates are pointwise, and work on flattened arrays
+    u, u0, u1 = U_hat.reshape(-1), U_hat0.reshape(-1), U_hat1.reshape(-1)
+    loop1(u, u0, u1)
     c = context
     for rk in range(4):
         dU = solver.ComputeRHS(dU, U_hat, solver, **c)
         if rk < 3:
-            loop2(dU, U_hat, U_hat0, b[rk], dt)
-        loop3(dU, U_hat1, a[rk], dt)
-    loop4(U_hat, U_hat1)
+            loop2(dU.reshape(-1), u, u0, b[rk], dt)
+        loop3(dU.reshape(-1), u1, a[rk], dt)
+    loop4(u, u1)
     return U_hat, dt, dt
 
 def ForwardEuler(U_hat, dU, dt, solver, context):
     dU = solver.ComputeRHS(dU, U_hat, solver, **context)
-    loop5(dU, U_hat, dt)
+    loop5(dU.reshape(-1), U_hat.reshape(-1), dt)
     return U_hat, dt, dt
 
 def AB2(U_hat, U_hat0, dU, dt, tstep, solver, context):
     dU = solver.ComputeRHS(dU, U_hat, solver, **context)
+    u, u0, du = U_hat.reshape(-1), U_hat0.reshape(-1), dU.reshape(-1)
     if tstep == 0:
-        loop5(dU, U_hat, dt)
+        loop5(du, u, dt)
     else:
-        loop6(dU, U_hat, U_hat0, dt)
-    loop7(dU, U_hat0, dt)
+        loop6(du, u, u0, dt)
+    loop7(du, u0, dt)
     return U_hat, dt, dt
 
+def RK2N(U_hat, U_hat1, dU, a, b, dt, solver, context):
+    u, u1 = U_hat.reshape(-1), U_hat1.reshape(-1)
+    for rk in range(a.shape[0]):
+        dU = solver.ComputeRHS(dU, U_hat, solver, **context)
+        lowstorage_stage(u, u1, dU.reshape(-1), a[rk], b[rk], dt, rk == 0)
+    return U_hat, dt, dt
+
+def RK2N_embedded(U_hat, U_hat1, err, dU, a, b, e, dt, solver, context):
+    u, u1, er = U_hat.reshape(-1), U_hat1.reshape(-1), err.reshape(-1)
+    for rk in range(a.shape[0]):
+        dU = solver.ComputeRHS(dU, U_hat, solver, **context)
+        lowstorage_stage_err(u, u1, er, dU.reshape(-1), a[rk], b[rk], e[rk], dt, rk == 0)
+    return U_hat, dt, dt
+
+def scaled_error(err, u0, u1, aTOL, rTOL, errnorm, work):
+    return _scaled_error(err.reshape(-1), u0.reshape(-1), u1.reshape(-1),
+                         aTOL, rTOL, errnorm == "inf")
+
+RK4_2D = RK4
+ForwardEuler_2D = ForwardEuler
+AB2_2D = AB2
+RK2N_2D = RK2N
+RK2N_embedded_2D = RK2N_embedded
+scaled_error_2D = scaled_error
+
 def cross2(c, a, b):
     if isinstance(a, list):
         c = cross2c(c, a[0][:, 0, 0], a[1][0, :, 0], a[2][0, 0, :], b)
@@ -33,11 +82,86 @@ def cross2(c, a, b):
         c = cross2a(c, a, b)
     return c
 
-def add_pressure_diffusion_NS(du, u_hat, nu, ksq, kk, p_hat, k_over_k2):
-    du = add_pressure_diffusion_NS_(du, u_hat, nu, ksq, kk[0][:, 0, 0],
-                                    kk[1][0, :, 0], kk[2][0, 0, :], p_hat, k_over_k2)
+def inverse_curl(c, K, b):
+    c = _inverse_curl(c, K[0][:, 0, 0], K[1][0, :, 0], K[2][0, 0, :], b)
+    return c
+
+def project(u, K):
+    u = _project(u, K[0][:, 0, 0], K[1][0, :, 0], K[2][0, 0, :])
+    return u
+
+def project_2D(u, K):
+    u = _project_2D(u, K[0][:, 0], K[1][0, :])
+    return u
+
+def gradient(c, K, a):
+    c = _gradient(c, K[0][:, 0, 0], K[1][0, :, 0], K[2][0, 0, :], a)
+    return c
+
+def add_pressure_diffusion_NS(du, u_hat, nu, kk, p_hat, work):
+    du = add_pressure_diffusion_NS_(du, u_hat, nu, kk[0][:, 0, 0],
+                                    kk[1][0, :, 0], kk[2][0, 0, :], p_hat)
     return du
 
 def mult_K1j(K, a, f):
     f = _mult_K1j(K[1][0, :, 0], K[2][0, 0], a, f)
     return f
+
+def cross2_2D(c, a, b):
+    if isinstance(a, list):
+        c = cross2c_2D(c, a[0][:, 0], a[1][0, :], b)
+    else:
+        c = cross2a_2D(c, a, b)
+    return c
+
+def inverse_curl_2D(c, K, b):
+    c = _inverse_curl_2D(c, K[0][:, 0], K[1][0, :], b)
+    return c
+
+def gradient_2D(c, K, a):
+    c = _gradient_2D(c, K[0][:, 0], K[1][0, :], a)
+    return c
+
+def assembleAB(H_hat0, H_hat, H_hat1):
+    _assembleAB(H_hat0.reshape(-1), H_hat.reshape(-1), H_hat1.reshape(-1))
+    return H_hat0
+
+def add_pressure_diffusion_NS2D(du, u_hat, nu, K, p_hat, work):
+    du = _add_pressure_diffusion_NS2D(du, u_hat, nu, K[0][:, 0], K[1][0, :], p_hat)
+    return du
+
+def add_pressure_diffusion_Bq2D(du, ur_hat, p_hat, K, nu, Ri, Pr, work):
+    du = _add_pressure_diffusion_Bq2D(du, ur_hat, p_hat, K[0][:, 0], K[1][0, :],
+                                      nu, Ri, Pr)
+    return du
+
+def add_pressure_diffusion_MHD(du, ub_hat, nu, eta, K, p_hat, work):
+    du = _add_pressure_diffusion_MHD(du, ub_hat, nu, eta, K[0][:, 0, 0],
+                                     K[1][0, :, 0], K[2][0, 0, :], p_hat)
+    return du
+
+def set_Elsasser(c, ZZ, K):
+    c = _set_Elsasser(c, ZZ, K[0][:, 0, 0], K[1][0, :, 0], K[2][0, 0, :])
+    return c
+
+def Elsasser_products(ZZ, work, ub):
+    _Elsasser_products(ZZ.reshape((9, -1)), ub.reshape((6, -1)))
+    return ZZ
+
+def add_linear_VV(rhs, w_hat, nu, K, Source, work):
+    rhs = _add_linear_VV(rhs, w_hat, nu, K[0][:, 0, 0], K[1][0, :, 0],
+                         K[2][0, 0, :], Source)
+    return rhs
+
+def add_linear_KMMRK3(rhs, u, g, work, AB, AC, SBB, ABB, BBB, nu, dt, K2, K4, a, b):
+    diff_g = work[(g, 1, False)]
+    w0 = work[(g, 2, False)]
+    w1 = work[(g, 3, False)]
+    w2 = work[(g, 4, False)]
+    diff_g = AB.matvec(g, diff_g)
+    _add_linear_KMMRK3(rhs[0], SBB.matvec(u, w0), ABB.matvec(u, w1),
+                       BBB.matvec(u, w2), K2, K4, nu*(a+b)*dt)
+    rhs[1] += diff_g
+    return rhs
+
+add_linear_KMMRK3_RB = add_linear_KMMRK3
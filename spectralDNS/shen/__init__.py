@@ -1,2 +1,4 @@
 from .Matrices import *
 from .LUsolve import *
+from .la import *
+from .pressure import *
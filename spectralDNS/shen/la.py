@@ -0,0 +1,100 @@
+"""
+Batched Helmholtz and Biharmonic solvers for the channel solvers
+
+The wall normal Helmholtz and Biharmonic problems of the channel solvers
+are one banded system for every local pair of Fourier wavenumbers. The
+solvers of shenfun compute the LU factors of all systems, but solve them
+one pair at the time, striding through memory along the Chebyshev axis.
+
+The solvers here reuse the LU factors of shenfun, and solve all pairs in
+one sweep over the Chebyshev index. Right hand sides, solutions and
+factors are viewed as arrays of shape (N, P), with N the Chebyshev index
+and P the number of wavenumber pairs. The pairs are split in blocks that
+are solved by params.threads threads in the kernels of the optimization
+backends, and each row of a block is contiguous in memory when the
+Chebyshev axis is the first. Without an optimized kernel, or for problems
+not covered by the kernels, the solvers of shenfun are used.
+"""
+import numpy as np
+from shenfun.chebyshev import la
+from spectralDNS import config
+from spectralDNS.optimization import _optimized
+
+__all__ = ['Helmholtz', 'Biharmonic']
+
+def _kernel(name):
+    """Return batched solve kernel of the current optimization, or None"""
+    optimization = config.params.optimization
+    backends = (optimization,)
+    if optimization == 'autotune':
+        from spectralDNS.optimization.autotune import preferred
+        backends = preferred
+    for backend in backends:
+        try:
+            fun = _optimized(name, 'double', backend)
+        except ImportError:
+            continue
+        if fun:
+            return fun
+    return None
+
+def _columns(a, axis):
+    """Return view of a with the Chebyshev axis first and all pairs second"""
+    if axis == 0:
+        return a.reshape((a.shape[0], -1))
+    return a.reshape((-1, a.shape[-1])).T
+
+def _batchable(solver, b, u):
+    """Return whether the pairs of b and u can be solved as (N, P) views"""
+    return (b.ndim == 3 and solver.axis in (0, b.ndim-1)
+            and not solver.bc_mats
+            and b.flags.c_contiguous and u.flags.c_contiguous
+            and b.dtype == u.dtype == np.complex128)
+
+class Helmholtz(la.Helmholtz):
+    """Helmholtz solver of shenfun with batched solves, see module docstring
+
+    Takes the same arguments as shenfun.chebyshev.la.Helmholtz. Neumann
+    problems are left to shenfun.
+    """
+    def __init__(self, *args):
+        la.Helmholtz.__init__(self, *args)
+        self._solve = None if self.neumann else _kernel('Solve_Helmholtz_batched')
+        self._work = None
+
+    def __call__(self, b, u=None, constraints=()):
+        if (self._solve is None or constraints != () or u is None
+                or not _batchable(self, b, u)):
+            return la.Helmholtz.__call__(self, b, u, constraints)
+        bc = _columns(b, self.axis)
+        if self._work is None or self._work.shape[1] != bc.shape[1]:
+            self._work = np.zeros((2, bc.shape[1]), dtype=b.dtype)
+        self._solve(bc, _columns(u, self.axis), _columns(self.u0, self.axis),
+                    _columns(self.u1, self.axis), _columns(self.u2, self.axis),
+                    _columns(self.L, self.axis), self._work)
+        return u
+
+class Biharmonic(la.Biharmonic):
+    """Biharmonic solver of shenfun with batched solves, see module docstring
+
+    Takes the same arguments as shenfun.chebyshev.la.Biharmonic. The even
+    and odd coefficients are solved in two sweeps.
+    """
+    def __init__(self, *args):
+        la.Biharmonic.__init__(self, *args)
+        self._solve = _kernel('Solve_Biharmonic_batched')
+        self._work = None
+
+    def __call__(self, b, u=None, **kw):
+        if self._solve is None or u is None or not _batchable(self, b, u):
+            return la.Biharmonic.__call__(self, b, u, **kw)
+        bc = _columns(b, self.axis)
+        uc = _columns(u, self.axis)
+        if self._work is None or self._work.shape[1] != bc.shape[1]:
+            self._work = np.zeros((2, bc.shape[1]), dtype=b.dtype)
+        for odd in (0, 1):
+            self._solve(odd, bc, uc, *[_columns(f[odd], self.axis) for f in
+                                       (self.u0, self.u1, self.u2, self.l0,
+                                        self.l1, self.ak, self.bk)],
+                        self.a0, self._work)
+        return u
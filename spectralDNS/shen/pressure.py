@@ -0,0 +1,99 @@
+"""
+Pressure recovery for the KMM channel solvers
+
+The KMM solvers eliminate the pressure, which is recovered from the wall
+normal momentum equation
+
+    dp/dx = nu div(grad(u)) - du/dt + H
+
+where u is the wall normal velocity, averaged over the last time step, and
+H is the wall normal convection. The equation is tested with Chebyshev
+polynomials T_k. The derivative matrix (T'_j, T_k)_w = pi j, for j > k and
+j+k odd, is strictly upper triangular, and the coefficients of p follow
+from the backward recursion
+
+    (k+1) p_{k+1} = (r_k - r_{k+2})/pi
+
+for all wavenumbers at once, where r is the tested right hand side. The
+equation of the highest T_k is replaced by the integral constraint
+p_0 = r_{N-1}. All matrices and work arrays are created once per context.
+"""
+import numpy as np
+from shenfun import Array, Function
+from shenfun.spectralbase import inner_product
+from spectralDNS import config
+
+__all__ = ['Pressure', 'pressure_solver']
+
+class Pressure(object):
+    """Pressure recovery of a KMM channel solver, see module docstring
+
+    args:
+        context      The solver's context
+
+    Calling an instance with the context and the solver returns the
+    pressure of the last time step in physical space. The returned Array
+    is overwritten by the next call.
+    """
+    def __init__(self, context):
+        c = context
+        self.axis = axis = [b.family() for b in c.FST.bases].index('chebyshev')
+        self.ATB = inner_product((c.CT, 0), (c.SB, 2))
+        self.BTB = inner_product((c.CT, 0), (c.SB, 0))
+        self.BTD = inner_product((c.CT, 0), (c.ST, 0))
+        N = c.CT.N
+        shape = [1]*c.FCT.dimensions
+        shape[axis] = N-1
+        self.scale = (1./(np.pi*np.arange(1, N))).reshape(shape)
+        self.r_hat = Function(c.FCT)
+        self.p_hat = Function(c.FCT)
+        self.p = Array(c.FCT)
+        self.um_hat = Function(c.VFS)
+        self.um = Array(c.VFS)
+
+    def __call__(self, context, solver):
+        c = context
+        params = config.params
+        i = self.axis
+        w0 = c.work[(self.r_hat, 0, False)]
+
+        # Velocity averaged over the last time step
+        um_hat = self.um_hat
+        um_hat[:] = c.U_hat
+        um_hat += c.U_hat0
+        um_hat *= 0.5
+
+        H_hat = solver.get_convection(**c)
+        r_hat = self.BTD.matvec(H_hat[i], self.r_hat, axis=i)
+        w1 = np.subtract(c.U_hat[i], c.U_hat0[i], out=c.work[(self.r_hat, 1, False)])
+        w0 = self.BTB.matvec(w1, w0, axis=i)
+        w0 *= 1./c.dt
+        r_hat -= w0
+        w0 = self.ATB.matvec(um_hat[i], w0, axis=i)
+        w0 *= params.nu
+        r_hat += w0
+        w0 = self.BTB.matvec(um_hat[i], w0, axis=i)
+        w0 *= c.K2
+        w0 *= params.nu
+        r_hat -= w0
+
+        # Backward recursion along the Chebyshev axis
+        r = np.moveaxis(r_hat, i, 0)
+        p = np.moveaxis(self.p_hat, i, 0)
+        p[0] = r[-1]
+        r[-1] = 0
+        p[1:-1] = r[:-2] - r[2:]
+        p[-1] = r[-2]
+        p[1:] *= np.moveaxis(self.scale, i, 0)
+
+        p = self.p_hat.backward(self.p)
+        if params.convection == 'Vortex':
+            um = um_hat.backward(self.um)
+            p -= 0.5*np.sum(um**2, axis=0)
+        return p
+
+def pressure_solver(context):
+    """Return Pressure of context, created on first call"""
+    if 'pressure_solver' not in context:
+        context.pressure_solver = Pressure(context)
+    return context.pressure_solver
@@ -29,7 +29,7 @@ def get_context():
 
     kw = {'padding_factor': 1.5 if params.dealias == '3/2-rule' else 1,
           'dealias_direct': params.dealias == '2/3-rule'}
-    Tp = T.get_dealiased(**kw)
+    Tp = get_dealiased(T, **kw)
     VTp = VectorSpace(Tp)
     VMp = CompositeSpace([Tp]*(dim+1))
 
@@ -39,13 +39,6 @@ def get_context():
     for i in range(dim):
         X[i] = X[i].astype(float)
         K[i] = K[i].astype(float)
-    K2 = np.zeros(T.shape(True), dtype=float)
-    for i in range(dim):
-        K2 += K[i]*K[i]
-
-    K_over_K2 = np.zeros(VT.shape(True), dtype=float)
-    for i in range(dim):
-        K_over_K2[i] = K[i] / np.where(K2 == 0, 1, K2)
 
     # Solution variables
     Ur = Array(VM)
@@ -98,6 +91,10 @@ def get_velocity(Ur, Ur_hat, **context):
     Ur[1] = Ur_hat[1].backward(Ur[1])
     return Ur[:2]
 
+def cfl_velocity(context):
+    """Return dealiased velocity computed by the last call to ComputeRHS"""
+    return context.ur_dealias[:2]
+
 def getConvection(convection):
     """Return function used to compute nonlinear term"""
     if convection in ("Standard", "Divergence", "Skewed"):
@@ -105,10 +102,31 @@ def getConvection(convection):
 
     elif convection == "Vortex":
 
+        buffers = {}
+
         def Conv(rhs, ur_hat, work, T, Tp, VM, VMp, K, ur_dealias):
             curl_dealias = work[(ur_dealias[0], 0, False)]
             F_tmp = work[(rhs, 0, True)]
 
+            if params.batch_transforms:
+                # Velocity, density and vorticity in one batched call
+                if not buffers:
+                    buffers['backward'] = multi_transform(Tp.backward, 4)
+                    buffers['forward'] = multi_transform(Tp.forward, 4)
+                    buffers['uw'] = np.empty((4,)+ur_dealias.shape[1:],
+                                             dtype=ur_dealias.dtype)
+                F_tmp[0] = cross2(F_tmp[0], K, ur_hat[:2])
+                buffers['backward'](list(ur_hat)+[F_tmp[0]],
+                                    list(ur_dealias)+[curl_dealias])
+                uw = buffers['uw']
+                np.multiply(ur_dealias[1], curl_dealias, out=uw[0])
+                np.multiply(ur_dealias[0], curl_dealias, out=uw[1])
+                uw[1] *= -1
+                np.multiply(ur_dealias[:2], ur_dealias[2], out=uw[2:])
+                buffers['forward'](uw, [rhs[0], rhs[1], F_tmp[0], F_tmp[1]])
+                rhs[2] = -1j*(K[0]*F_tmp[0]+K[1]*F_tmp[1])
+                return rhs
+
             ur_dealias = VMp.backward(ur_hat, ur_dealias)
 
             u_dealias = ur_dealias[:2]
@@ -128,25 +146,38 @@ def getConvection(convection):
     return Conv
 
 @optimizer
-def add_pressure_diffusion(rhs, ur_hat, P_hat, K_over_K2, K, K2, nu, Ri, Pr):
+def add_pressure_diffusion(rhs, ur_hat, P_hat, K, nu, Ri, Pr, work):
     u_hat = ur_hat[:2]
     rho_hat = ur_hat[2]
+    K2 = wavenumber_squared(K, work[(P_hat.real, 0, False)])
 
     # Compute pressure (To get actual pressure multiply by 1j)
-    P_hat = np.sum(rhs[:2]*K_over_K2, 0, out=P_hat)
-    P_hat -= Ri*rho_hat*K_over_K2[1]
+    P_hat = np.multiply(K[0], rhs[0], out=P_hat)
+    P_hat += K[1]*(rhs[1] - Ri*rho_hat)
+    P_hat = np.divide(P_hat, K2, out=P_hat, where=K2 != 0)
 
     # Add pressure gradient
     for i in range(2):
         rhs[i] -= P_hat*K[i]
 
     # Add contribution from diffusion
-    rhs[0] -= nu*K2*u_hat[0]
-    rhs[1] -= (nu*K2*u_hat[1] + Ri*rho_hat)
-    rhs[2] -= nu*K2*rho_hat/Pr
+    rhs[1] -= Ri*rho_hat
+    K2 *= nu
+    rhs[0] -= K2*u_hat[0]
+    rhs[1] -= K2*u_hat[1]
+    K2 /= Pr
+    rhs[2] -= K2*rho_hat
     return rhs
 
-def ComputeRHS(rhs, ur_hat, solver, work, K, K2, K_over_K2, P_hat, T, Tp,
+def linear_operator(context):
+    """Return diagonal linear operator (diffusion) of the rhs"""
+    K2 = wavenumber_squared(context.K)
+    L = np.zeros((3,)+K2.shape, dtype=K2.dtype)
+    L[:2] = -params.nu*K2
+    L[2] = -params.nu*K2/params.Pr
+    return L
+
+def ComputeRHS(rhs, ur_hat, solver, work, K, P_hat, T, Tp,
                VM, VMp, ur_dealias, mask, **context):
     """Compute and return right hand side of 2D Navier Stokes equations
     on Boussinesq form
@@ -161,16 +192,14 @@ def ComputeRHS(rhs, ur_hat, solver, work, K, K2, K_over_K2, P_hat, T, Tp,
 
     Remaining args may be extracted from context:
         work        Work arrays
-        K           Scaled wavenumber mesh
-        K2          K[0]*K[0] + K[1]*K[1] + K[2]*K[2]
-        K_over_K2   K / K2
+        K           Scaled, broadcastable wavenumber mesh
         P_hat       Transformed pressure
 
     """
     rhs = solver.conv(rhs, ur_hat, work, T, Tp, VM, VMp, K, ur_dealias)
     if mask is not None:
         rhs.mask_nyquist(mask)
-    rhs = solver.add_pressure_diffusion(rhs, ur_hat, P_hat, K_over_K2, K, K2,
-                                        params.nu, params.Ri, params.Pr)
+    rhs = solver.add_pressure_diffusion(rhs, ur_hat, P_hat, K, params.nu,
+                                        params.Ri, params.Pr, work)
 
     return rhs
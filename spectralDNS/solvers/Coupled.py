@@ -7,11 +7,13 @@ __license__ = "GNU Lesser GPL version 3 or any later version"
 
 from shenfun.spectralbase import inner_product
 
+from spectralDNS.utilities.transforms import multi_transform
 from .spectralinit import *
 from shenfun import TensorProductSpace, Array, TestFunction, TrialFunction, \
     CompositeSpace, div, grad, Dx, curl, inner, Function, FunctionSpace, \
     VectorSpace, BlockMatrix, project
 from ..shen.Matrices import HelmholtzCoeff
+from .KMM import cfl_velocity, cfl_spacing
 
 
 def get_context():
@@ -98,19 +100,13 @@ def get_context():
     ut, pt = up
     vt, qt = vq
 
-    alfa = 2./nu/dt
-    a0 = inner(vt, (2./nu/dt)*ut-div(grad(ut)))
-    a1 = inner(vt, (2./nu)*grad(pt))
-    a2 = inner(qt, (2./nu)*div(ut))
-
-    M = BlockMatrix(a0+a1+a2)
-
-    # Collect all matrices
+    # Collect all matrices. Matrices that depend on dt are set by set_dt
     mat = config.AttributeDict(
         dict(CDD=inner_product((ST, 0), (ST, 1)),
-             AB=HelmholtzCoeff(N[0], 1., alfa-K2, 0, ST.quad),))
+             BDD=inner_product((ST, 0), (ST, 0)),))
 
     la = None
+    dt_cache = {}
 
     hdf5file = CoupledFile(config.params.solver,
                         checkpoint={'space': VQ,
@@ -119,7 +115,24 @@ def get_context():
                         results={'space': VFS,
                                  'data': {'U': [U]}})
 
-    return config.AttributeDict(locals())
+    context = config.AttributeDict(locals())
+    set_dt(context, dt, dt_operators)
+    return context
+
+def dt_operators(context, dt):
+    """Return block matrix and matrices that depend on the time step dt
+
+    The block matrix is factorized by its first solve, and the factors are
+    kept with it in the dt_cache.
+    """
+    nu, N = params.nu, params.N
+    ut, pt = context.up
+    vt, qt = context.vq
+    a0 = inner(vt, (2./nu/dt)*ut-div(grad(ut)))
+    a1 = inner(vt, (2./nu)*grad(pt))
+    a2 = inner(qt, (2./nu)*div(ut))
+    return {'M': BlockMatrix(a0+a1+a2),
+            'mat': dict(AB=HelmholtzCoeff(N[0], 1., 2./nu/dt-context.K2, 0, context.ST.quad))}
 
 class CoupledFile(HDF5File):
     def update_components(self, U_hat, U, **context):
@@ -165,6 +178,9 @@ def get_divergence(U_hat, FST, mask, **context):
 def Cross(c, a, b, FSTp, work):
     Uc = work[(a, 2, False)]
     Uc = cross1(Uc, a, b)
+    if params.pipeline_transforms:
+        c = multi_transform(FSTp.forward, 3)(Uc, c)
+        return c
     c[0] = FSTp.forward(Uc[0], c[0])
     c[1] = FSTp.forward(Uc[1], c[1])
     c[2] = FSTp.forward(Uc[2], c[2])
@@ -286,7 +302,7 @@ def assembleAB(H_hat0, H_hat, H_hat1):
 
 def ComputeRHS(rhs, u_hat, solver,
                H_hat, H_hat1, H_hat0, VFSp, FSTp, FCTp, VCp, work, K, K2,
-               u_dealias, curl_dealias, curl_hat, mat, la, vt, Sk, mask, **context):
+               u_dealias, curl_dealias, curl_hat, mat, la, Sk, mask, **context):
     """Compute right hand side of Navier Stokes
 
     Parameters
@@ -311,14 +327,14 @@ def ComputeRHS(rhs, u_hat, solver,
     if mask is not None:
         H_hat0.mask_nyquist(mask)
 
-    # Assemble rhs
+    # Assemble rhs with diffusion and convection
     rhs_u, rhs_p = rhs
-    rhs_u[0] = mat.AB.matvec(u_hat[0], rhs_u[0])
-    rhs_u[1] = mat.AB.matvec(u_hat[1], rhs_u[1])
-    rhs_u[2] = mat.AB.matvec(u_hat[2], rhs_u[2])
-
-    # Convection
-    rhs_u[:] += 2./params.nu*inner(vt, H_hat0)
+    w0 = work[(H_hat0[0], 0, False)]
+    for i in range(3):
+        rhs_u[i] = mat.AB.matvec(u_hat[i], rhs_u[i])
+        w0 = mat.BDD.matvec(H_hat0[i], w0)
+        w0 *= 2./params.nu
+        rhs_u[i] += w0
 
     # Source
     rhs_u[1] -= 2./params.nu*Sk[1]
@@ -338,5 +354,6 @@ def integrate(up_hat, rhs, dt, solver, context):
 
 def getintegrator(rhs, u0, solver, context):
     def func():
+        solver.set_dt(context, params.dt, solver.dt_operators)
         return solver.integrate(u0, rhs, params.dt, solver, context)
     return func
@@ -7,11 +7,13 @@ __license__ = "GNU Lesser GPL version 3 or any later version"
 
 from shenfun.spectralbase import inner_product
 
+from spectralDNS.utilities.transforms import multi_transform
 from .spectralinit import *
 from shenfun import TensorProductSpace, Array, TestFunction, TrialFunction, \
     CompositeSpace, div, grad, Dx, curl, inner, Function, FunctionSpace, \
     VectorSpace, BlockMatrix, project
 from ..shen.Matrices import HelmholtzCoeff
+from .KMM import cfl_velocity, cfl_spacing
 
 
 def get_context():
@@ -101,24 +103,13 @@ def get_context():
     ut, pt = up
     vt, qt = vq
 
-    M = []
-    for rk in range(3):
-        a0 = inner(vt, (2./nu/dt/(a[rk]+b[rk]))*ut-div(grad(ut)))
-        a1 = inner(vt, (2./nu/(a[rk]+b[rk]))*grad(pt))
-        a2 = inner(qt, (2./nu/(a[rk]+b[rk]))*div(ut))
-        M.append(BlockMatrix(a0+a1+a2))
-
-    # Collect all matrices
-    if ST.family() == 'chebyshev':
-        mat = config.AttributeDict(
-            dict(AB=[HelmholtzCoeff(N[0], 1., -(K2 - 2./nu/dt/(a[rk]+b[rk])), 0, ST.quad) for rk in range(3)],))
-    else:
-        mat = config.AttributeDict(
-            dict(ADD=inner_product((ST, 0), (ST, 2)),
-                 BDD=inner_product((ST, 0), (ST, 0)))
-        )
+    # Collect all matrices. Matrices that depend on dt are set by set_dt
+    mat = config.AttributeDict(
+        dict(ADD=inner_product((ST, 0), (ST, 2)),
+             BDD=inner_product((ST, 0), (ST, 0)),))
 
     la = None
+    dt_cache = {}
 
     hdf5file = CoupledRK3File(config.params.solver,
                         checkpoint={'space': VQ,
@@ -126,8 +117,31 @@ def get_context():
                         results={'space': VFS,
                                  'data': {'U': [U]}})
 
-    del rk
-    return config.AttributeDict(locals())
+    context = config.AttributeDict(locals())
+    set_dt(context, dt, dt_operators)
+    return context
+
+def dt_operators(context, dt):
+    """Return block matrices and matrices that depend on the time step dt
+
+    RK 3 requires three of each because of the three different coefficients.
+    The block matrices are factorized by their first solve, and the factors
+    are kept with them in the dt_cache.
+    """
+    nu, N = params.nu, params.N
+    a, b, K2 = context.a, context.b, context.K2
+    ut, pt = context.up
+    vt, qt = context.vq
+    M = []
+    for rk in range(3):
+        a0 = inner(vt, (2./nu/dt/(a[rk]+b[rk]))*ut-div(grad(ut)))
+        a1 = inner(vt, (2./nu/(a[rk]+b[rk]))*grad(pt))
+        a2 = inner(qt, (2./nu/(a[rk]+b[rk]))*div(ut))
+        M.append(BlockMatrix(a0+a1+a2))
+    if context.ST.family() != 'chebyshev':
+        return {'M': M}
+    return {'M': M,
+            'mat': dict(AB=[HelmholtzCoeff(N[0], 1., -(K2 - 2./nu/dt/(a[rk]+b[rk])), 0, context.ST.quad) for rk in range(3)])}
 
 class CoupledRK3File(HDF5File):
     def update_components(self, U_hat, U, **context):
@@ -171,6 +185,9 @@ def get_divergence(U_hat, FST, mask, **context):
 def Cross(c, a, b, FSTp, work):
     Uc = work[(a, 2, False)]
     Uc = cross1(Uc, a, b)
+    if params.pipeline_transforms:
+        c = multi_transform(FSTp.forward, 3)(Uc, c)
+        return c
     c[0] = FSTp.forward(Uc[0], c[0])
     c[1] = FSTp.forward(Uc[1], c[1])
     c[2] = FSTp.forward(Uc[2], c[2])
@@ -287,7 +304,7 @@ def getConvection(convection):
 
 def ComputeRHS(rhs, u_hat, rk, solver,
                H_hat, VFSp, FSTp, FCTp, VCp, work, K, K2,
-               u_dealias, curl_dealias, curl_hat, mat, la, vt, Sk, hv, a, b,
+               u_dealias, curl_dealias, curl_hat, mat, la, Sk, hv, a, b,
                mask, **context):
     """Compute right hand side of Navier Stokes
 
@@ -329,12 +346,15 @@ def ComputeRHS(rhs, u_hat, rk, solver,
         rhs_u[2] += mat.ADD.matvec(u_hat[2], w0)
 
     # Convection
-    hv[1] = inner(vt, H_hat)
+    for i in range(3):
+        hv[1, i] = mat.BDD.matvec(H_hat[i], hv[1, i])
 
     # Source
     hv[1, 1] -= Sk[1]
 
-    rhs_u[:] += (hv[1]*a[rk] + hv[0]*b[rk])*2./params.nu/(a[rk]+b[rk])
+    w1 = work[(H_hat, 0, False)]
+    rhs_u += np.multiply(hv[1], 2.*a[rk]/params.nu/(a[rk]+b[rk]), out=w1)
+    rhs_u += np.multiply(hv[0], 2.*b[rk]/params.nu/(a[rk]+b[rk]), out=w1)
 
     hv[0] = hv[1]
 
@@ -352,5 +372,6 @@ def integrate(up_hat, rhs, dt, solver, context):
 
 def getintegrator(rhs, u0, solver, context):
     def func():
+        solver.set_dt(context, params.dt, solver.dt_operators)
         return solver.integrate(u0, rhs, params.dt, solver, context)
     return func
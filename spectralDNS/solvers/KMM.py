@@ -10,15 +10,21 @@ from shenfun.la import TDMA
 from shenfun import TensorProductSpace, Array, TestFunction, TrialFunction, \
     CompositeSpace, div, grad, Dx, inner, Function, FunctionSpace, \
     VectorSpace
-from shenfun.chebyshev.la import Helmholtz, Biharmonic
+from ..shen.la import Helmholtz, Biharmonic
 
+from spectralDNS.utilities.transforms import multi_transform
 from .spectralinit import *
 from ..shen.Matrices import BiharmonicCoeff, HelmholtzCoeff
 from ..shen import LUsolve
+from ..shen.pressure import pressure_solver
 from shenfun import project, div
 
-def get_context():
-    """Set up context for solver"""
+def get_context(set_operators=True):
+    """Set up context for solver
+
+    The dt dependent items of dt_operators are only set if set_operators is
+    True. Solvers that extend the context set their own once they are done.
+    """
 
     # Get points and weights for Chebyshev weighted integrals
     assert params.Dquad == params.Bquad
@@ -83,7 +89,7 @@ def get_context():
     K2 = K[1]*K[1]+K[2]*K[2]
     K4 = K2**2
 
-    K_over_K2 = np.zeros((2,)+g.shape)
+    K_over_K2 = np.zeros((2,)+K2.shape)
     for i in range(2):
         K_over_K2[i] = K[i+1] / np.where(K2 == 0, 1, K2)
 
@@ -99,13 +105,9 @@ def get_context():
 
     nu, dt, N = params.nu, params.dt, params.N
 
-    alfa = K2 - 2.0/nu/dt
-
-    # Collect all matrices
+    # Collect all matrices. Matrices that depend on dt are set by set_dt
     mat = config.AttributeDict(
         dict(CDD=inner_product((ST, 0), (ST, 1)),
-             AB=HelmholtzCoeff(N[0], 1., -(K2 - 2.0/nu/dt), 0, ST.quad),
-             AC=BiharmonicCoeff(N[0], nu*dt/2., (1. - nu*dt*K2), -(K2 - nu*dt/2.*K4), 0, SB.quad),
              # Matrices for biharmonic equation
              CBD=inner_product((SB, 0), (ST, 1)),
              ABB=inner_product((SB, 0), (SB, 2)),
@@ -120,13 +122,8 @@ def get_context():
              BDD0=inner_product((ST0, 0), (ST0, 0)),))
 
     la = config.AttributeDict(
-        dict(HelmholtzSolverG=Helmholtz(mat.ADD, mat.BDD, -np.ones((1, 1, 1)),
-                                        (K2+2.0/nu/dt)),
-             BiharmonicSolverU=Biharmonic(mat.SBB, mat.ABB, mat.BBB, -nu*dt/2.*np.ones((1, 1, 1)),
-                                          (1.+nu*dt*K2),
-                                          (-(K2 + nu*dt/2.*K4))),
-             HelmholtzSolverU0=Helmholtz(mat.ADD0, mat.BDD0, np.array([-1.]), np.array([2./nu/dt])),
-             TDMASolverD=TDMA(inner_product((ST, 0), (ST, 0)))))
+        dict(TDMASolverD=TDMA(inner_product((ST, 0), (ST, 0)))))
+    dt_cache = {}
 
     hdf5file = KMMFile(config.params.solver,
                        checkpoint={'space': VFS,
@@ -135,7 +132,26 @@ def get_context():
                        results={'space': VFS,
                                 'data': {'U': [U]}})
 
-    return config.AttributeDict(locals())
+    context = config.AttributeDict(locals())
+    if set_operators:
+        set_dt(context, dt, dt_operators)
+    return context
+
+def dt_operators(context, dt):
+    """Return matrices and solvers that depend on the time step dt"""
+    nu, N = params.nu, params.N
+    K2, K4, mat = context.K2, context.K4, context.mat
+    return {'mat': dict(AB=HelmholtzCoeff(N[0], 1., -(K2 - 2.0/nu/dt), 0, context.ST.quad),
+                        AC=BiharmonicCoeff(N[0], nu*dt/2., (1. - nu*dt*K2),
+                                           -(K2 - nu*dt/2.*K4), 0, context.SB.quad)),
+            'la': dict(HelmholtzSolverG=Helmholtz(mat.ADD, mat.BDD, -np.ones((1, 1, 1)),
+                                                  (K2+2.0/nu/dt)),
+                       BiharmonicSolverU=Biharmonic(mat.SBB, mat.ABB, mat.BBB,
+                                                    -nu*dt/2.*np.ones((1, 1, 1)),
+                                                    (1.+nu*dt*K2),
+                                                    (-(K2 + nu*dt/2.*K4))),
+                       HelmholtzSolverU0=Helmholtz(mat.ADD0, mat.BDD0, np.array([-1.]),
+                                                   np.array([2./nu/dt])))}
 
 class KMMFile(HDF5File):
     def update_components(self, U_hat, U, **context):
@@ -175,47 +191,26 @@ def get_convection(H_hat, U_hat, g, K, VFSp, FSTp, FSBp, FCTp, work, mat, la, u_
     H_hat = conv_(H_hat, U_hat, g, K, VFSp, FSTp, FSBp, FCTp, work, mat, la, u_dealias)
     return H_hat
 
-def get_pressure(context, solver):
-    FCT = context.FCT
-    FST = context.FST
-
-    U_hat = context.U_hat
-    U_hat0 = context.U_hat0
-    Um = Function(FST)
-    Um[:] = 0.5*(U_hat[0] + U_hat0[0])
-    U = U_hat.backward(context.U)
-    U0 = U_hat0.backward(context.U0)
-    dt = solver.params.dt
-
-    Hx = Function(FST)
-    Hx[:] = solver.get_convection(**context)[0]
+def cfl_velocity(context):
+    """Return dealiased velocity computed by the convection of the last step"""
+    return context.u_dealias
 
-    v = TestFunction(FCT)
-    p = TrialFunction(FCT)
-    rhs_hat = inner(context.nu*div(grad(Um)), v)
-    Hx -= 1./dt*(U_hat[0]-U_hat0[0])
-    rhs_hat += inner(Hx, v)
+def cfl_spacing(context):
+    """Return mesh size used by the CFL controller
 
-    CT = inner(Dx(p, 0, 1), v)
-
-    # Should implement fast solver. Just a backwards substitution
-    # Apply integral constraint
-    A = CT.mats[0]
-    N = A.shape[0]
-    A[-(N-1)] = 1
-
-    p_hat = Function(FCT)
-    p_hat = CT.solve(rhs_hat, p_hat)
-
-    p = Array(FCT)
-    p = FCT.backward(p_hat, p)
-
-    uu = 0.
-    if params.convection == 'Vortex':
-        uu = np.sum((0.5*(U+U0))**2, 0)
-        uu *= 0.5
+    The wall normal size is half the distance between the two neighbouring
+    Chebyshev points, interpolated to the dealiased mesh of cfl_velocity.
+    """
+    x = np.squeeze(context.FST.mesh()[0])
+    xp = np.squeeze(context.FSTp.mesh()[0])
+    i = np.argsort(x)
+    dx = np.interp(xp, x[i], np.abs(np.gradient(x))[i])
+    dx = dx[context.FSTp.local_slice(False)[0]]
+    return [dx[:, None, None], params.L[1]/params.N[1], params.L[2]/params.N[2]]
 
-    return p-uu
+def get_pressure(context, solver):
+    """Return pressure of the last time step, see spectralDNS.shen.pressure"""
+    return pressure_solver(context)(context, solver)
 
 def get_divergence(U, U_hat, FST, K, work, la, mat, **context):
     Uc_hat = work[(U_hat[0], 0, True)]
@@ -234,6 +229,9 @@ def get_divergence(U, U_hat, FST, K, work, la, mat, **context):
 def Cross(c, a, b, FSTp, work):
     Uc = work[(a, 2, False)]
     Uc = cross1(Uc, a, b)
+    if params.pipeline_transforms:
+        c = multi_transform(FSTp.forward, 3)(Uc, c)
+        return c
     c[0] = FSTp.forward(Uc[0], c[0])
     c[1] = FSTp.forward(Uc[1], c[1])
     c[2] = FSTp.forward(Uc[2], c[2])
@@ -518,5 +516,6 @@ def integrate(u_hat, g_hat, rhs, dt, solver, context):
 def getintegrator(rhs, u0, solver, context):
     u_hat, g_hat = u0
     def func():
+        solver.set_dt(context, params.dt, solver.dt_operators)
         return solver.integrate(u_hat, g_hat, rhs, params.dt, solver, context)
     return func
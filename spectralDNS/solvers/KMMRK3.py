@@ -10,8 +10,8 @@ from .spectralinit import end_of_tstep
 
 KMM_context = get_context
 
-def get_context():
-    c = KMM_context()
+def get_context(set_operators=True):
+    c = KMM_context(False)
     del c.U0, c.U_hat0
 
     nu, dt, N = params.nu, params.dt, params.N
@@ -24,28 +24,33 @@ def get_context():
     c.a = a = (8./15., 5./12., 3./4.)
     c.b = b = (0.0, -17./60., -5./12.)
 
-    # Collect all matrices
-    c.mat.AC = [BiharmonicCoeff(N[0], nu*(a[rk]+b[rk])*dt/2., (1. - nu*(a[rk]+b[rk])*dt*c.K2),
-                                -(c.K2 - nu*(a[rk]+b[rk])*dt/2.*c.K4), 0, c.SB.quad) for rk in range(3)]
-    c.mat.AB = [HelmholtzCoeff(N[0], 1.0, -(c.K2 - 2.0/nu/dt/(a[rk]+b[rk])), 0, c.ST.quad) for rk in range(3)]
-
-    # Collect all linear algebra solvers
-    # RK 3 requires three solvers because of the three different coefficients
-    c.la = config.AttributeDict(
-        dict(HelmholtzSolverG=[Helmholtz(c.mat.ADD, c.mat.BDD, -np.ones((1, 1, 1)),
-                                         (c.K2+2.0/nu/(a[rk]+b[rk])/dt))
-                               for rk in range(3)],
-             BiharmonicSolverU=[Biharmonic(c.mat.SBB, c.mat.ABB, c.mat.BBB, -nu*(a[rk]+b[rk])*dt/2.*np.ones((1, 1, 1)),
-                                           (1.+nu*(a[rk]+b[rk])*dt*c.K2),
-                                           -(c.K2 + nu*(a[rk]+b[rk])*dt/2.*c.K4))
-                                for rk in range(3)],
-             HelmholtzSolverU0=[Helmholtz(c.mat.ADD0, c.mat.BDD0, np.array([-1]), np.array([2./nu/(a[rk]+b[rk])/dt])) for rk in range(3)],
-             TDMASolverD=TDMA(inner_product((c.ST, 0), (c.ST, 0)))))
+    # Matrices and solvers that depend on dt
+    if set_operators:
+        set_dt(c, dt, dt_operators)
 
     del c.hdf5file.checkpoint['data']['1'] # No need for previous time step
 
     return c
 
+def dt_operators(context, dt):
+    """Return matrices and solvers that depend on the time step dt
+
+    RK 3 requires three of each because of the three different coefficients
+    """
+    nu, N = params.nu, params.N
+    a, b, K2, K4, mat = context.a, context.b, context.K2, context.K4, context.mat
+    return {'mat': dict(AC=[BiharmonicCoeff(N[0], nu*(a[rk]+b[rk])*dt/2., (1. - nu*(a[rk]+b[rk])*dt*K2),
+                                            -(K2 - nu*(a[rk]+b[rk])*dt/2.*K4), 0, context.SB.quad) for rk in range(3)],
+                        AB=[HelmholtzCoeff(N[0], 1.0, -(K2 - 2.0/nu/dt/(a[rk]+b[rk])), 0, context.ST.quad) for rk in range(3)]),
+            'la': dict(HelmholtzSolverG=[Helmholtz(mat.ADD, mat.BDD, -np.ones((1, 1, 1)),
+                                                   (K2+2.0/nu/(a[rk]+b[rk])/dt))
+                                         for rk in range(3)],
+                       BiharmonicSolverU=[Biharmonic(mat.SBB, mat.ABB, mat.BBB, -nu*(a[rk]+b[rk])*dt/2.*np.ones((1, 1, 1)),
+                                                     (1.+nu*(a[rk]+b[rk])*dt*K2),
+                                                     -(K2 + nu*(a[rk]+b[rk])*dt/2.*K4))
+                                          for rk in range(3)],
+                       HelmholtzSolverU0=[Helmholtz(mat.ADD0, mat.BDD0, np.array([-1]), np.array([2./nu/(a[rk]+b[rk])/dt])) for rk in range(3)])}
+
 @optimizer
 def add_linear(rhs, u, g, work, AB, AC, SBB, ABB, BBB, nu, dt, K2, K4, a, b):
     diff_u = work[(g, 0, False)]
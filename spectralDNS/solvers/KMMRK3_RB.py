@@ -9,11 +9,12 @@ from .KMMRK3 import *
 from .spectralinit import end_of_tstep
 
 KMMRK3_context = get_context
+KMMRK3_dt_operators = dt_operators
 KMMRK3_ComputeRHS = ComputeRHS
 KMMRK3_solve_linear = solve_linear
 
 def get_context():
-    c = KMMRK3_context()
+    c = KMMRK3_context(False)
 
     c.RB = RB = FunctionSpace(config.params.N[0], 'C', bc=(1, 0))
     c.FRB = FRB = TensorProductSpace(comm, (RB, c.K0, c.K1), **c.kw0)
@@ -30,16 +31,15 @@ def get_context():
     # primary variable
     c.u = (c.U_hat, c.g, c.phi_hat)
 
-    dt, kappa = config.params.dt, config.params.kappa
-    ADD = inner_product((RB, 0), (RB, 2))
-    BDD = inner_product((RB, 0), (RB, 0))
     c.CTD = inner_product((c.CT, 0), (RB, 1))
     c.BTT = inner_product((c.CT, 0), (c.CT, 0))
     c.mat.ABD = inner_product((c.SB, 0), (RB, 2))
     c.mat.BBD = inner_product((c.SB, 0), (RB, 0))
-    c.la.HelmholtzSolverT = [Helmholtz(ADD, BDD, -np.ones((1, 1, 1)),
-                                       (c.K2[0]+2.0/kappa/(c.a[rk]+c.b[rk])/dt)[np.newaxis, :, :]) for rk in range(3)]
-    c.TC = [HelmholtzCoeff(config.params.N[0], 1.0, (2./kappa/dt/(c.a[rk]+c.b[rk])-c.K2), 0, c.ST.quad) for rk in range(3)]
+    c.mat.ARR = inner_product((RB, 0), (RB, 2))
+    c.mat.BRR = inner_product((RB, 0), (RB, 0))
+
+    # The dt dependent solvers and matrices of KMMRK3 and phi
+    set_dt(c, config.params.dt, dt_operators)
 
     c.hdf5file = RBFile(config.params.solver,
                         checkpoint={'space': c.VFS,
@@ -49,6 +49,17 @@ def get_context():
 
     return c
 
+def dt_operators(context, dt):
+    """Return matrices and solvers that depend on the time step dt"""
+    kappa, a, b = config.params.kappa, context.a, context.b
+    items = KMMRK3_dt_operators(context, dt)
+    items['la']['HelmholtzSolverT'] = [Helmholtz(context.mat.ARR, context.mat.BRR, -np.ones((1, 1, 1)),
+                                                 (context.K2[0]+2.0/kappa/(a[rk]+b[rk])/dt)[np.newaxis, :, :])
+                                       for rk in range(3)]
+    items['TC'] = [HelmholtzCoeff(config.params.N[0], 1.0, (2./kappa/dt/(a[rk]+b[rk])-context.K2), 0,
+                                  context.ST.quad) for rk in range(3)]
+    return items
+
 class RBFile(HDF5File):
     def update_components(self, U, U_hat, phi, phi_hat, **context):
         """Transform to real data when storing the solution"""
@@ -130,5 +141,6 @@ def integrate(u_hat, g_hat, p_hat, rhs, dt, solver, context):
 def getintegrator(rhs, u0, solver, context):
     u_hat, g_hat, p_hat = u0
     def func():
+        solver.set_dt(context, params.dt, solver.dt_operators)
         return solver.integrate(u_hat, g_hat, p_hat, rhs, params.dt, solver, context)
     return func
@@ -9,11 +9,12 @@ from .KMM import *
 from .spectralinit import end_of_tstep
 
 KMM_context = get_context
+KMM_dt_operators = dt_operators
 KMM_ComputeRHS = ComputeRHS
 KMM_solve_linear = solve_linear
 
 def get_context():
-    c = KMM_context()
+    c = KMM_context(False)
 
     c.RB = RB = FunctionSpace(config.params.N[0], 'C', bc=(1, 0))
     c.FRB = FRB = TensorProductSpace(comm, (RB, c.K0, c.K1), **c.kw0)
@@ -33,17 +34,15 @@ def get_context():
     # primary variable
     c.u = (c.U_hat, c.g, c.phi_hat)
 
-    dt, kappa = config.params.dt, config.params.kappa
-    ADD = inner_product((RB, 0), (RB, 2))
-    BDD = inner_product((RB, 0), (RB, 0))
     c.CTD = inner_product((c.CT, 0), (RB, 1))
     c.BTT = inner_product((c.CT, 0), (c.CT, 0))
     c.mat.ABD = inner_product((c.SB, 0), (RB, 2))
     c.mat.BBD = inner_product((c.SB, 0), (RB, 0))
-    c.la.HelmholtzSolverT = Helmholtz(ADD, BDD,
-                                      -np.ones((1, 1, 1)),
-                                      (c.K2[0]+2.0/kappa/dt)[np.newaxis, :, :])
-    c.TC = HelmholtzCoeff(config.params.N[0], 1.0, (2./kappa/dt-c.K2), 0)
+    c.mat.ARR = inner_product((RB, 0), (RB, 2))
+    c.mat.BRR = inner_product((RB, 0), (RB, 0))
+
+    # The dt dependent solvers and matrices of KMM and phi
+    set_dt(c, config.params.dt, dt_operators)
 
     c.hdf5file = RBFile(config.params.solver,
                         checkpoint={'space': c.VFS,
@@ -54,6 +53,16 @@ def get_context():
 
     return c
 
+def dt_operators(context, dt):
+    """Return matrices and solvers that depend on the time step dt"""
+    kappa = config.params.kappa
+    items = KMM_dt_operators(context, dt)
+    items['la']['HelmholtzSolverT'] = Helmholtz(context.mat.ARR, context.mat.BRR,
+                                                -np.ones((1, 1, 1)),
+                                                (context.K2[0]+2.0/kappa/dt)[np.newaxis, :, :])
+    items['TC'] = HelmholtzCoeff(config.params.N[0], 1.0, (2./kappa/dt-context.K2), 0)
+    return items
+
 class RBFile(HDF5File):
     def update_components(self, U, U_hat, phi, phi_hat, **context):
         """Transform to real data when storing the solution"""
@@ -163,5 +172,6 @@ def integrate(u_hat, g_hat, p_hat, rhs, dt, solver, context):
 def getintegrator(rhs, u0, solver, context):
     u_hat, g_hat, p_hat = u0
     def func():
+        solver.set_dt(context, params.dt, solver.dt_operators)
         return solver.integrate(u_hat, g_hat, p_hat, rhs, params.dt, solver, context)
     return func
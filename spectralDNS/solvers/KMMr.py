@@ -9,11 +9,13 @@ from shenfun.spectralbase import inner_product
 from shenfun.la import TDMA
 from shenfun import TensorProductSpace, Array, TestFunction, TrialFunction, \
     CompositeSpace, div, grad, Dx, inner, Function, FunctionSpace, VectorSpace
-from shenfun.chebyshev.la import Helmholtz, Biharmonic
+from ..shen.la import Helmholtz, Biharmonic
 
+from spectralDNS.utilities.transforms import multi_transform
 from .spectralinit import *
 from ..shen.Matrices import BiharmonicCoeff, HelmholtzCoeff
 from ..shen import LUsolve
+from ..shen.pressure import pressure_solver
 
 def get_context():
     """Set up context for solver"""
@@ -82,7 +84,7 @@ def get_context():
 
     # Set Nyquist frequency to zero on K that is used for odd derivatives in nonlinear terms
     Kx = FST.local_wavenumbers(scaled=True, eliminate_highest_freq=True)
-    K_over_K2 = np.zeros((2,)+g.shape)
+    K_over_K2 = np.zeros((2,)+K2.shape)
     for i in range(2):
         K_over_K2[i] = K[i] / np.where(K2 == 0, 1, K2)
 
@@ -100,13 +102,11 @@ def get_context():
 
     nu, dt, N = params.nu, params.dt, params.N
 
-    # Collect all matrices
+    # Collect all matrices. Matrices that depend on dt are set by set_dt
     mat = config.AttributeDict(
         dict(CDD=inner_product((ST, 0), (ST, 1)),
              CTD=inner_product((CT, 0), (ST, 1)),
              BTT=inner_product((CT, 0), (CT, 0)),
-             AB=HelmholtzCoeff(N[2], 1.0, -(K2 - 2.0/nu/dt), 2, ST.quad),
-             AC=BiharmonicCoeff(N[2], nu*dt/2., (1. - nu*dt*K2), -(K2 - nu*dt/2.*K4), 2, SB.quad),
              # Matrices for biharmonic equation
              CBD=inner_product((SB, 0), (ST, 1)),
              ABB=inner_product((SB, 0), (SB, 2)),
@@ -121,13 +121,8 @@ def get_context():
              BDD0=inner_product((ST0, 0), (ST0, 0))))
 
     la = config.AttributeDict(
-        dict(HelmholtzSolverG=Helmholtz(mat.ADD, mat.BDD, -np.ones((1, 1, 1)),
-                                        (K2+2.0/nu/dt)),
-             BiharmonicSolverU=Biharmonic(mat.SBB, mat.ABB, mat.BBB, -nu*dt/2.*np.ones((1, 1, 1)),
-                                          (1.+nu*dt*K2),
-                                          (-(K2 + nu*dt/2.*K4))),
-             HelmholtzSolverU0=Helmholtz(mat.ADD0, mat.BDD0, np.array([-1.]), np.array([2./nu/dt])),
-             TDMASolverD=TDMA(inner_product((ST, 0), (ST, 0)))))
+        dict(TDMASolverD=TDMA(inner_product((ST, 0), (ST, 0)))))
+    dt_cache = {}
 
     hdf5file = KMMFile(config.params.solver,
                        checkpoint={'space': VFS,
@@ -136,7 +131,25 @@ def get_context():
                        results={'space': VFS,
                                 'data': {'U': [U]}})
 
-    return config.AttributeDict(locals())
+    context = config.AttributeDict(locals())
+    set_dt(context, dt, dt_operators)
+    return context
+
+def dt_operators(context, dt):
+    """Return matrices and solvers that depend on the time step dt"""
+    nu, N = params.nu, params.N
+    K2, K4, mat = context.K2, context.K4, context.mat
+    return {'mat': dict(AB=HelmholtzCoeff(N[2], 1.0, -(K2 - 2.0/nu/dt), 2, context.ST.quad),
+                        AC=BiharmonicCoeff(N[2], nu*dt/2., (1. - nu*dt*K2),
+                                           -(K2 - nu*dt/2.*K4), 2, context.SB.quad)),
+            'la': dict(HelmholtzSolverG=Helmholtz(mat.ADD, mat.BDD, -np.ones((1, 1, 1)),
+                                                  (K2+2.0/nu/dt)),
+                       BiharmonicSolverU=Biharmonic(mat.SBB, mat.ABB, mat.BBB,
+                                                    -nu*dt/2.*np.ones((1, 1, 1)),
+                                                    (1.+nu*dt*K2),
+                                                    (-(K2 + nu*dt/2.*K4))),
+                       HelmholtzSolverU0=Helmholtz(mat.ADD0, mat.BDD0, np.array([-1.]),
+                                                   np.array([2./nu/dt])))}
 
 class KMMFile(HDF5File):
     def update_components(self, U_hat, U, **context):
@@ -176,47 +189,26 @@ def get_convection(H_hat, U_hat, g, Kx, VFSp, FSTp, FSBp, FCTp, work, mat, la, u
     H_hat = conv_(H_hat, U_hat, g, Kx, VFSp, FSTp, FSBp, FCTp, work, mat, la, u_dealias)
     return H_hat
 
-def get_pressure(context, solver):
-    FCT = context.FCT
-    FST = context.FST
-
-    U = solver.get_velocity(**context)
-    U0 = context.VFS.backward(context.U_hat0, context.U0)
-    dt = solver.params.dt
-
-    H_hat = solver.get_convection(**context)
-    Hx = Array(FST)
-    Hx = FST.backward(H_hat[0], Hx)
-
-    v = TestFunction(FCT)
-    p = TrialFunction(FCT)
-    U = U.as_function()
-    U0 = U0.as_function()
-
-    rhs_hat = inner((0.5*context.nu)*div(grad(U[0]+U0[0])), v)
-    Hx -= 1./dt*(U[0]-U0[0])
-    rhs_hat += inner(Hx, v)
-
-    CT = inner(Dx(p, 0), v)
+def cfl_velocity(context):
+    """Return dealiased velocity computed by the convection of the last step"""
+    return context.u_dealias
 
-    # Should implement fast solver. Just a backwards substitution
-    A = CT.diags().toarray()*CT.scale[0]
-    A[-1, 0] = 1
-    a_i = np.linalg.inv(A)
+def cfl_spacing(context):
+    """Return mesh size used by the CFL controller
 
-    p_hat = Function(context.FCT)
-
-    for j in range(p_hat.shape[1]):
-        for k in range(p_hat.shape[2]):
-            p_hat[:, j, k] = np.dot(a_i, rhs_hat[:, j, k])
-
-    p = Array(FCT)
-    p = FCT.backward(p_hat, p)
-
-    uu = np.sum((0.5*(U+U0))**2, 0)
-    uu *= 0.5
+    The wall normal size is half the distance between the two neighbouring
+    Chebyshev points, interpolated to the dealiased mesh of cfl_velocity.
+    """
+    x = np.squeeze(context.FST.mesh()[2])
+    xp = np.squeeze(context.FSTp.mesh()[2])
+    i = np.argsort(x)
+    dx = np.interp(xp, x[i], np.abs(np.gradient(x))[i])
+    dx = dx[context.FSTp.local_slice(False)[2]]
+    return [params.L[0]/params.N[0], params.L[1]/params.N[1], dx[None, None, :]]
 
-    return p-uu+3./16.
+def get_pressure(context, solver):
+    """Return pressure of the last time step, see spectralDNS.shen.pressure"""
+    return pressure_solver(context)(context, solver)
 
 def get_divergence(U, U_hat, FST, K, Kx, work, la, mat, **context):
     Uc_hat = work[(U_hat[0], 0, True)]
@@ -235,6 +227,9 @@ def get_divergence(U, U_hat, FST, K, Kx, work, la, mat, **context):
 def Cross(c, a, b, FSTp, work):
     Uc = work[(a, 2, False)]
     Uc = cross1(Uc, a, b)
+    if params.pipeline_transforms:
+        c = multi_transform(FSTp.forward, 3)(Uc, c)
+        return c
     c[0] = FSTp.forward(Uc[0], c[0])
     c[1] = FSTp.forward(Uc[1], c[1])
     c[2] = FSTp.forward(Uc[2], c[2])
@@ -516,5 +511,6 @@ def integrate(u_hat, g_hat, rhs, dt, solver, context):
 def getintegrator(rhs, u0, solver, context):
     u_hat, g_hat = u0
     def func():
+        solver.set_dt(context, params.dt, solver.dt_operators)
         return solver.integrate(u_hat, g_hat, rhs, params.dt, solver, context)
     return func
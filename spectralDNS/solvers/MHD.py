@@ -7,8 +7,13 @@ __license__ = "GNU Lesser GPL version 3 or any later version"
 
 from shenfun import FunctionSpace, TensorProductSpace, VectorSpace, \
     Array, Function, CompositeSpace
+from spectralDNS.utilities.transforms import multi_transform
 from .spectralinit import *
-from .NS import end_of_tstep
+from .NS import end_of_tstep, phase_shifted
+
+def cfl_velocity(context):
+    """Return dealiased velocity and magnetic field of the last ComputeRHS"""
+    return context.ub_dealias
 
 def get_context():
     float, complex, mpitype = datatypes(params.precision)
@@ -30,7 +35,7 @@ def get_context():
 
     kw = {'padding_factor': 1.5 if params.dealias == '3/2-rule' else 1,
           'dealias_direct': params.dealias == '2/3-rule'}
-    Tp = T.get_dealiased(**kw)
+    Tp = get_dealiased(T, **kw)
     VTp = VectorSpace(Tp)
 
     VMp = CompositeSpace([Tp]*2*dim)
@@ -41,13 +46,6 @@ def get_context():
     for i in range(dim):
         X[i] = X[i].astype(float)
         K[i] = K[i].astype(float)
-    K2 = np.zeros(T.shape(True), dtype=float)
-    for i in range(dim):
-        K2 += K[i]*K[i]
-
-    K_over_K2 = np.zeros(VT.shape(True), dtype=float)
-    for i in range(dim):
-        K_over_K2[i] = K[i] / np.where(K2 == 0, 1, K2)
 
     UB = Array(VM)
     P = Array(T)
@@ -57,7 +55,9 @@ def get_context():
     dU = Function(VM)
     Source = Array(VM)
     ub_dealias = Array(VMp)
-    ZZ_hat = np.zeros((3, 3) + Tp.shape(True), dtype=complex) # Work array
+    # Elsasser products, in the (possibly single) precision of ub_dealias
+    ZZ = np.zeros((3, 3) + Tp.shape(False), dtype=ub_dealias.dtype)
+    ZZ_hat = np.zeros((3, 3) + Tp.shape(True), dtype=complex)
 
     # Create views into large data structures
     U = UB[:3]
@@ -68,6 +68,8 @@ def get_context():
     # Primary variable
     u = UB_hat
 
+    work = work_arrays()
+
     hdf5file = MHDFile(config.params.solver,
                        checkpoint={'space': VM,
                                    'data': {'0': {'UB': [UB_hat]}}},
@@ -86,7 +88,9 @@ def get_divergence(T, K, U_hat, **context):
     div_u = T.backward(1j*(K[0]*U_hat[0]+K[1]*U_hat[1]+K[2]*U_hat[2]), div_u)
     return div_u
 
+@optimizer
 def set_Elsasser(c, ZZ, K):
+    """Set rhs of velocity and magnetic field from the Elsasser products ZZ"""
     c[:3] = -1j*(K[0]*(ZZ[:, 0] + ZZ[0, :])
                  + K[1]*(ZZ[:, 1] + ZZ[1, :])
                  + K[2]*(ZZ[:, 2] + ZZ[2, :]))/2.0
@@ -96,15 +100,35 @@ def set_Elsasser(c, ZZ, K):
                 + K[2]*(ZZ[2, :] - ZZ[:, 2]))/2.0
     return c
 
-def divergenceConvection(c, z0, z1, Tp, K, ZZ_hat):
+@optimizer
+def Elsasser_products(ZZ, work, ub):
+    """Set ZZ[i, j] = z0[i]*z1[j] for the Elsasser variables z0=U+B, z1=U-B
+
+    The Elsasser variables are stored in a work array. The optimized
+    versions compute the products directly and do not use it.
+    """
+    Z = work[(ub, 0, False)]
+    z0 = np.add(ub[:3], ub[3:], out=Z[:3])
+    z1 = np.subtract(ub[:3], ub[3:], out=Z[3:])
+    ZZ = np.multiply(z0[:, None], z1[None, :], out=ZZ)
+    return ZZ
+
+def divergenceConvection(c, ub_dealias, Tp, K, work, ZZ, ZZ_hat):
     """Divergence convection using Elsasser variables
     z0=U+B
     z1=U-B
-    """
 
-    for i in range(3):
-        for j in range(3):
-            ZZ_hat[i, j] = Tp.forward(z0[i]*z1[j], ZZ_hat[i, j])
+    The 9 products z0[i]*z1[j] are computed in place in ZZ, and transformed
+    to ZZ_hat, in one batched call if params.batch_transforms is set.
+    """
+    ZZ = Elsasser_products(ZZ, work, ub_dealias)
+    if params.batch_transforms:
+        multi_transform(Tp.forward, 9)(ZZ.reshape((9,)+ZZ.shape[2:]),
+                                       ZZ_hat.reshape((9,)+ZZ_hat.shape[2:]))
+    else:
+        for i in range(3):
+            for j in range(3):
+                ZZ_hat[i, j] = Tp.forward(ZZ[i, j], ZZ_hat[i, j])
 
     c = set_Elsasser(c, ZZ_hat, K)
     return c
@@ -116,40 +140,56 @@ def getConvection(convection):
 
     elif convection == "Divergence":
 
-        def Conv(rhs, ub_hat, Tp, VMp, K, ub_dealias, ZZ_hat):
-            #ub_dealias = work[((6,)+Tp.shape(False), float, 0)]
-            ub_dealias = VMp.backward(ub_hat, ub_dealias)
-            u_dealias = ub_dealias[:3]
-            b_dealias = ub_dealias[3:]
+        def Conv(rhs, ub_hat, Tp, VMp, K, ub_dealias, work, ZZ, ZZ_hat):
+            if params.batch_transforms:
+                # All 6 components of UB are transformed in one batched call
+                ub_dealias = multi_transform(Tp.backward, 6)(ub_hat, ub_dealias)
+            else:
+                ub_dealias = VMp.backward(ub_hat, ub_dealias)
             # Compute convective term and place in dU
-            rhs = divergenceConvection(rhs, u_dealias+b_dealias, u_dealias-b_dealias,
-                                       Tp, K, ZZ_hat)
+            rhs = divergenceConvection(rhs, ub_dealias, Tp, K, work, ZZ, ZZ_hat)
             return rhs
 
     Conv.convection = convection
     return Conv
 
 @optimizer
-def add_pressure_diffusion(rhs, ub_hat, nu, eta, K2, K, P_hat, K_over_K2):
+def add_pressure_diffusion(rhs, ub_hat, nu, eta, K, P_hat, work):
     """Add contributions from pressure and diffusion to the rhs"""
-
-    u_hat = ub_hat[:3]
-    b_hat = ub_hat[3:]
+    K2 = wavenumber_squared(K, work[(P_hat.real, 0, False)])
 
     # Compute pressure (To get actual pressure multiply by 1j)
-    P_hat = np.sum(rhs[:3]*K_over_K2, 0, out=P_hat)
+    P_hat = np.multiply(K[0], rhs[0], out=P_hat)
+    for i in range(1, 3):
+        P_hat += K[i]*rhs[i]
+    P_hat = np.divide(P_hat, K2, out=P_hat, where=K2 != 0)
 
     # Add pressure gradient
     for i in range(3):
         rhs[i] -= P_hat*K[i]
 
     # Add contribution from diffusion
-    rhs[:3] -= nu*K2*u_hat
-    rhs[3:] -= eta*K2*b_hat
+    K2 *= nu
+    for i in range(3):
+        rhs[i] -= K2*ub_hat[i]
+    K2 = wavenumber_squared(K, K2)
+    K2 *= eta
+    for i in range(3, 6):
+        rhs[i] -= K2*ub_hat[i]
     return rhs
 
-def ComputeRHS(rhs, ub_hat, solver, Tp, VMp, K, K2, K_over_K2, P_hat,
-               ub_dealias, ZZ_hat, mask, **context):
+def linear_operator(context):
+    """Return diagonal linear operator (diffusion) of the rhs"""
+    K2 = wavenumber_squared(context.K)
+    if params.nu == params.eta:
+        return -params.nu*K2
+    L = np.zeros((6,)+K2.shape, dtype=K2.dtype)
+    L[:3] = -params.nu*K2
+    L[3:] = -params.eta*K2
+    return L
+
+def ComputeRHS(rhs, ub_hat, solver, Tp, VMp, K, P_hat, ub_dealias, work, ZZ,
+               ZZ_hat, mask, **context):
     """Return right hand side of Navier Stokes
 
     args:
@@ -162,15 +202,14 @@ def ComputeRHS(rhs, ub_hat, solver, Tp, VMp, K, K2, K_over_K2, P_hat,
 
     Remaining args may be extracted from context:
         work        Work arrays
-        K           Scaled wavenumber mesh
-        K2          sum_i K[i]*K[i]
-        K_over_K2   K / K2
+        K           Scaled, broadcastable wavenumber mesh
         P_hat       Transformed pressure
+        ZZ          Products of the Elsasser variables
 
     """
-    rhs = solver.conv(rhs, ub_hat, Tp, VMp, K, ub_dealias, ZZ_hat)
+    rhs = solver.conv(rhs, ub_hat, Tp, VMp, K, ub_dealias, work, ZZ, ZZ_hat)
     if mask is not None:
         rhs.mask_nyquist(mask)
-    rhs = solver.add_pressure_diffusion(rhs, ub_hat, params.nu, params.eta, K2,
-                                        K, P_hat, K_over_K2)
+    rhs = solver.add_pressure_diffusion(rhs, ub_hat, params.nu, params.eta, K,
+                                        P_hat, work)
     return rhs
@@ -7,6 +7,7 @@ __license__ = "GNU Lesser GPL version 3 or any later version"
 
 from shenfun import FunctionSpace, TensorProductSpace, VectorSpace, \
     Array, Function
+from spectralDNS.utilities.transforms import multi_transform
 from .spectralinit import *
 
 def get_context():
@@ -28,7 +29,7 @@ def get_context():
     # Different bases for nonlinear term, either 2/3-rule or 3/2-rule
     kw = {'padding_factor': 1.5 if params.dealias == '3/2-rule' else 1,
           'dealias_direct': params.dealias == '2/3-rule'}
-    Tp = T.get_dealiased(**kw)
+    Tp = get_dealiased(T, **kw)
     VTp = VectorSpace(Tp)
 
     mask = T.get_mask_nyquist() if params.mask_nyquist else None
@@ -39,13 +40,6 @@ def get_context():
     for i in range(dim):
         X[i] = X[i].astype(float)
         K[i] = K[i].astype(float)
-    K2 = np.zeros(T.shape(True), dtype=float)
-    for i in range(dim):
-        K2 += K[i]*K[i]
-
-    K_over_K2 = np.zeros(VT.shape(True), dtype=float)
-    for i in range(dim):
-        K_over_K2[i] = K[i] / np.where(K2 == 0, 1, K2)
 
     # Velocity and pressure. Use ndarray view for efficiency
     U = Array(VT)
@@ -121,6 +115,10 @@ def end_of_tstep(context):
 
     return False
 
+def cfl_velocity(context):
+    """Return dealiased velocity computed by the last call to ComputeRHS"""
+    return context.u_dealias
+
 def compute_curl(c, a, work, T, K):
     """c = curl(a) = F_inv(F(curl(a))) = F_inv(1j*K x a)"""
     curl_hat = work[(a, 0, False)]
@@ -135,56 +133,89 @@ def Cross(c, a, b, work, T):
     c = T.forward(d, c)
     return c
 
-def standard_convection(rhs, u_dealias, U_hat, work, Tp, K):
-    """rhs_i = u_j du_i/dx_j"""
-    gradUi = work[(u_dealias, 1, False)]
+def standard_convection(rhs, u_hat, u_dealias, work, buffers, K):
+    """rhs_i = u_j du_i/dx_j
+
+    The velocity and all its derivatives du_i/dx_j are transformed to
+    physical space in one batched transform. Note that u_dealias is
+    computed as well.
+    """
+    grad_hat = [work[(u_hat, i, False)] for i in range(3)]
+    grad = [work[(u_dealias, i, False)] for i in range(3)]
     for i in range(3):
-        for j in range(3):
-            gradUi[j] = Tp.backward(1j*K[j]*U_hat[i], gradUi[j])
-        rhs[i] = Tp.forward(np.sum(u_dealias*gradUi, 0), rhs[i])
+        grad_hat[i] = gradient(grad_hat[i], K, u_hat[i:i+1])
+    buffers['backward'](list(u_hat)+[g for gi in grad_hat for g in gi],
+                        list(u_dealias)+[g for gi in grad for g in gi])
+    # Contract in place, grad[i][j] *= u_j, and sum over j
+    uu = work[(u_dealias, 3, False)]
+    for i in range(3):
+        grad[i] *= u_dealias
+        np.sum(grad[i], axis=0, out=uu[i])
+    rhs = buffers['forward'](uu, rhs)
     return rhs
 
-def divergence_convection(rhs, u_dealias, work, Tp, K, add=False):
+def divergence_convection(rhs, u_dealias, work, buffers, K, add=False):
     """rhs_i = div(u_i u_j)"""
     if not add:
         rhs.fill(0)
-    UUi_hat = work[(rhs, 0, False)]
-    for i in range(3):
-        UUi_hat[i] = Tp.forward(u_dealias[0]*u_dealias[i], UUi_hat[i])
-    rhs[0] += 1j*(K[0]*UUi_hat[0] + K[1]*UUi_hat[1] + K[2]*UUi_hat[2])
-    rhs[1] += 1j*K[0]*UUi_hat[1]
-    rhs[2] += 1j*K[0]*UUi_hat[2]
-    UUi_hat[0] = Tp.forward(u_dealias[1]*u_dealias[1], UUi_hat[0])
-    UUi_hat[1] = Tp.forward(u_dealias[1]*u_dealias[2], UUi_hat[1])
-    UUi_hat[2] = Tp.forward(u_dealias[2]*u_dealias[2], UUi_hat[2])
-    rhs[1] += (1j*K[1]*UUi_hat[0] + 1j*K[2]*UUi_hat[1])
-    rhs[2] += (1j*K[1]*UUi_hat[1] + 1j*K[2]*UUi_hat[2])
+    # The six unique products u_i u_j, transformed in one batched call
+    uu = [u for i in range(2) for u in work[(u_dealias, i, False)]]
+    uu_hat = [u for i in range(2) for u in work[(rhs, i, False)]]
+    for n, (i, j) in enumerate(((0, 0), (0, 1), (0, 2), (1, 1), (1, 2), (2, 2))):
+        np.multiply(u_dealias[i], u_dealias[j], out=uu[n])
+    uu_hat = buffers['forward6'](uu, uu_hat)
+    for u in uu_hat:
+        u *= 1j
+    rhs[0] += K[0]*uu_hat[0] + K[1]*uu_hat[1] + K[2]*uu_hat[2]
+    rhs[1] += K[0]*uu_hat[1] + K[1]*uu_hat[3] + K[2]*uu_hat[4]
+    rhs[2] += K[0]*uu_hat[2] + K[1]*uu_hat[4] + K[2]*uu_hat[5]
     return rhs
 
 def getConvection(convection):
 
+    buffers = {}
+
+    def get_buffers(Tp):
+        """Return batched transforms, created on first call
+
+        The work arrays of the transformed derivatives du_i/dx_j, or the
+        products u_i u_j, are taken from work.
+        """
+        if not buffers and convection == "Vortex":
+            buffers['backward'] = multi_transform(Tp.backward, 6)
+            buffers['forward'] = multi_transform(Tp.forward, 3)
+        elif not buffers:
+            b = buffers
+            b['backward'] = multi_transform(Tp.backward, 3 if convection == "Divergence" else 12)
+            if convection in ("Standard", "Skewed"):
+                b['forward'] = multi_transform(Tp.forward, 3)
+            if convection in ("Divergence", "Skewed"):
+                b['forward6'] = multi_transform(Tp.forward, 6)
+        return buffers
+
     if convection == "Standard":
 
         def Conv(rhs, u_hat, work, Tp, VTp, K, u_dealias):
-            u_dealias = VTp.backward(u_hat, u_dealias)
-            rhs = standard_convection(rhs, u_dealias, u_hat, work, Tp, K)
+            b = get_buffers(Tp)
+            rhs = standard_convection(rhs, u_hat, u_dealias, work, b, K)
             rhs[:] *= -1
             return rhs
 
     elif convection == "Divergence":
 
         def Conv(rhs, u_hat, work, Tp, VTp, K, u_dealias):
-            u_dealias = VTp.backward(u_hat, u_dealias)
-            rhs = divergence_convection(rhs, u_dealias, work, Tp, K, False)
+            b = get_buffers(Tp)
+            u_dealias = b['backward'](u_hat, u_dealias)
+            rhs = divergence_convection(rhs, u_dealias, work, b, K, False)
             rhs[:] *= -1
             return rhs
 
     elif convection == "Skewed":
 
         def Conv(rhs, u_hat, work, Tp, VTp, K, u_dealias):
-            u_dealias = VTp.backward(u_hat, u_dealias)
-            rhs = standard_convection(rhs, u_dealias, u_hat, work, Tp, K)
-            rhs = divergence_convection(rhs, u_dealias, work, Tp, K, True)
+            b = get_buffers(Tp)
+            rhs = standard_convection(rhs, u_hat, u_dealias, work, b, K)
+            rhs = divergence_convection(rhs, u_dealias, work, b, K, True)
             rhs *= -0.5
             return rhs
 
@@ -192,6 +223,15 @@ def getConvection(convection):
 
         def Conv(rhs, u_hat, work, Tp, VTp, K, u_dealias):
             curl_dealias = work[(u_dealias, 0, False)]
+            if params.batch_transforms:
+                # Velocity and vorticity to physical space in one batched call
+                b = get_buffers(Tp)
+                curl_hat = cross2(work[(u_hat, 0, False)], K, u_hat)
+                b['backward'](list(u_hat)+list(curl_hat),
+                              list(u_dealias)+list(curl_dealias))
+                d = cross1(work[(u_dealias, 1, False)], u_dealias, curl_dealias)
+                rhs = b['forward'](d, rhs)
+                return rhs
             u_dealias = VTp.backward(u_hat, u_dealias)
             curl_dealias = compute_curl(curl_dealias, u_hat, work, VTp, K)
             rhs = Cross(rhs, u_dealias, curl_dealias, work, VTp)
@@ -200,24 +240,81 @@ def getConvection(convection):
     Conv.convection = convection
     return Conv
 
+def phase_shifted(conv, context):
+    """Return conv dealiased with the phase shifts of Patterson and Orszag
+
+    The convection is computed twice, on the regular grid and on a grid
+    shifted half a cell in all directions, and the two are averaged. This
+    cancels all aliases that are shifted in an odd number of directions.
+    The remaining aliases are removed by truncating both the velocity that
+    enters the products and the result outside the sphere
+    |k/N| <= sqrt(2)/3. Contrary to the 3/2-rule, no padded arrays
+    or transforms are required.
+
+    The shift is applied to the Fourier coefficients, such that conv may
+    be any convection function taking (rhs, u_hat, ...) as arguments.
+    """
+    c = context
+    dim = len(params.N)
+    shift = []
+    n2 = 0
+    for i in range(dim):
+        dx = params.L[i]/params.N[i]
+        shift.append(np.exp(0.5j*c.K[i]*dx).astype(c.complex))
+        n2 = n2 + (c.K[i]*dx/(2*np.pi))**2
+    unshift = [np.conj(s) for s in shift]
+    sphere = (n2 <= 2/9).astype(c.float)
+    mask = 0.5*sphere
+    work = c.work
+
+    def Conv(rhs, u_hat, *args):
+        # Indices of work not used by the convection functions themselves
+        u_t = np.multiply(u_hat, sphere, out=work[(u_hat, 5, False)])
+        u_s = np.multiply(u_t, shift[0], out=work[(u_hat, 6, False)])
+        for s in shift[1:]:
+            u_s *= s
+        rhs_s = conv(work[(rhs, 7, False)], u_s, *args)
+        for s in unshift:
+            rhs_s *= s
+        rhs = conv(rhs, u_t, *args)
+        rhs += rhs_s
+        rhs *= mask
+        return rhs
+
+    Conv.convection = conv.convection
+    return Conv
+
 @optimizer
-def add_pressure_diffusion(rhs, u_hat, nu, K2, K, P_hat, K_over_K2):
-    """Add contributions from pressure and diffusion to the rhs"""
+def add_pressure_diffusion(rhs, u_hat, nu, K, P_hat, work):
+    """Add contributions from pressure and diffusion to the rhs
+
+    K2 = |K|^2 is computed from the broadcastable K in a real work array
+    """
+    K2 = wavenumber_squared(K, work[(P_hat.real, 0, False)])
 
     # Compute pressure (To get actual pressure multiply by 1j)
-    P_hat = np.sum(rhs*K_over_K2, 0, out=P_hat)
+    P_hat = np.multiply(K[0], rhs[0], out=P_hat)
+    for i in range(1, rhs.shape[0]):
+        P_hat += K[i]*rhs[i]
+    P_hat = np.divide(P_hat, K2, out=P_hat, where=K2 != 0)
 
     # Subtract pressure gradient
     for i in range(rhs.shape[0]):
         rhs[i] -= P_hat*K[i]
 
     # Subtract contribution from diffusion
-    rhs -= nu*K2*u_hat
+    K2 *= nu
+    for i in range(rhs.shape[0]):
+        rhs[i] -= K2*u_hat[i]
 
     return rhs
 
-def ComputeRHS(rhs, u_hat, solver, work, Tp, VTp, P_hat, K, K2, u_dealias,
-               K_over_K2, Source, mask, **context):
+def linear_operator(context):
+    """Return diagonal linear operator (diffusion) of the rhs"""
+    return -params.nu*wavenumber_squared(context.K)
+
+def ComputeRHS(rhs, u_hat, solver, work, Tp, VTp, P_hat, K, u_dealias,
+               Source, mask, **context):
     """Compute right hand side of Navier Stokes
 
     Parameters
@@ -242,19 +339,14 @@ def ComputeRHS(rhs, u_hat, solver, work, Tp, VTp, P_hat, K, K2, u_dealias,
         P_hat : array
             Transformed pressure
         K : list of arrays
-            Scaled wavenumber mesh
-        K2 : array
-            sum_i K[i]*K[i]
-        K_over_K2 : array
-            K / K2
+            Scaled, broadcastable wavenumber mesh
 
     """
     rhs = solver.conv(rhs, u_hat, work, Tp, VTp, K, u_dealias)
     if mask is not None:
         rhs.mask_nyquist(mask)
 
-    rhs = solver.add_pressure_diffusion(rhs, u_hat, params.nu, K2, K, P_hat,
-                                        K_over_K2)
+    rhs = solver.add_pressure_diffusion(rhs, u_hat, params.nu, K, P_hat, work)
 
     rhs += Source
 
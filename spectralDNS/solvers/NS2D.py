@@ -36,11 +36,28 @@ def getConvection(convection):
 
     elif convection == "Vortex":
 
+        buffers = {}
+
         def Conv(rhs, u_hat, work, Tp, VTp, K, u_dealias):
             curl_dealias = work[(u_dealias[0], 0, False)]
             curl_hat = work[(rhs[0], 0, False)]
 
             curl_hat = cross2(curl_hat, K, u_hat)
+            if params.batch_transforms:
+                # Velocity and vorticity to physical space in one batched call
+                if not buffers:
+                    buffers['backward'] = multi_transform(Tp.backward, 3)
+                    buffers['forward'] = multi_transform(Tp.forward, 2)
+                    buffers['uw'] = np.empty(u_dealias.shape, dtype=u_dealias.dtype)
+                buffers['backward'](list(u_hat)+[curl_hat],
+                                    list(u_dealias)+[curl_dealias])
+                uw = buffers['uw']
+                np.multiply(u_dealias[1], curl_dealias, out=uw[0])
+                np.multiply(u_dealias[0], curl_dealias, out=uw[1])
+                uw[1] *= -1
+                rhs = buffers['forward'](uw, rhs)
+                return rhs
+
             curl_dealias = Tp.backward(curl_hat, curl_dealias)
             u_dealias = VTp.backward(u_hat, u_dealias)
             rhs[0] = Tp.forward(u_dealias[1]*curl_dealias, rhs[0])
@@ -49,7 +49,7 @@ class VVFile(HDF5File):
         get_velocity(**context)
         get_curl(**context)
 
-def compute_velocity(U, w_hat, work, VT, K_over_K2):
+def compute_velocity(U, w_hat, work, VT, K):
     """Compute u from curl(u)
 
     Follows from
@@ -62,13 +62,13 @@ def compute_velocity(U, w_hat, work, VT, K_over_K2):
 
     """
     v_hat = work[(w_hat, 1, True)]
-    v_hat = cross2(v_hat, K_over_K2, w_hat)
+    v_hat = inverse_curl(v_hat, K, w_hat)
     U = VT.backward(v_hat, U)
     return U
 
-def get_velocity(W_hat, U, work, VT, K_over_K2, **context):
+def get_velocity(W_hat, U, work, VT, K, **context):
     """Compute velocity from context"""
-    U = compute_velocity(U, W_hat, work, VT, K_over_K2)
+    U = compute_velocity(U, W_hat, work, VT, K)
     return U
 
 def get_divergence(T, K, U_hat, W_hat, **context):
@@ -89,11 +89,26 @@ def getConvection(convection):
 
     elif convection == "Vortex":
 
-        def Conv(rhs, w_hat, work, Tp, VTp, K, K_over_K2, u_dealias):
+        buffers = {}
+
+        def Conv(rhs, w_hat, work, Tp, VTp, K, u_dealias):
             w_dealias = work[(u_dealias, 0, True)]
             v_hat = work[(rhs, 0, True)]
 
-            u_dealias = compute_velocity(u_dealias, w_hat, work, VTp, K_over_K2)
+            if params.batch_transforms:
+                # Velocity and vorticity to physical space in one batched call
+                if not buffers:
+                    buffers['backward'] = multi_transform(Tp.backward, 6)
+                    buffers['forward'] = multi_transform(Tp.forward, 3)
+                v_hat = inverse_curl(v_hat, K, w_hat)
+                buffers['backward'](list(v_hat)+list(w_hat),
+                                    list(u_dealias)+list(w_dealias))
+                d = cross1(work[(u_dealias, 1, False)], u_dealias, w_dealias)
+                v_hat = buffers['forward'](d, v_hat)
+                rhs = cross2(rhs, K, v_hat)
+                return rhs
+
+            u_dealias = compute_velocity(u_dealias, w_hat, work, VTp, K)
             w_dealias = VTp.backward(w_hat, w_dealias)
             v_hat = Cross(v_hat, u_dealias, w_dealias, work, VTp) # v_hat = F_k(u_dealias x w_dealias)
             rhs = cross2(rhs, K, v_hat)  # rhs = 1j*(K x v_hat)
@@ -103,14 +118,17 @@ def getConvection(convection):
     return Conv
 
 @optimizer
-def add_linear(rhs, w_hat, nu, K2, Source):
+def add_linear(rhs, w_hat, nu, K, Source, work):
     """Add contributions from source and diffusion to the rhs"""
-    rhs -= nu*K2*w_hat
+    K2 = wavenumber_squared(K, work[(w_hat[0].real, 0, False)])
+    K2 *= nu
+    for i in range(rhs.shape[0]):
+        rhs[i] -= K2*w_hat[i]
     rhs += Source
     return rhs
 
-def ComputeRHS(rhs, w_hat, solver, work, Tp, VT, VTp, K, K2, K_over_K2,
-               Source, u_dealias, mask, **context):
+def ComputeRHS(rhs, w_hat, solver, work, Tp, VT, VTp, K, Source, u_dealias,
+               mask, **context):
     """Return right hand side of Navier Stokes in velocity-vorticity form
 
     Parameters
@@ -130,17 +148,13 @@ def ComputeRHS(rhs, w_hat, solver, work, Tp, VT, VTp, K, K2, K_over_K2,
             Work arrays
         Tp : TensorProductSpace
         K : list of arrays
-            Scaled wavenumber mesh
-        K2 : array
-            K[0]*K[0] + K[1]*K[1] + K[2]*K[2]
-        K_over_K2 : array
-            K / K2
+            Scaled, broadcastable wavenumber mesh
         Source : array
             Scalar source term
 
     """
-    rhs = solver.conv(rhs, w_hat, work, Tp, VTp, K, K_over_K2, u_dealias)
+    rhs = solver.conv(rhs, w_hat, work, Tp, VTp, K, u_dealias)
     if mask is not None:
         rhs.mask_nyquist(mask)
-    rhs = solver.add_linear(rhs, w_hat, params.nu, K2, Source)
+    rhs = solver.add_linear(rhs, w_hat, params.nu, K, Source, work)
     return rhs
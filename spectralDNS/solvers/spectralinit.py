@@ -9,12 +9,14 @@ import sys
 import cProfile
 import numpy as np
 from mpi4py import MPI
-from shenfun import CachedArrayDict as work_arrays
+from shenfun import CachedArrayDict as work_arrays, FunctionSpace, \
+    TensorProductSpace
 from spectralDNS import config
 from spectralDNS.utilities import create_profile, MemoryUsage, Timer, reset_profile
 from spectralDNS.h5io import HDF5File
 from spectralDNS.optimization import optimizer
-from spectralDNS.maths import cross1, cross2, project, getintegrator
+from spectralDNS.maths import cross1, cross2, inverse_curl, project, \
+    wavenumber_squared, gradient, getintegrator
 
 comm = MPI.COMM_WORLD
 num_processes = comm.Get_size()
@@ -23,10 +25,38 @@ params = config.params
 profiler = cProfile.Profile()
 
 def datatypes(precision):
-    """Return datatypes associated with precision."""
-    assert precision in ("single", "double")
+    """Return datatypes associated with precision.
+
+    In mixed precision the solution is stored in double precision, and
+    only the nonlinear term is computed in single, see get_dealiased.
+    """
+    assert precision in ("single", "double", "mixed")
     return {"single": (np.float32, np.complex64, MPI.C_FLOAT_COMPLEX),
-            "double": (np.float64, np.complex128, MPI.C_DOUBLE_COMPLEX)}[precision]
+            "double": (np.float64, np.complex128, MPI.C_DOUBLE_COMPLEX),
+            "mixed": (np.float64, np.complex128, MPI.C_DOUBLE_COMPLEX)}[precision]
+
+def get_dealiased(T, **kw):
+    """Return space used for the nonlinear term of the periodic space T
+
+    The keyword arguments are those of TensorProductSpace.get_dealiased. In
+    mixed precision the returned space is a single precision copy of T, with
+    the same distribution of the Fourier coefficients. The padded arrays,
+    transforms and products of the nonlinear term are then all in single
+    precision, whereas the transforms take and return double precision
+    Fourier coefficients.
+    """
+    if params.precision == 'mixed':
+        float, complex = datatypes('single')[:2]
+        dim = len(params.N)
+        V = [FunctionSpace(params.N[i], 'F', domain=(0, params.L[i]),
+                           dtype=float if i == dim-1 else complex)
+             for i in range(dim)]
+        T = TensorProductSpace(T.comm, V, dtype=float,
+                               slab=(params.decomposition == 'slab'),
+                               collapse_fourier=(params.dealias != '3/2-rule'),
+                               threads=params.threads,
+                               planner_effort=params.planner_effort['fft'])
+    return T.get_dealiased(**kw)
 
 def regression_test(context):
     """Optional function called at the end"""
@@ -48,6 +78,64 @@ def conv(*args):
     """Function used to compute convective term"""
     raise NotImplementedError
 
+def linear_operator(context):
+    """Return diagonal linear operator L of du/dt = L u + N(u)
+
+    Used by the exponential integrators IFRK4 and ETDRK4. The returned array
+    must broadcast against the primary variable context.u.
+    """
+    raise NotImplementedError
+
+def cfl_velocity(context):
+    """Return physical velocity components used by the CFL controller"""
+    raise NotImplementedError
+
+def cfl_spacing(context):
+    """Return mesh size in each direction used by the CFL controller
+
+    Each item is a scalar, or an array that broadcasts against the
+    components returned by cfl_velocity.
+    """
+    return [L/N for L, N in zip(params.L, params.N)]
+
+def dt_operators(context, dt):
+    """Return the items of context that depend on the time step dt
+
+    Used by set_dt. Items that are dictionaries update the dictionary of
+    the same name in context, e.g., {'mat': {'AB': AB}} sets context.mat.AB.
+    """
+    return {}
+
+def set_dt(context, dt, dt_operators):
+    """Set the items of context that depend on the time step dt
+
+    The items are computed by dt_operators(context, dt) and stored in
+    context.dt_cache, that holds the items of the params.dt_cache most
+    recently used time steps. A solver that factorizes dt dependent
+    operators is thus only refactorized when a time step controller
+    moves to a new dt, see the quantization of CFLController.
+    """
+    cache = context.dt_cache
+    if dt == context.dt and dt in cache:
+        return
+    if dt in cache:
+        items = cache.pop(dt)
+    else:
+        if len(cache) >= params.dt_cache:
+            cache.pop(next(iter(cache)))
+        items = dt_operators(context, dt)
+    cache[dt] = items # Last is most recently used
+    for key, val in items.items():
+        if isinstance(val, dict):
+            context[key].update(val)
+        else:
+            context[key] = val
+    context.dt = dt
+
+def phase_shifted(conv, context):
+    """Return conv dealiased by phase shifts. See NS.phase_shifted"""
+    raise NotImplementedError('Phase-shift dealiasing requires periodic solver')
+
 def set_source(Source, **context):
     """Return the source term"""
     Source[:] = 0
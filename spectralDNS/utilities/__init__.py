@@ -7,10 +7,13 @@ __copyright__ = "Copyright (C) 2014-2018 " + __author__
 __license__ = "GNU Lesser GPL version 3 or any later version"
 
 from time import time
+from contextlib import contextmanager
 import types
+import json
 from mpi4py import MPI
 import numpy as np
 from mpi4py_fft.fftw import dctn, aligned, aligned_like
+from shenfun import TensorProductSpace, CompositeSpace
 from spectralDNS import config
 from .create_profile import create_profile, reset_profile
 from .memoryprofiler import MemoryUsage
@@ -22,13 +25,25 @@ class Timer(object):
     time steps of the solvers. We store the fastest and slowest time step
     on each process, and then the results may be reduced calling method
     final (in the end).
+
+    Each time step may also be broken down into named phases. A phase is
+    timed either with the context manager ``phase``, or by wrapping a
+    callable with ``timed``. The method ``instrument`` wraps the transforms,
+    MPI transposes, convection, pressure/diffusion and linear solves of a
+    solver. Phases are inclusive, e.g., the convection phase also contains
+    the transforms that are called from within the convection.
     """
 
+    stats = ('count', 'total', 'min', 'mean', 'max', 'p50', 'p90', 'p99')
+
     def __init__(self):
         self.fastest_timestep = 1e8
         self.slowest_timestep = 0
         self.t0 = time()
         self.tic = self.t0
+        self.phases = {}
+        self.samples = {'step': []}
+        self.wrapped = []
 
     def __call__(self):
         """Call for intermediate sampling of timings of complete time steps"""
@@ -37,8 +52,103 @@ class Timer(object):
         self.fastest_timestep = min(dt, self.fastest_timestep)
         self.slowest_timestep = max(dt, self.slowest_timestep)
         self.t0 = t1
+        self.samples['step'].append(dt)
+        for name in self.phases:
+            if name not in self.samples:
+                self.samples[name] = [0.0]*(len(self.samples['step'])-1)
+            self.samples[name].append(self.phases[name])
+            self.phases[name] = 0.0
+
+    def add(self, name, dt):
+        """Add time ``dt`` to phase ``name`` of current time step"""
+        self.phases[name] = self.phases.get(name, 0.0) + dt
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager timing the enclosed block as phase ``name``"""
+        t0 = time()
+        try:
+            yield
+        finally:
+            self.add(name, time()-t0)
+
+    def timed(self, name, func):
+        """Return ``func`` wrapped such that each call is timed as ``name``"""
+        return TimedCall(self, name, func)
+
+    def wrap(self, obj, attr, name):
+        """Replace ``obj.attr`` with timed version. Undone by ``restore``"""
+        func = getattr(obj, attr)
+        setattr(obj, attr, self.timed(name, func))
+        self.wrapped.append((obj, attr, func))
+
+    def instrument(self, solver, context):
+        """Wrap the main building blocks of ``solver`` in timed phases"""
+        for attr, name in (('conv', 'convection'),
+                           ('add_pressure_diffusion', 'pressure/diffusion'),
+                           ('add_linear', 'linear'),
+                           ('solve_linear', 'linear solve')):
+            if hasattr(solver, attr):
+                self.wrap(solver, attr, name)
+
+        spaces = {}
+        for val in context.values():
+            if isinstance(val, (TensorProductSpace, CompositeSpace)):
+                spaces[id(val)] = val
+        transforms = {}
+        for space in spaces.values():
+            for attr in ('forward', 'backward', 'scalar_product'):
+                transform = getattr(space, attr, None)
+                if transform is None:
+                    continue
+                for t in getattr(transform, '_transforms', [transform]):
+                    transforms[id(t)] = t
+                self.wrap(space, attr, attr)
+        for transform in transforms.values():
+            transfer = getattr(transform, '_transfer', ())
+            if len(transfer) > 0:
+                transform._transfer = tuple(self.timed('transpose', f)
+                                            for f in transfer)
+                self.wrapped.append((transform, '_transfer', transfer))
+
+    def restore(self):
+        """Undo all wrapping done by ``wrap`` and ``instrument``"""
+        for obj, attr, func in reversed(self.wrapped):
+            setattr(obj, attr, func)
+        self.wrapped = []
+
+    def statistics(self):
+        """Return statistics of all phases, reduced across processors
+
+        For each phase the statistics ('count', 'total', 'min', 'mean',
+        'max', 'p50', 'p90', 'p99') of the per time step timings are first
+        computed on each processor. The statistics are then gathered (one
+        collective call) and reduced to min, mean and max across processors.
+        The returned dictionary is only complete on rank 0, and has layout::
+
+            {phase: {stat: {'min': x, 'mean': y, 'max': z}}}
 
-    def final(self, verbose=True):
+        """
+        comm = MPI.COMM_WORLD
+        local = {}
+        for name, s in self.samples.items():
+            s = np.array(s)
+            if s.size == 0:
+                continue
+            local[name] = np.array([s.size, s.sum(), s.min(), s.mean(), s.max(),
+                                    *np.percentile(s, (50, 90, 99))])
+        allstats = comm.gather(local, root=0)
+        results = {}
+        if comm.Get_rank() == 0:
+            for name in local:
+                a = np.array([st[name] for st in allstats if name in st])
+                results[name] = {stat: {'min': a[:, i].min(),
+                                        'mean': a[:, i].mean(),
+                                        'max': a[:, i].max()}
+                                 for i, stat in enumerate(self.stats)}
+        return results
+
+    def final(self, verbose=True, filename=None):
         """Called at the end of a simulation.
 
         Reduces the results of individual processors to the zero rank,
@@ -54,18 +164,70 @@ class Timer(object):
 
         Slowest: (Slowest of the fastest measurements across all processors,
                   Slowest of the slowest measurements across all processors)
+
+        If filename is given, then the statistics of all phases are stored
+        on this file, as json if the filename ends with .json and as csv
+        otherwise.
         """
         comm = MPI.COMM_WORLD
-        fast = (comm.reduce(self.fastest_timestep, op=MPI.MIN, root=0),
-                comm.reduce(self.slowest_timestep, op=MPI.MIN, root=0))
-        slow = (comm.reduce(self.fastest_timestep, op=MPI.MAX, root=0),
-                comm.reduce(self.slowest_timestep, op=MPI.MAX, root=0))
+        self.restore()
+        results = self.statistics()
 
         toc = time() - self.tic
         if comm.Get_rank() == 0 and verbose:
             print("Time = {}".format(toc))
-            print("Fastest = {}".format(fast))
-            print("Slowest = {}".format(slow))
+            if 'step' in results:
+                step = results['step']
+                fast = (float(step['min']['min']), float(step['max']['min']))
+                slow = (float(step['min']['max']), float(step['max']['max']))
+                print("Fastest = {}".format(fast))
+                print("Slowest = {}".format(slow))
+            if len(results) > 1:
+                print(" {0:20s}{1:>11s}{2:>11s}{3:>11s}{4:>11s}".format(
+                    'Phase', 'total', 'mean', 'p90', 'max'))
+                for name, val in results.items():
+                    print(" {0:20s}{1:11.4e}{2:11.4e}{3:11.4e}{4:11.4e}".format(
+                        name, val['total']['max'], val['mean']['max'],
+                        val['p90']['max'], val['max']['max']))
+
+        if comm.Get_rank() == 0 and filename:
+            if filename.endswith('.json'):
+                with open(filename, 'w') as f:
+                    json.dump({'nprocs': comm.Get_size(),
+                               'time': toc,
+                               'phases': results}, f, indent=2)
+            else:
+                with open(filename, 'w') as f:
+                    f.write('phase,stat,min,mean,max\n')
+                    for name, val in results.items():
+                        for stat, v in val.items():
+                            f.write('{},{},{},{},{}\n'.format(
+                                name, stat, v['min'], v['mean'], v['max']))
+        return results
+
+
+class TimedCall(object):
+    """Callable timing each call to ``func`` as phase ``name`` of ``timer``
+
+    Attributes not found on the TimedCall are looked up on ``func``, such
+    that a wrapped transform still behaves like the transform.
+    """
+    __slots__ = ('timer', 'name', 'func')
+
+    def __init__(self, timer, name, func):
+        self.timer = timer
+        self.name = name
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        t0 = time()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.timer.add(self.name, time()-t0)
+
+    def __getattr__(self, name):
+        return getattr(self.func, name)
 
 
 def inheritdocstrings(cls):
@@ -0,0 +1,100 @@
+"""
+Module for adapting the time step of spectralDNS to the CFL condition
+
+The velocity is taken from the dealiased physical buffer that the convection
+has already computed in the last stage of the time step, see the solvers'
+``cfl_velocity``. The largest velocity component in each direction is found
+locally and reduced over processors in one single Allreduce.
+
+Solvers that factorize operators depending on the time step, like the KMM
+channel solvers, should only see a few distinct time steps. The new time
+step may therefore be quantized, and the factorizations of recent time
+steps are then cached by the solver, see spectralinit.set_dt.
+"""
+import numpy as np
+from mpi4py import MPI
+from spectralDNS import config
+
+__all__ = ['CFLController']
+
+class CFLController(object):
+    """Time step controller based on the CFL condition
+
+    The Courant number of the last time step is computed as::
+
+        C = dt sum_i max|u_i|/dx_i
+
+    where dx_i is the mesh size, by default L_i/N_i. For nonuniform meshes
+    dx_i is an array, and max|u_i|/dx_i is then taken pointwise. The time
+    step is only modified if C falls outside the band
+    cfl*(1-hysteresis) <= C <= cfl*(1+hysteresis), and is then set such
+    that C = cfl. The time step is reduced immediately, but is never
+    increased by more than the factor growth in one step. With
+    quantization q > 0 the new time step is rounded down to the closest
+    dt0*(1+q)**n, n integer, where dt0 is the time step when the controller
+    is created.
+
+    args:
+        context      The solver's context
+        cfl          Target Courant number
+        hysteresis   Relative width of band where dt is not modified
+        dt_max       Largest allowed time step (None for no limit)
+        growth       Largest allowed increase of dt in one step
+        dx           Mesh size in each direction, scalars or arrays that
+                     broadcast against the velocity components (None for
+                     L/N)
+        quantization Relative spacing q of allowed time steps (0 for any)
+
+    Note that the multistep integrator AB2 assumes a constant time step, and
+    is only first order accurate at steps where dt is modified.
+    """
+    def __init__(self, context, cfl, hysteresis=0.2, dt_max=None, growth=1.2,
+                 dx=None, quantization=0):
+        params = config.params
+        assert cfl > 0 and 0 <= hysteresis < 1 and quantization >= 0
+        self.comm = MPI.COMM_WORLD
+        if dx is None:
+            dx = np.array(params.L, dtype=float)/np.array(params.N)
+        self.dx = dx
+        self.cfl = cfl
+        self.hysteresis = hysteresis
+        self.dt_max = dt_max
+        self.growth = growth
+        self.quantization = quantization
+        self.dt0 = params.dt
+        self.C = 0
+
+    def courant(self, velocity, dt):
+        """Return Courant number of time step dt
+
+        velocity is an array of physical velocity components. It may hold
+        several vector fields, e.g., velocity and magnetic field of MHD,
+        in which case the maxima of all fields are added.
+        """
+        umax = np.zeros(len(velocity))
+        for k, u in enumerate(velocity):
+            dx = self.dx[k % len(self.dx)]
+            if np.ndim(dx) == 0:
+                umax[k] = max(u.max(initial=0), -u.min(initial=0))/dx
+            else:
+                # Largest velocity along the axes where dx is constant
+                axes = tuple(i for i, n in enumerate(np.shape(dx)) if n == 1)
+                um = np.maximum(u.max(axis=axes, keepdims=True, initial=0),
+                                -u.min(axis=axes, keepdims=True, initial=0))
+                umax[k] = (um/dx).max(initial=0)
+        self.comm.Allreduce(MPI.IN_PLACE, umax, op=MPI.MAX)
+        return dt*np.sum(umax)
+
+    def __call__(self, velocity, dt):
+        """Return new time step, given velocity of the last step of size dt"""
+        self.C = C = self.courant(velocity, dt)
+        if self.cfl*(1-self.hysteresis) <= C <= self.cfl*(1+self.hysteresis):
+            return dt
+        factor = self.growth if C == 0 else min(self.growth, self.cfl/C)
+        dt_new = dt*factor
+        if self.dt_max:
+            dt_new = min(dt_new, self.dt_max)
+        if self.quantization:
+            q = np.log(1+self.quantization)
+            dt_new = self.dt0*np.exp(q*np.floor(np.log(dt_new/self.dt0)/q+1e-8))
+        return dt_new
@@ -0,0 +1,180 @@
+"""
+Module for transforming several components of spectralDNS in one go
+
+A parallel transform of a TensorProductSpace is a sequence of serial
+transforms, each followed by a global redistribution (an MPI Alltoallw).
+Transforming m components one by one thus requires m Alltoallw calls per
+redistribution. The BatchedTransform redistributes all m components in one
+Alltoallw, using datatypes for the stacked arrays, such that the number of
+global communication rounds does not depend on the number of components.
+The PipelinedTransform instead posts a nonblocking Ialltoallw for each
+component, and computes the serial transform of the next component while
+the redistribution of the previous is in flight.
+"""
+import weakref
+import numpy as np
+from mpi4py_fft.pencil import Transfer
+from spectralDNS import config
+from spectralDNS.utilities import TimedCall
+
+__all__ = ['BatchedTransform', 'PipelinedTransform', 'multi_transform']
+
+class BatchedTransform(object):
+    """Parallel transform of m components of the same space
+
+    args:
+        transform    The transform of a scalar TensorProductSpace, e.g.,
+                     T.forward or T.backward
+        m            Number of components
+
+    The serial transforms are those of transform, applied component by
+    component, and the results are stacked in one of two byte buffers that
+    are shared by all stages. Calling an instance with stacked input and
+    output arrays (or sequences of m arrays) of the same shapes as for
+    transform, computes the transform of all components.
+    """
+    def __init__(self, transform, m):
+        self.m = m
+        self._xfftn = tuple(transform._xfftn)
+        self._transfer = []
+        self._shapes = []
+        size = 0
+        for func in transform._transfer:
+            t = func.__self__
+            forward = func.__name__ == 'forward'
+            stacked = Transfer(t.comm, (m,)+t.shape, t.dtype,
+                               (m,)+t.subshapeA, t.axisA+1,
+                               (m,)+t.subshapeB, t.axisB+1)
+            if forward:
+                self._transfer.append(stacked.forward)
+                self._shapes.append(((m,)+t.subshapeA, (m,)+t.subshapeB, t.dtype))
+            else:
+                self._transfer.append(stacked.backward)
+                self._shapes.append(((m,)+t.subshapeB, (m,)+t.subshapeA, t.dtype))
+            size = max(size, m*t.dtype.itemsize*max(np.prod(t.subshapeA),
+                                                    np.prod(t.subshapeB)))
+        self._buffers = (np.empty(size, dtype=np.uint8),
+                         np.empty(size, dtype=np.uint8))
+
+    def _buffer(self, i, shape, dtype):
+        n = np.prod(shape)*dtype.itemsize
+        return self._buffers[i][:n].view(dtype).reshape(shape)
+
+    def __call__(self, input_array, output_array):
+        m = self.m
+        assert len(input_array) == m and len(output_array) == m
+        src = input_array
+        for xfftn, transfer, (shapeA, shapeB, dtype) in zip(self._xfftn,
+                                                             self._transfer,
+                                                             self._shapes):
+            arrayA = self._buffer(0, shapeA, dtype)
+            arrayB = self._buffer(1, shapeB, dtype)
+            for i in range(m):
+                xfftn(src[i], arrayA[i])
+            transfer(arrayA, arrayB)
+            src = arrayB
+        for i in range(m):
+            self._xfftn[-1](src[i], output_array[i])
+        return output_array
+
+    def destroy(self):
+        for transfer in self._transfer:
+            transfer.__self__.destroy()
+
+
+class PipelinedTransform(object):
+    """Parallel transform of m components, overlapping FFTs and communication
+
+    args:
+        transform    The transform of a scalar TensorProductSpace, e.g.,
+                     T.forward or T.backward
+        m            Number of components
+
+    For each redistribution stage, the serial transform of component i is
+    computed, and its Ialltoallw is posted before moving on to component
+    i+1. The next stage of component i only waits for the redistribution of
+    component i. Whether communication actually progresses in the background
+    depends on the MPI library.
+
+    Since transfers of two consecutive stages may be in flight at the same
+    time, the two stages use separate pairs of byte buffers.
+    """
+    def __init__(self, transform, m):
+        self.m = m
+        self._xfftn = tuple(transform._xfftn)
+        self._stages = []
+        size = 0
+        for func in transform._transfer:
+            t = func.__self__
+            if func.__name__ == 'forward':
+                self._stages.append((t, t.subshapeA, t._subtypesA,
+                                     t.subshapeB, t._subtypesB))
+            else:
+                self._stages.append((t, t.subshapeB, t._subtypesB,
+                                     t.subshapeA, t._subtypesA))
+            size = max(size, m*t.dtype.itemsize*max(np.prod(t.subshapeA),
+                                                    np.prod(t.subshapeB)))
+        nbuffers = 4 if len(self._stages) > 1 else 2
+        self._buffers = tuple(np.empty(size, dtype=np.uint8)
+                              for i in range(nbuffers))
+
+    def _buffer(self, i, shape, dtype):
+        n = np.prod(shape)*dtype.itemsize
+        return self._buffers[i][:n].view(dtype).reshape(shape)
+
+    def __call__(self, input_array, output_array):
+        m = self.m
+        assert len(input_array) == m and len(output_array) == m
+        src = input_array
+        requests = None
+        for s, (xfftn, (t, shapeA, typesA, shapeB, typesB)) in enumerate(
+                zip(self._xfftn, self._stages)):
+            arrayA = self._buffer(2*(s % 2), (m,)+shapeA, t.dtype)
+            arrayB = self._buffer(2*(s % 2)+1, (m,)+shapeB, t.dtype)
+            posted = []
+            for i in range(m):
+                if requests is not None:
+                    requests[i].Wait()
+                xfftn(src[i], arrayA[i])
+                posted.append(t.comm.Ialltoallw(
+                    [arrayA[i], t._counts_displs, typesA],
+                    [arrayB[i], t._counts_displs, typesB]))
+            requests, src = posted, arrayB
+        for i in range(m):
+            if requests is not None:
+                requests[i].Wait()
+            self._xfftn[-1](src[i], output_array[i])
+        return output_array
+
+    def destroy(self):
+        pass
+
+def _destroy(transforms):
+    for T in transforms.values():
+        T.destroy()
+    transforms.clear()
+
+_transforms = weakref.WeakKeyDictionary()
+
+def multi_transform(transform, m):
+    """Return parallel transform of m components of the same space
+
+    The transform is pipelined if config.params.pipeline_transforms is set,
+    and batched otherwise. Transforms are created on the first call and then
+    reused for as long as transform is alive. A transform wrapped by the
+    Timer is keyed on the wrapped transform, which is the same for all
+    solves. When transform is garbage collected, the transforms created
+    for it are destroyed, and their buffers released.
+    """
+    while isinstance(transform, TimedCall):
+        transform = transform.func
+    if transform not in _transforms:
+        _transforms[transform] = transforms = {}
+        weakref.finalize(transform, _destroy, transforms)
+    transforms = _transforms[transform]
+    pipelined = config.params.pipeline_transforms
+    key = (m, pipelined)
+    if key not in transforms:
+        T = PipelinedTransform if pipelined else BatchedTransform
+        transforms[key] = T(transform, m)
+    return transforms[key]
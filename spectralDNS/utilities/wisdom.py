@@ -0,0 +1,136 @@
+"""
+Module for caching FFTW wisdom of spectralDNS on disk
+
+Planning the FFTs with FFTW_MEASURE or FFTW_PATIENT is costly for large
+meshes, and the same plans are recomputed for every restart and every run
+in a parameter sweep. With ``params.wisdom`` set to a directory, the wisdom
+of all processors is stored in a subfolder named by a hash of everything
+that determines the plans (see ``wisdom_key``). Rank 0 reads the wisdom and
+scatters it, such that only one processor touches the filesystem.
+"""
+import os
+import json
+import hashlib
+import tempfile
+from functools import wraps
+from mpi4py import MPI
+from mpi4py_fft.fftw import fftlib
+from spectralDNS import config
+
+__all__ = ['wisdom_key', 'load_wisdom', 'save_wisdom', 'cache_wisdom']
+
+comm = MPI.COMM_WORLD
+
+def wisdom_key(params):
+    """Return hash and description of the FFTs planned for params
+
+    The FFTs depend on the global shape, the precision, the solver (which
+    determines the spaces and transformed axes), the dealiasing, the number
+    of threads, the planner effort and the MPI decomposition and number of
+    processors.
+    """
+    effort = params.planner_effort
+    desc = {'solver': params.solver,
+            'N': [int(n) for n in params.N],
+            'precision': params.precision,
+            'dealias': params.dealias,
+            'threads': params.threads,
+            'planner_effort': {k: effort[k] for k in sorted(set(effort) | {'fft', 'dct'})},
+            'decomposition': params.decomposition,
+            'nprocs': comm.Get_size()}
+    for quad in ('Dquad', 'Bquad', 'Nquad'):
+        if quad in params:
+            desc[quad] = params[quad]
+    key = hashlib.sha1(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+    return key, desc
+
+def _filename(path, prec, rank):
+    return os.path.join(path, '{}{}.wisdom'.format(prec, rank))
+
+def load_wisdom(path):
+    """Import wisdom stored in folder path
+
+    Returns True if wisdom was found for all processors.
+    """
+    data = None
+    if comm.Get_rank() == 0:
+        data = []
+        for rank in range(comm.Get_size()):
+            data.append({})
+            for prec in fftlib:
+                fname = _filename(path, prec, rank)
+                if os.path.isfile(fname):
+                    with open(fname, 'rb') as f:
+                        data[-1][prec] = f.read()
+    data = comm.scatter(data, root=0)
+    found = 1
+    for prec in fftlib:
+        if prec not in data:
+            found = 0
+            continue
+        fd, fname = tempfile.mkstemp(suffix='.wisdom')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data[prec])
+        found *= fftlib[prec].import_wisdom(bytearray(fname, 'utf-8'))
+        os.remove(fname)
+    return comm.allreduce(found, op=MPI.MIN) == 1
+
+def save_wisdom(path, desc=None):
+    """Export wisdom of all processors to folder path
+
+    The wisdom is gathered on rank 0, which stores it together with the
+    description ``desc`` of the key (see ``wisdom_key``).
+    """
+    data = {}
+    for prec, lib in fftlib.items():
+        fd, fname = tempfile.mkstemp(suffix='.wisdom')
+        os.close(fd)
+        if lib.export_wisdom(bytearray(fname, 'utf-8')) == 1:
+            with open(fname, 'rb') as f:
+                data[prec] = f.read()
+        os.remove(fname)
+    data = comm.gather(data, root=0)
+    if comm.Get_rank() == 0:
+        os.makedirs(path, exist_ok=True)
+        for rank, d in enumerate(data):
+            for prec, val in d.items():
+                _write(_filename(path, prec, rank), val)
+        if desc is not None:
+            _write(os.path.join(path, 'key.json'),
+                   json.dumps(desc, indent=2).encode())
+
+def _write(fname, data):
+    # Write to temporary file first, such that concurrent runs never see a
+    # partially written file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, fname)
+
+_active = [False]
+
+def cache_wisdom(get_context):
+    """Decorator for the get_context function of solvers
+
+    If ``config.params.wisdom`` is set, then wisdom is loaded before and
+    stored after get_context plans the FFTs. Wisdom is only stored if some
+    processor did not find it in the cache.
+    """
+    @wraps(get_context)
+    def wrapped_get_context(*args, **kwargs):
+        params = config.params
+        if not params.get('wisdom') or _active[0]:
+            return get_context(*args, **kwargs)
+        key, desc = wisdom_key(params)
+        path = os.path.join(params.wisdom, key)
+        _active[0] = True
+        try:
+            found = load_wisdom(path)
+            context = get_context(*args, **kwargs)
+        finally:
+            _active[0] = False
+        if not found:
+            save_wisdom(path, desc)
+        return context
+
+    return wrapped_get_context
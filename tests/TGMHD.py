@@ -22,8 +22,8 @@ def regression_test(context):
     k = solver.comm.reduce(sum(U.astype(float64)*U.astype(float64))*dx[0]*dx[1]*dx[2]/L[0]/L[1]/L[2]/2) # Compute energy with double precision
     b = solver.comm.reduce(sum(B.astype(float64)*B.astype(float64))*dx[0]*dx[1]*dx[2]/L[0]/L[1]/L[2]/2)
     if solver.rank == 0:
-        assert round(float(k) - 0.124565408177, 7) == 0
-        assert round(float(b) - 0.124637762143, 7) == 0
+        assert round(float(k) - 0.124565408177, params.ntol) == 0
+        assert round(float(b) - 0.124637762143, params.ntol) == 0
 
 if __name__ == '__main__':
     config.update(
@@ -1,5 +1,6 @@
 import pytest
 import importlib
+import numpy as np
 from mpi4py import MPI
 from spectralDNS import config, get_solver, solve
 from TGMHD import initialize, regression_test, pi
@@ -58,6 +59,11 @@ def test_MHD(sol):
     initialize(**context)
     solve(solver, context)
 
+    config.params.batch_transforms = True
+    initialize(**context)
+    solve(solver, context)
+    config.params.batch_transforms = False
+
     config.params.write_result = 1
     config.params.checkpoint = 1
     config.dt = 0.01
@@ -66,3 +72,29 @@ def test_MHD(sol):
     config.T = 0.04
     solver.regression_test = lambda c: None
     solve(solver, context)
+
+def test_mixed_precision(sol):
+    config.update(
+        {
+            'nu': 0.000625,             # Viscosity
+            'dt': 0.01,                 # Time step
+            'T': 0.1,                   # End time
+            'eta': 0.01,
+            'convection': 'Divergence'
+        }
+    )
+
+    solver = get_solver(regression_test=regression_test,
+                        parse_args=['--precision', 'mixed']+sol)
+    context = solver.get_context()
+    assert context.ub_dealias.dtype == np.float32
+    assert context.ZZ.dtype == np.float32
+    assert context.u.dtype == np.complex128
+    config.params.ntol = 5
+    for optimization in ('', 'cython'):
+        config.params.optimization = optimization
+        importlib.reload(solver)
+        initialize(**context)
+        solve(solver, context)
+    config.params.ntol = 7
+    config.params.precision = 'double'
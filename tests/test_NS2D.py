@@ -1,6 +1,9 @@
 import pytest
 import importlib
+import numpy as np
+from shenfun.fourier import energy_fourier
 from spectralDNS import config, get_solver, solve
+from spectralDNS.diagnostics import spectral_bins
 from TG2D import initialize, regression_test
 
 @pytest.fixture(params=('1', '2'))
@@ -37,6 +40,15 @@ def test_NS2D(args):
     initialize(solver, **context)
     solve(solver, context)
 
+    config.params.batch_transforms = True
+    initialize(solver, **context)
+    solve(solver, context)
+    config.params.batch_transforms = False
+
+    sb = spectral_bins(context)
+    Ek = sb.spectrum(context.U_hat)
+    assert abs(Ek.sum() - 0.5*energy_fourier(context.U_hat, context.T)) < 1e-12
+
     config.params.write_result = 1
     config.params.checkpoint = 1
     config.params.dt = 0.01
@@ -46,3 +58,74 @@ def test_NS2D(args):
     solver.regression_test = lambda c: None
     initialize(solver, **context)
     solve(solver, context)
+
+def test_cfl(args):
+    config.update(
+        {
+            'nu': 0.01,
+            'dt': 0.01,
+            'T': 0.5
+        }, 'doublyperiodic')
+    solver = get_solver(regression_test=regression_test,
+                        mesh='doublyperiodic',
+                        parse_args=['--cfl', '0.5', '--dt_max', '0.03']+args)
+    context = solver.get_context()
+    dts = []
+    update = solver.update
+    solver.update = lambda context: dts.append(config.params.dt)
+    initialize(solver, **context)
+    solve(solver, context)
+    solver.update = update
+    assert len(set(dts)) > 1
+    assert max(dts) <= 0.03
+    assert abs(config.params.t - config.params.T) < 1e-12
+
+def test_wisdom(args, tmp_path):
+    from spectralDNS.utilities.wisdom import wisdom_key, load_wisdom
+    solver = get_solver(regression_test=regression_test,
+                        mesh='doublyperiodic',
+                        parse_args=['--wisdom', str(tmp_path)]+args)
+    context = solver.get_context()
+    key = wisdom_key(config.params)[0]
+    assert (tmp_path / key / 'key.json').exists()
+    assert load_wisdom(str(tmp_path / key))
+    context = solver.get_context()
+    effort = config.params.planner_effort
+    config.params.planner_effort = dict(effort, fft='FFTW_PATIENT')
+    assert wisdom_key(config.params)[0] != key
+    config.params.planner_effort = effort
+    config.params.wisdom = ''
+
+def test_autotune(args, tmp_path):
+    from spectralDNS.optimization import autotune
+    config.update({'nu': 0.01, 'dt': 0.05, 'T': 0.2}, 'doublyperiodic')
+    solver = get_solver(regression_test=lambda c: None,
+                        mesh='doublyperiodic',
+                        parse_args=['--optimization', 'autotune',
+                                    '--autotune_cache', str(tmp_path)]+args)
+    from spectralDNS.solvers import NS
+    importlib.reload(NS)  # NS2D uses add_pressure_diffusion of NS
+    importlib.reload(solver)
+    context = solver.get_context()
+    initialize(solver, **context)
+    solve(solver, context)
+    assert (tmp_path / 'autotune0.json').exists()
+    assert 'NS.add_pressure_diffusion' in autotune.report()
+    config.params.optimization = ''
+    config.params.autotune_cache = ''
+    importlib.reload(NS)
+    importlib.reload(solver)
+
+def test_autotune_reference(args):
+    from spectralDNS.optimization.autotune import Autotuned
+    get_solver(mesh='doublyperiodic', parse_args=args)
+    def fails(a):
+        raise ValueError
+    def passes(a):
+        a *= 2
+        return a
+    tuned = Autotuned(fails)
+    # Nothing validates when the numpy reference fails
+    times = tuned.benchmark({'numpy': fails, 'numba': passes}, (np.ones(4),), {})
+    assert times == {'numpy': None, 'numba': None}
+    assert tuned._tune(((4,), '<f8'), (np.ones(4),), {}) is fails
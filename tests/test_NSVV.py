@@ -1,5 +1,7 @@
 import pytest
 import importlib
+import json
+import numpy as np
 from mpi4py import MPI
 from spectralDNS import config, get_solver, solve
 from TG import initialize, regression_test
@@ -33,7 +35,7 @@ def sol(request):
     return _args
 
 
-def test_solvers(sol):
+def test_solvers(sol, tmp_path):
     config.update(
         {
             'nu': 0.000625,             # Viscosity
@@ -50,16 +52,46 @@ def test_solvers(sol):
     solve(solver, context)
 
     config.params.make_profile = 1
+    config.params.timings = str(tmp_path / 'timings.json')
     config.params.dealias = '3/2-rule'
     initialize(solver, context)
     solve(solver, context)
+    if comm.Get_rank() == 0:
+        with open(config.params.timings) as f:
+            timings = json.load(f)
+        assert timings['nprocs'] == comm.Get_size()
+        phases = timings['phases']
+        for name in ('step', 'convection', 'forward', 'backward', 'update', 'io'):
+            assert set(phases[name]) == set(solver.timer.stats)
+            for val in phases[name].values():
+                assert set(val) == {'min', 'mean', 'max'}
+        assert phases['step']['count']['max'] == 10
+    config.params.timings = ''
 
     config.params.dealias = '2/3-rule'
-    for opt in ('cython', 'numba', 'pythran'):
+    config.params.threads = 2  # Threaded optimized kernels
+    for opt in ('cython', 'numba', 'pythran', 'autotune'):
         config.params.optimization = opt
         importlib.reload(solver)  # To load optimized methods
         initialize(solver, context)
         solve(solver, context)
+    config.params.threads = 1
+
+    if config.params.solver == 'NS':
+        for convection in ('Standard', 'Divergence', 'Skewed'):
+            config.params.convection = convection
+            initialize(solver, context)
+            solve(solver, context)
+        config.params.convection = 'Vortex'
+
+    config.params.batch_transforms = True
+    initialize(solver, context)
+    solve(solver, context)
+    config.params.pipeline_transforms = True
+    initialize(solver, context)
+    solve(solver, context)
+    config.params.batch_transforms = False
+    config.params.pipeline_transforms = False
 
     config.params.write_result = 2
     config.params.checkpoint = 2
@@ -70,6 +102,73 @@ def test_solvers(sol):
     solver.regression_test = lambda c: None
     solve(solver, context)
 
+    config.params.async_io = True
+    config.params.diagnostics = {'energy': 1, 'enstrophy': 2, 'skewness': 2,
+                                 'Re_lambda': 2, 'divergence': 1}
+    config.params.t = 0.0
+    config.params.tstep = 0
+    solve(solver, context)
+    config.params.async_io = False
+    config.params.diagnostics = {}
+
+    # The queued snapshots of the last write step must be on file
+    hdf5file = context.hdf5file
+    for name, fields in hdf5file.checkpoint['data']['0'].items():
+        u_hat = np.zeros_like(fields[0])
+        hdf5file.cfile.read(u_hat, name, step=0)
+        assert np.allclose(u_hat, fields[0])
+    for name, fields in hdf5file.results['data'].items():
+        U = fields[0]
+        names, comps = ([name+str(k) for k in range(U.shape[0])], U) if U.rank == 1 else ([name], [U])
+        for name_k, u_k in zip(names, comps):
+            u = np.zeros_like(u_k)
+            hdf5file.wfile.read(u, name_k, step=4)
+            assert np.allclose(u, u_k)
+    tstep, t, d = solver.diagnostics.history[-1]
+    assert tstep == 4 and len(d) == 5
+    assert abs(d['divergence']) < 1e-8
+
+def test_phase_shift(sol):
+    config.update(
+        {
+            'nu': 0.000625,             # Viscosity
+            'dt': 0.01,                 # Time step
+            'T': 0.1,                    # End time
+            'convection': 'Vortex'
+        }
+    )
+
+    # Checked against the regression values of the 3/2-rule
+    solver = get_solver(regression_test=regression_test,
+                        parse_args=['--dealias', 'phase-shift']+sol)
+    context = solver.get_context()
+    config.params.ntol = 5
+    initialize(solver, context)
+    solve(solver, context)
+    config.params.ntol = 7
+    config.params.dealias = '2/3-rule'
+
+def test_mixed_precision(sol):
+    config.update(
+        {
+            'nu': 0.000625,             # Viscosity
+            'dt': 0.01,                 # Time step
+            'T': 0.1,                    # End time
+            'convection': 'Vortex'
+        }
+    )
+
+    solver = get_solver(regression_test=regression_test,
+                        parse_args=['--precision', 'mixed']+sol)
+    context = solver.get_context()
+    assert context.u_dealias.dtype == np.float32
+    assert context.u.dtype == np.complex128
+    config.params.ntol = 5
+    initialize(solver, context)
+    solve(solver, context)
+    config.params.ntol = 7
+    config.params.precision = 'double'
+
 def test_integrators(sol):
     config.update(
         {
@@ -82,9 +181,13 @@ def test_integrators(sol):
 
     solver = get_solver(regression_test=regression_test, parse_args=sol)
     context = solver.get_context()
-    for integrator in ('RK4', 'ForwardEuler', 'AB2', 'BS5_adaptive', 'BS5_fixed'):
+    for integrator in ('RK4', 'ForwardEuler', 'AB2', 'BS5_adaptive', 'BS5_fixed',
+                       'RK3_2N', 'RK4_2N', 'RK4_2N_adaptive', 'IFRK4', 'ETDRK4',
+                       'DP5_adaptive', 'Tsit5_adaptive', 'BS3_adaptive'):
         if integrator in ('ForwardEuler', 'AB2'):
             config.params.ntol = 4
+        elif integrator in ('RK3_2N', 'RK4_2N_adaptive', 'BS3_adaptive'):
+            config.params.ntol = 5
         else:
             config.params.ntol = 7
         config.params.integrator = integrator
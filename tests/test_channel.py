@@ -1,6 +1,10 @@
 import pytest
 import importlib
+import numpy as np
+from shenfun import Array, Function, TestFunction, TrialFunction, inner, div, grad, Dx
+from shenfun.chebyshev import la
 from spectralDNS import config, get_solver, solve
+from spectralDNS.channelstats import ChannelStats
 from OrrSommerfeld import initialize, regression_test, set_Source, pi
 
 @pytest.fixture(params=('KMMRK3', 'KMM'))
@@ -35,11 +39,163 @@ def test_channel(sol):
     initialize(solver, context)
     solve(solver, context)
 
+    config.params.pipeline_transforms = True
+    initialize(solver, context)
+    solve(solver, context)
+    config.params.pipeline_transforms = False
+
     config.params.dealias_cheb = True
     config.params.checkpoint = 5
     config.params.write_result = 2
     initialize(solver, context)
     solve(solver, context)
 
+    # Statistics sampled in spectral space versus physical space averages
+    stats = ChannelStats(context)
+    stats(context)
+    mean, stress = stats.get_stats()
+    U = context.U_hat.backward(context.U)
+    s = context.FST.local_slice(False)[0]
+    Um = U.mean(axis=(2, 3))
+    assert np.allclose(mean['U'][s], Um[0]) and np.allclose(mean['V'][s], Um[1])
+    uv = np.mean((U[0]-Um[0][:, None, None])*(U[1]-Um[1][:, None, None]), axis=(1, 2))
+    assert np.allclose(stress['UV'][s], uv)
+
+def test_cfl(sol, monkeypatch):
+    config.update(
+        {
+            'Re': 8000.,
+            'nu': 1./8000.,              # Viscosity
+            'dt': 0.001,                 # Time step
+            'T': 0.01,                   # End time
+            'L': [2, 2*pi, 4*pi/3.],
+            'M': [7, 5, 2],
+            'eps': 1e-7
+        }, "channel"
+    )
+
+    solver = get_solver(regression_test=lambda c: None,
+                        mesh="channel",
+                        parse_args=['--cfl', '0.5', sol])
+    # Count the time steps that the dt dependent operators are built for
+    calls = []
+    dt_operators = solver.dt_operators
+    def counted_dt_operators(context, dt):
+        calls.append(dt)
+        return dt_operators(context, dt)
+    monkeypatch.setattr(solver, 'dt_operators', counted_dt_operators)
+
+    context = solver.get_context()
+    assert calls == [config.params.dt]
+    initialize(solver, context)
+    set_Source(**context)
+    solve(solver, context)
+    assert abs(config.params.t - config.params.T) < 1e-12
+
+    # Cached operators are reused while dt is unchanged
+    dt, H = context.dt, context.la.HelmholtzSolverG
+    n = len(calls)
+    solver.set_dt(context, dt, solver.dt_operators)
+    assert len(calls) == n and context.la.HelmholtzSolverG is H
+
+    # and rebuilt when dt changes
+    dt_new = dt/3
+    assert dt_new not in context.dt_cache
+    solver.set_dt(context, dt_new, solver.dt_operators)
+    assert calls[n:] == [dt_new] and context.dt == dt_new
+    assert context.la.HelmholtzSolverG is not H
+    solver.set_dt(context, dt, solver.dt_operators)
+    assert len(calls) == n+1 and context.la.HelmholtzSolverG is H
+
+def reference_pressure(solver, context):
+    """Return pressure of the last time step by the weak form of KMM"""
+    c = context
+    params = config.params
+    v = TestFunction(c.FCT)
+    p = TrialFunction(c.FCT)
+    Um = Function(c.FSB)
+    Um[:] = 0.5*(c.U_hat[0] + c.U_hat0[0])
+    dU = Function(c.FSB)
+    dU[:] = (c.U_hat[0] - c.U_hat0[0])/c.dt
+    H = Function(c.FST)
+    H[:] = solver.get_convection(**c)[0]
+    rhs_hat = inner(params.nu*div(grad(Um)), v)
+    rhs_hat += inner(H, v)
+    rhs_hat -= inner(dU, v)
+
+    # Integral constraint replaces the equation of the highest mode
+    CT = inner(Dx(p, 0, 1), v)
+    A = CT.mats[0]
+    N = A.shape[0]
+    A[-(N-1)] = 1
+    p_hat = CT.solve(rhs_hat, Function(c.FCT))
+    p = c.FCT.backward(p_hat, Array(c.FCT))
+    if params.convection == 'Vortex':
+        um_hat = Function(c.VFS)
+        um_hat[:] = 0.5*(c.U_hat + c.U_hat0)
+        p -= 0.5*np.sum(um_hat.backward()**2, axis=0)
+    return p
+
+@pytest.mark.parametrize('convection', ('Vortex', 'Standard'))
+def test_pressure(convection):
+    config.update(
+        {
+            'nu': 1./8000.,
+            'dt': 0.001,
+            'L': [2, 2*pi, 4*pi/3.],
+            'M': [5, 4, 3]
+        }, "channel"
+    )
+    solver = get_solver(mesh="channel",
+                        parse_args=['--convection', convection, 'KMM'])
+    c = solver.get_context()
+
+    # Random divergence free velocities from random u and g, as in solve_linear
+    for u_hat, g_hat in ((c.U_hat, c.g), (c.U_hat0, Function(c.FST))):
+        u_hat[0] = Array(c.FSB, buffer=np.random.random(c.U[0].shape)).forward(u_hat[0])
+        g_hat = Array(c.FST, buffer=np.random.random(c.U[0].shape)).forward(g_hat)
+        f_hat = c.mat.CDB.matvec(u_hat[0], Function(c.FST))
+        f_hat = c.la.TDMASolverD(f_hat)
+        u_hat = solver.compute_vw(u_hat, f_hat, g_hat, c.K_over_K2)
+    U_hat = c.U_hat.copy()
+    div_u = solver.get_divergence(**c)
+    assert np.linalg.norm(div_u) < 1e-8*np.linalg.norm(c.U_hat.backward())
+
+    p = solver.get_pressure(c, solver)
+    assert np.allclose(c.U_hat, U_hat)
+    assert np.allclose(p, reference_pressure(solver, c))
+
+@pytest.mark.parametrize('optimization', ('cython', 'numba'))
+def test_batched_solvers(optimization):
+    from spectralDNS.optimization import get_backend
+    try:
+        get_backend(optimization, 'double')
+    except ImportError:
+        pytest.skip('{} backend not available'.format(optimization))
+    config.update(
+        {
+            'nu': 1./8000.,
+            'dt': 0.001,
+            'L': [2, 2*pi, 4*pi/3.],
+            'M': [7, 5, 2]
+        }, "channel"
+    )
+    # The solvers pick their kernel when created, so the context is
+    # created after the optimization is selected
+    solver = get_solver(mesh="channel",
+                        parse_args=['--optimization', optimization, 'KMM'])
+    context = solver.get_context()
+    H = context.la.HelmholtzSolverG
+    B = context.la.BiharmonicSolverU
+    assert H._solve is not None and B._solve is not None
+
+    rhs = np.random.random(context.dU.shape)+1j*np.random.random(context.dU.shape)
+    for S, solve_shenfun, space, b in ((H, la.Helmholtz.__call__, context.FST, rhs[1]),
+                                       (B, la.Biharmonic.__call__, context.FSB, rhs[0])):
+        u0 = solve_shenfun(S, b.copy(), Function(space))
+        u1 = S(b.copy(), Function(space))
+        assert np.allclose(u0, u1)
+    config.params.optimization = ''
+
 if __name__ == '__main__':
     test_channel('KMM')